@@ -0,0 +1,320 @@
+"""
+Envíos masivos: mensajes que el bot manda sin que el usuario escriba.
+
+Tipos (KINDS):
+  - monthly_summary: el resumen del mes anterior, el día 1 desde las 10.
+  - pending_reminder: cuántos gastos siguen sin categoría, a las 20.
+
+Recorrer todos los usuarios en un job llevaría horas y pasaría el
+job_timeout. En cambio, un cron del worker (tick) trabaja en tajadas:
+
+  1. Crea la pasada del período si venció (BroadcastRun, una por key).
+  2. Toma las pasadas en curso y procesa páginas de usuarios hasta
+     agotar el presupuesto de tiempo del tick.
+
+Cada página:
+  - Keyset sobre User.id (notifications_enabled=True, id > cursor): el
+    costo no crece con el avance, a diferencia de OFFSET.
+  - El contenido de toda la página sale de una o dos consultas agregadas
+    (user_id__in), no de una por usuario.
+  - Los mensajes se escriben en el outbox con event_key
+    "broadcast:<key>:<user_id>" y se entregan concurrentes; el throttle
+    del sender pone el ritmo (~30/s, 1/s por chat).
+  - Se guarda el cursor. Si el worker muere a mitad de página, el tick
+    siguiente la repite: las filas ya escritas no se duplican (event_key
+    único) y las ya enviadas no se reenvían.
+
+El progreso queda en la fila de BroadcastRun (manage.py broadcast status)
+y en las métricas bot_broadcast_*.
+"""
+import logging
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Callable
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Count, F, Sum
+from django.utils import timezone
+
+from services import outbox
+from services.constants import SPANISH_MONTHS, USER_TZ
+from services.infrastructure import metrics
+
+from apps.bot.utils import format_stats_message
+
+logger = logging.getLogger(__name__)
+
+# Por debajo del job_timeout del worker (60s), con margen para la última página.
+TICK_BUDGET = 40.0
+
+BROADCAST_MESSAGES = metrics.counter(
+    "bot_broadcast_messages_total",
+    "Destinatarios procesados por los envíos masivos",
+    labelnames=("kind", "outcome"),
+)
+BROADCAST_PROGRESS = metrics.gauge(
+    "bot_broadcast_progress_ratio",
+    "Fracción de destinatarios procesados de la pasada en curso",
+    labelnames=("kind",),
+)
+
+
+@dataclass(frozen=True)
+class Kind:
+    name: str
+    # Período vencido a esta hora local ("2026-09"), o None si no toca.
+    period: Callable[[datetime], str | None]
+    # Para una página de user_ids: user_id → texto. Sin entrada = no se le manda.
+    payloads: Callable[[str, list[int]], dict[int, str]]
+
+
+# ==================================================================
+#                         TIPOS DE ENVÍO
+# ==================================================================
+
+def _previous_month(now: datetime) -> tuple[datetime, datetime]:
+    """Bordes [inicio, fin) del mes anterior, en la zona del usuario."""
+    fin = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    inicio = (fin - timedelta(days=1)).replace(day=1)
+    return inicio, fin
+
+
+def _monthly_period(now: datetime) -> str | None:
+    # Los tres primeros días: si el worker estuvo caído el 1, sale igual;
+    # un deploy a mitad de mes no manda el resumen de un mes viejo.
+    if now.day > 3 or (now.day == 1 and now.hour < 10):
+        return None
+    inicio, _ = _previous_month(now)
+    return f"{inicio.year}-{inicio.month:02d}"
+
+
+def _monthly_payloads(period: str, user_ids: list[int]) -> dict[int, str]:
+    from apps.core.models import Expense
+
+    year, month = map(int, period.split("-"))
+    inicio = datetime(year, month, 1, tzinfo=USER_TZ)
+    fin = datetime(year + month // 12, month % 12 + 1, 1, tzinfo=USER_TZ)
+
+    filas = (
+        Expense.objects.filter(
+            user_id__in=user_ids,
+            status=Expense.STATUS_CONFIRMED,
+            date__gte=inicio,
+            date__lt=fin,
+        )
+        .values("user_id", "category__name", "category__color")
+        .annotate(total=Sum("amount"), count=Count("id"))
+        .order_by("user_id", "-total")
+    )
+
+    por_usuario: dict[int, list[dict]] = {}
+    for fila in filas:
+        por_usuario.setdefault(fila.pop("user_id"), []).append(fila)
+
+    # Mismo formato que /stats. Sin gastos en el mes, no hay resumen.
+    month_name = f"{SPANISH_MONTHS[month]} {year}"
+    return {
+        user_id: format_stats_message(
+            month_name=month_name,
+            total_amount=sum(c["total"] for c in categorias),
+            total_count=sum(c["count"] for c in categorias),
+            by_category=categorias,
+        )
+        for user_id, categorias in por_usuario.items()
+    }
+
+
+def _pending_period(now: datetime) -> str | None:
+    return now.date().isoformat() if now.hour >= 20 else None
+
+
+def _pending_payloads(period: str, user_ids: list[int]) -> dict[int, str]:
+    from apps.core.models import Expense
+
+    filas = (
+        Expense.objects.filter(user_id__in=user_ids, status=Expense.STATUS_PENDING)
+        .values("user_id")
+        .annotate(n=Count("id"))
+    )
+    return {
+        fila["user_id"]: (
+            f"⏳ Tenés {fila['n']} gasto{'s' if fila['n'] != 1 else ''} sin categoría.\n"
+            "Elegí la categoría con los botones del mensaje de cada uno para que "
+            "cuenten en tus estadísticas."
+        )
+        for fila in filas
+    }
+
+
+KINDS = {
+    kind.name: kind
+    for kind in (
+        Kind("monthly_summary", _monthly_period, _monthly_payloads),
+        Kind("pending_reminder", _pending_period, _pending_payloads),
+    )
+}
+
+
+# ==================================================================
+#                           PASADAS
+# ==================================================================
+
+async def tick(*, budget: float = TICK_BUDGET, now: datetime | None = None) -> None:
+    """Cron del worker: crea lo que venció y avanza lo que está en curso."""
+    from apps.core.models import BroadcastRun
+
+    local_now = (now or timezone.now()).astimezone(USER_TZ)
+    for name in settings.BROADCASTS:
+        period = KINDS[name].period(local_now)
+        if period:
+            await start(name, period)
+
+    deadline = time.monotonic() + budget
+    en_curso = BroadcastRun.objects.filter(status=BroadcastRun.STATUS_RUNNING).order_by("id")
+    for run in [run async for run in en_curso]:
+        while time.monotonic() < deadline:
+            if await process_page(run):
+                break
+        else:
+            return      # sin presupuesto: sigue el próximo tick
+
+
+async def start(name: str, period: str):
+    """Crea la pasada del período si no existe. Idempotente."""
+    from apps.core.models import BroadcastRun, User
+
+    if name not in KINDS:
+        raise ValueError(f"Tipo de envío desconocido: {name!r}")
+
+    key = f"{name}:{period}"
+    run = await BroadcastRun.objects.filter(key=key).afirst()
+    if run is not None:
+        return run
+
+    total = await User.objects.filter(notifications_enabled=True).acount()
+    run, created = await BroadcastRun.objects.aget_or_create(
+        key=key, defaults={"kind": name, "total": total}
+    )
+    if created:
+        logger.info("Envío masivo iniciado", extra={"key": key, "total": total})
+    return run
+
+
+async def process_page(run, *, size: int | None = None) -> bool:
+    """
+    Una página de destinatarios: contenido, outbox, entrega y checkpoint.
+    Devuelve True cuando la pasada terminó.
+    """
+    size = size or settings.BROADCAST_BATCH_SIZE
+    kind = KINDS[run.kind]
+    period = run.key.split(":", 1)[1]
+
+    pendientes, ultimo, procesados, salteados = await _prepare_page(run, kind, period, size)
+    if not procesados:
+        await _finish(run)
+        return True
+
+    enviados = await outbox.deliver_many(pendientes, path="broadcast")
+    fallidos = len(pendientes) - enviados
+
+    await _checkpoint(run, ultimo, procesados, enviados, salteados, fallidos)
+    BROADCAST_MESSAGES.inc(enviados, kind=run.kind, outcome="sent")
+    BROADCAST_MESSAGES.inc(salteados, kind=run.kind, outcome="skipped")
+    BROADCAST_MESSAGES.inc(fallidos, kind=run.kind, outcome="failed")
+    BROADCAST_PROGRESS.set(run.processed / run.total if run.total else 1.0, kind=run.kind)
+    logger.info(
+        "Envío masivo: página procesada",
+        extra={
+            "key": run.key,
+            "cursor": run.cursor,
+            "processed": run.processed,
+            "total": run.total,
+            "sent": enviados,
+            "failed": fallidos,
+        },
+    )
+    return False
+
+
+@sync_to_async
+def _prepare_page(run, kind: Kind, period: str, size: int):
+    from apps.core.models import ChannelIdentity, OutboxMessage, User
+
+    usuarios = list(
+        User.objects.filter(notifications_enabled=True, id__gt=run.cursor)
+        .order_by("id")
+        .values_list("id", "telegram_id")[:size]
+    )
+    if not usuarios:
+        return [], run.cursor, 0, 0
+    ids = [user_id for user_id, _ in usuarios]
+
+    # Destino: la primera identidad de canal; los usuarios previos a
+    # ChannelIdentity solo tienen telegram_id.
+    destinos = {
+        user_id: (ChannelIdentity.CHANNEL_TELEGRAM, str(telegram_id))
+        for user_id, telegram_id in usuarios
+        if telegram_id
+    }
+    for user_id, channel, external_id in (
+        ChannelIdentity.objects.filter(user_id__in=ids)
+        .order_by("-id")
+        .values_list("user_id", "channel", "external_id")
+    ):
+        destinos[user_id] = (channel, external_id)
+
+    textos = kind.payloads(period, ids)
+    filas = [
+        OutboxMessage(
+            event_key=f"broadcast:{run.key}:{user_id}",
+            channel=destinos[user_id][0],
+            conversation_id=destinos[user_id][1],
+            text=texto,
+        )
+        for user_id, texto in textos.items()
+        if user_id in destinos
+    ]
+    OutboxMessage.objects.bulk_create(filas, ignore_conflicts=True)
+
+    pendientes = list(
+        OutboxMessage.objects.filter(
+            event_key__in=[f.event_key for f in filas], sent_at__isnull=True
+        ).order_by("id")
+    )
+    return pendientes, ids[-1], len(ids), len(ids) - len(filas)
+
+
+@sync_to_async
+def _checkpoint(run, cursor: int, procesados: int, enviados: int, salteados: int, fallidos: int):
+    from apps.core.models import BroadcastRun
+
+    BroadcastRun.objects.filter(id=run.id).update(
+        cursor=cursor,
+        processed=F("processed") + procesados,
+        sent=F("sent") + enviados,
+        skipped=F("skipped") + salteados,
+        failed=F("failed") + fallidos,
+    )
+    run.refresh_from_db()
+
+
+async def _finish(run) -> None:
+    from apps.core.models import BroadcastRun
+
+    await BroadcastRun.objects.filter(id=run.id).aupdate(
+        status=BroadcastRun.STATUS_DONE, finished_at=timezone.now()
+    )
+    await run.arefresh_from_db()
+    BROADCAST_PROGRESS.set(1.0, kind=run.kind)
+    logger.info(
+        "Envío masivo terminado",
+        extra={
+            "key": run.key,
+            "processed": run.processed,
+            "sent": run.sent,
+            "skipped": run.skipped,
+            "failed": run.failed,
+        },
+    )
@@ -0,0 +1,235 @@
+"""
+Dead-letter stream: eventos que el pipeline no pudo completar.
+
+Antes la recuperación era leer logs. Ahora cada fallo terminal deja una
+entrada en un Redis Stream con el evento canónico, la clase del error, un
+digest del traceback y el número de intento. `manage.py dlq` la lista,
+la agrupa y la reencola por lotes.
+
+Vive en la db de jobs: es el slot que reservó el ADR de arq_retry, y el
+replay termina en la misma cola.
+
+Qué es terminal depende de la etapa (ver worker.process_message):
+  - pre_dispatch: nada escrito. ARQ reintenta; se registra solo el último intento.
+  - dispatch, mensajes: ARQ reintenta (el outbox evita duplicar el gasto);
+    se registra solo el último intento.
+  - dispatch, callbacks: editan estado sin la marca del evento. No hay
+    reintento; se registra siempre.
+"""
+import hashlib
+import json
+import logging
+import time
+import traceback
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+
+from services.identities import get_user_by_channel
+from services.infrastructure import metrics
+from services.infrastructure.redis_client import get_redis
+from services.parser.expense_parser import ExpenseParser
+
+logger = logging.getLogger(__name__)
+
+DLQ_STREAM = "dlq:events"
+
+# Tope aproximado (MAXLEN ~). Un incidente de miles de mensajes entra
+# holgado; uno de cientos de miles ya no se recupera a mano igual.
+DLQ_MAXLEN = 100_000
+
+STAGE_PRE_DISPATCH = "pre_dispatch"
+STAGE_DISPATCH = "dispatch"
+
+DEAD_LETTERS = metrics.counter(
+    "bot_dead_letters_total",
+    "Eventos enviados al dead-letter stream",
+    labelnames=("channel", "stage", "error"),
+)
+
+
+@dataclass
+class DeadLetter:
+    entry_id: str
+    event: dict
+    error: str
+    message: str
+    digest: str
+    stage: str
+    attempt: int
+    job_id: str
+    failed_at: float
+
+    @property
+    def channel(self) -> str:
+        return self.event.get("channel", "")
+
+    @property
+    def is_callback(self) -> bool:
+        return self.event.get("type") == "callback"
+
+    @classmethod
+    def from_entry(cls, entry_id, fields: dict) -> "DeadLetter":
+        f = {_text(k): _text(v) for k, v in fields.items()}
+        return cls(
+            entry_id=_text(entry_id),
+            event=json.loads(f["event"]),
+            error=f["error"],
+            message=f.get("message", ""),
+            digest=f["digest"],
+            stage=f["stage"],
+            attempt=int(f.get("attempt") or 0),
+            job_id=f.get("job_id", ""),
+            failed_at=float(f["failed_at"]),
+        )
+
+
+def traceback_digest(exc: BaseException) -> str:
+    """
+    Firma estable del fallo: clase + frames (archivo y función, sin línea).
+
+    Dos mensajes que revientan en el mismo lugar comparten digest aunque
+    el texto del error difiera. Es la clave para agrupar un incidente.
+    """
+    frames = traceback.extract_tb(exc.__traceback__)
+    firma = "|".join(f"{Path(f.filename).name}:{f.name}" for f in frames)
+    return hashlib.sha1(f"{type(exc).__qualname__}|{firma}".encode()).hexdigest()[:12]
+
+
+def _fields(event, exc: BaseException, *, stage: str, attempt: int, job_id: str | None) -> dict:
+    if isinstance(event, dict):
+        event = {k: v for k, v in event.items() if k != "raw"}
+    else:
+        event = {"unparsed": repr(event)}
+    return {
+        "event": json.dumps(event, default=repr),
+        "error": f"{type(exc).__module__}.{type(exc).__qualname__}",
+        "message": str(exc)[:500],
+        "digest": traceback_digest(exc),
+        "stage": stage,
+        "attempt": str(attempt),
+        "job_id": job_id or "",
+        "failed_at": str(time.time()),
+    }
+
+
+async def record(
+    event: dict,
+    exc: BaseException,
+    *,
+    stage: str,
+    attempt: int,
+    job_id: str | None,
+) -> str | None:
+    """
+    Agrega el evento al stream. Nunca propaga: registrar el fallo no puede
+    tapar el fallo original. Ni siquiera con el evento que no se pudo
+    leer (PRE_DISPATCH): puede no ser un dict o traer valores que no son
+    JSON.
+    """
+    fields = None
+    try:
+        fields = _fields(event, exc, stage=stage, attempt=attempt, job_id=job_id)
+        jobs = await get_redis("jobs")
+        entry_id = await jobs.xadd(DLQ_STREAM, fields, maxlen=DLQ_MAXLEN, approximate=True)
+    except Exception:
+        logger.error(
+            "No se pudo registrar el evento en el dead-letter stream",
+            extra={"job_id": job_id, "dead_letter": fields},
+            exc_info=True,
+        )
+        return None
+
+    channel = event.get("channel", "") if isinstance(event, dict) else ""
+    DEAD_LETTERS.inc(channel=channel, stage=stage, error=type(exc).__name__)
+    logger.error(
+        "Evento enviado al dead-letter stream",
+        extra={"job_id": job_id, "entry_id": _text(entry_id), "digest": fields["digest"]},
+    )
+    return _text(entry_id)
+
+
+async def iter_entries(*, batch_size: int = 100, start: str = "-"):
+    """Recorre el stream del más viejo al más nuevo, de a `batch_size`."""
+    jobs = await get_redis("jobs")
+    cursor = start
+    while True:
+        page = await jobs.xrange(DLQ_STREAM, min=cursor, max="+", count=batch_size)
+        if not page:
+            return
+        for entry_id, fields in page:
+            yield DeadLetter.from_entry(entry_id, fields)
+        # "(" = exclusivo: arrancar justo después de la última entrada leída.
+        cursor = "(" + _text(page[-1][0])
+
+
+async def delete(*entry_ids: str) -> int:
+    if not entry_ids:
+        return 0
+    jobs = await get_redis("jobs")
+    return await jobs.xdel(DLQ_STREAM, *entry_ids)
+
+
+async def side_effect_landed(letter: DeadLetter) -> bool:
+    """
+    ¿El gasto de este mensaje ya quedó guardado?
+
+    Solo importa en la etapa dispatch: el handler pudo crear el gasto y
+    fallar después (típicamente al responder). Reencolarlo lo duplicaría.
+    Primero se busca la fila del outbox que deja el evento. Las entradas
+    anteriores al outbox no la tienen: ahí se busca un gasto del mismo
+    usuario, con el monto y la descripción que produce el parser, creado
+    después de recibir el evento.
+    """
+    from apps.core.models import Expense, OutboxMessage
+
+    if letter.stage != STAGE_DISPATCH or letter.is_callback:
+        return False
+
+    key = f"{letter.channel}:{letter.event.get('message_id')}"
+    if await OutboxMessage.objects.filter(event_key=key).aexists():
+        return True
+
+    parsed = ExpenseParser().parse(letter.event.get("text") or "")
+    if not parsed["success"]:
+        return False
+
+    user = await get_user_by_channel(letter.channel, letter.event["external_user_id"])
+    if user is None:
+        return False
+
+    received_at = float(letter.event.get("received_at") or letter.event.get("timestamp") or 0)
+    return await Expense.objects.filter(
+        user=user,
+        amount=parsed["amount"],
+        description=parsed["description"],
+        created_at__gte=datetime.fromtimestamp(received_at, tz=timezone.utc),
+    ).aexists()
+
+
+async def replay(letter: DeadLetter) -> bool:
+    """
+    Reencola el evento y borra la entrada. El _job_id deriva de la entrada:
+    dos replays simultáneos de la misma no producen dos jobs. Con el
+    backend de streams, el que gana el XDEL es el único que reencola.
+    """
+    from apps.bot import streams
+
+    if streams.enabled():
+        if not await delete(letter.entry_id):
+            return False
+        await streams.add(letter.event)
+        return True
+
+    jobs = await get_redis("jobs")
+    job = await jobs.enqueue_job(
+        "process_message",
+        letter.event,
+        _job_id=f"dlq:{letter.entry_id}",
+    )
+    await delete(letter.entry_id)
+    return job is not None
+
+
+def _text(value) -> str:
+    return value.decode() if isinstance(value, bytes) else str(value)
@@ -9,6 +9,7 @@ import logging
 
 from services.channels.events import ChannelEvent
 from services.channels.senders import Sender
+from services.infrastructure import metrics
 
 from apps.bot.handlers.callbacks import central_callback_handler
 from apps.bot.handlers.handlers import (
@@ -23,6 +24,12 @@ from apps.bot.routing import split_command
 
 logger = logging.getLogger(__name__)
 
+HANDLER_DURATION = metrics.histogram(
+    "bot_handler_duration_seconds",
+    "Duración del handler que atendió el evento (categorización, DB y envíos)",
+    labelnames=("channel", "event_type", "handler"),
+)
+
 
 COMMAND_ROUTES = {
     "start": start_command,
@@ -41,15 +48,24 @@ async def dispatch(event: ChannelEvent, user, sender: Sender) -> None:
     porque MessageHandler filtra con ~filters.COMMAND y ningún
     CommandHandler matchea. Responder algo sería un cambio visible.
     """
-    if event.is_callback:
-        await central_callback_handler(event, user, sender)
+    handler = _resolve(event, user)
+    if handler is None:
         return
 
+    with HANDLER_DURATION.time(
+        channel=event.channel, event_type=event.type, handler=handler.__name__
+    ):
+        await handler(event, user, sender)
+
+
+def _resolve(event: ChannelEvent, user):
+    if event.is_callback:
+        return central_callback_handler
+
     command, _ = split_command(event.text)
 
     if command is None:
-        await handle_message(event, user, sender)
-        return
+        return handle_message
 
     handler = COMMAND_ROUTES.get(command)
 
@@ -58,6 +74,5 @@ async def dispatch(event: ChannelEvent, user, sender: Sender) -> None:
             "Comando desconocido ignorado",
             extra={"command": command, "channel": event.channel, "user_id": user.id},
         )
-        return
 
-    await handler(event, user, sender)
\ No newline at end of file
+    return handler
\ No newline at end of file
@@ -3,8 +3,14 @@ Manejo de acciones (clicks de botón), agnóstico al canal.
 
 Cada callback recibe el evento con type="callback", donde event.text
 lleva el id de la Option elegida ("del:55", "cat_select:12:3").
+
+El ack y el edit no se esperan uno detrás del otro: el ack sale apenas
+se conoce su texto (antes de tocar la base cuando no depende de ella) y
+viaja mientras se hace el resto. Ver _acking.
 """
+import asyncio
 import logging
+from contextlib import asynccontextmanager
 
 from django.core.exceptions import ObjectDoesNotExist
 
@@ -12,14 +18,13 @@ from services.channels.events import ChannelEvent
 from services.channels.senders import Sender
 from services.expenses import delete_expense, restore_expense
 from services.ml.helper import record_categorization_feedback
-from services.selectors import get_user_categories_or_defaults
 
 from apps.bot.state import set_pending_category_state
 from apps.bot.utils import format_expense_confirmation
 from apps.core.models import Category, Expense
 
 from .helpers import (
-    category_selection_options,
+    category_keyboard,
     delete_options,
     undo_options,
 )
@@ -27,6 +32,29 @@ from .helpers import (
 logger = logging.getLogger(__name__)
 
 
+@asynccontextmanager
+async def _acking(event: ChannelEvent, sender: Sender, text: str = "", *, alert: bool = False):
+    """
+    Lanza el ack y corre el bloque mientras viaja: son dos round-trips
+    independientes a la API y en serie duplicaban la latencia del click.
+
+    Al salir espera el ack. Si falla se loguea y no tapa el resultado del
+    bloque; un error del bloque (el edit) se propaga como antes.
+    """
+    ack = asyncio.create_task(sender.ack(event.ack_ref, text, alert=alert))
+    try:
+        yield
+    finally:
+        try:
+            await ack
+        except Exception:
+            logger.warning(
+                "Fallo el ack del callback",
+                extra={"channel": event.channel, "message_id": event.message_id},
+                exc_info=True,
+            )
+
+
 # ==================================================================
 #                        CATEGORIZACIÓN
 # ==================================================================
@@ -38,38 +66,39 @@ async def on_cat_confirm_click(event: ChannelEvent, user, sender: Sender, payloa
         expense = await Expense.objects.select_related("category", "user").aget(
             id=expense_id, user=user
         )
+    except Expense.DoesNotExist:
+        async with _acking(event, sender, "⚠️ Error", alert=True):
+            await sender.edit(
+                event.conversation_id, event.edit_ref, text="⚠️ No se encontró el gasto."
+            )
+        return
 
+    # El gasto existe: el resultado ya se conoce. El feedback es telemetría
+    # del categorizador y no cambia lo que ve el usuario.
+    async with _acking(event, sender, "✅ Categoría confirmada"):
         await record_categorization_feedback(
             expense=expense,
             suggested_category=expense.category,
             accepted=True,
         )
-
-        await sender.ack(event.ack_ref, "✅ Categoría confirmada")
         await sender.edit(
             event.conversation_id,
             event.edit_ref,
             text=format_expense_confirmation(expense, auto_categorized=False),
         )
 
-    except Expense.DoesNotExist:
-        await sender.ack(event.ack_ref, "⚠️ Error", alert=True)
-        await sender.edit(
-            event.conversation_id, event.edit_ref, text="⚠️ No se encontró el gasto."
-        )
-
 
 async def on_cat_list_click(event: ChannelEvent, user, sender: Sender, payload: str) -> None:
     """Cambia solo los botones y conserva el texto del mensaje."""
     expense_id = int(payload)
-    categories = await get_user_categories_or_defaults(user)
 
-    await sender.ack(event.ack_ref)
-    await sender.edit(
-        event.conversation_id,
-        event.edit_ref,
-        options=category_selection_options(expense_id, categories),
-    )
+    async with _acking(event, sender):
+        keyboard = await category_keyboard(user)
+        await sender.edit(
+            event.conversation_id,
+            event.edit_ref,
+            options=keyboard.render(expense_id),
+        )
 
 
 async def on_cat_select_click(event: ChannelEvent, user, sender: Sender, payload: str) -> None:
@@ -90,6 +119,16 @@ async def on_cat_select_click(event: ChannelEvent, user, sender: Sender, payload
         expense.status = Expense.STATUS_CONFIRMED
         await expense.asave(update_fields=["category", "status", "updated_at"])
 
+    except (Expense.DoesNotExist, Category.DoesNotExist):
+        async with _acking(event, sender, "⚠️ Error", alert=True):
+            await sender.edit(
+                event.conversation_id,
+                event.edit_ref,
+                text="⚠️ No se pudo actualizar la categoría.",
+            )
+        return
+
+    async with _acking(event, sender, "✅ Categoría actualizada"):
         if previous_category != new_category:
             await record_categorization_feedback(
                 expense=expense,
@@ -97,8 +136,6 @@ async def on_cat_select_click(event: ChannelEvent, user, sender: Sender, payload
                 accepted=False,
                 final_category=new_category,
             )
-
-        await sender.ack(event.ack_ref, "✅ Categoría actualizada")
         await sender.edit(
             event.conversation_id,
             event.edit_ref,
@@ -106,35 +143,26 @@ async def on_cat_select_click(event: ChannelEvent, user, sender: Sender, payload
             options=delete_options(expense.id),
         )
 
-    except (Expense.DoesNotExist, Category.DoesNotExist):
-        await sender.ack(event.ack_ref, "⚠️ Error", alert=True)
-        await sender.edit(
-            event.conversation_id,
-            event.edit_ref,
-            text="⚠️ No se pudo actualizar la categoría.",
-        )
-
 
 async def on_cat_new_click(event: ChannelEvent, user, sender: Sender, payload: str) -> None:
     expense_id = int(payload)
 
-    await set_pending_category_state(
-        channel=event.channel,
-        external_user_id=event.external_user_id,
-        expense_id=expense_id,
-    )
-
-    await sender.ack(event.ack_ref)
-    await sender.edit(
-        event.conversation_id,
-        event.edit_ref,
-        text=(
-            "📝 ¿Cómo querés llamar a la nueva categoría?\n\n"
-            "Enviá el nombre en el siguiente mensaje.\n"
-            "Ej: <i>Mascotas</i>, <i>Gimnasio</i>, <i>Regalos</i>"
-        ),
-        parse_mode="HTML",
-    )
+    async with _acking(event, sender):
+        await set_pending_category_state(
+            channel=event.channel,
+            external_user_id=event.external_user_id,
+            expense_id=expense_id,
+        )
+        await sender.edit(
+            event.conversation_id,
+            event.edit_ref,
+            text=(
+                "📝 ¿Cómo querés llamar a la nueva categoría?\n\n"
+                "Enviá el nombre en el siguiente mensaje.\n"
+                "Ej: <i>Mascotas</i>, <i>Gimnasio</i>, <i>Regalos</i>"
+            ),
+            parse_mode="HTML",
+        )
 
 
 # ==================================================================
@@ -147,7 +175,16 @@ async def on_delete_click(event: ChannelEvent, user, sender: Sender, payload: st
     try:
         deleted_object_id = await delete_expense(user=user, expense_id=expense_id)
 
-        await sender.ack(event.ack_ref, "🗑️ Gasto eliminado")
+    except ObjectDoesNotExist:
+        async with _acking(event, sender, "⚠️ Error", alert=True):
+            await sender.edit(
+                event.conversation_id,
+                event.edit_ref,
+                text="⚠️ No se pudo borrar el gasto (quizás ya no existe).",
+            )
+        return
+
+    async with _acking(event, sender, "🗑️ Gasto eliminado"):
         await sender.edit(
             event.conversation_id,
             event.edit_ref,
@@ -155,14 +192,6 @@ async def on_delete_click(event: ChannelEvent, user, sender: Sender, payload: st
             options=undo_options(deleted_object_id),
         )
 
-    except ObjectDoesNotExist:
-        await sender.ack(event.ack_ref, "⚠️ Error", alert=True)
-        await sender.edit(
-            event.conversation_id,
-            event.edit_ref,
-            text="⚠️ No se pudo borrar el gasto (quizás ya no existe).",
-        )
-
 
 async def on_restore_click(event: ChannelEvent, user, sender: Sender, payload: str) -> None:
     deleted_object_id = int(payload)
@@ -170,7 +199,16 @@ async def on_restore_click(event: ChannelEvent, user, sender: Sender, payload: s
     try:
         expense = await restore_expense(user=user, deleted_object_id=deleted_object_id)
 
-        await sender.ack(event.ack_ref, "✅ Gasto restaurado")
+    except ObjectDoesNotExist:
+        async with _acking(event, sender, "⚠️ Error", alert=True):
+            await sender.edit(
+                event.conversation_id,
+                event.edit_ref,
+                text="⚠️ No se pudo restaurar (el registro expiró o ya fue restaurado).",
+            )
+        return
+
+    async with _acking(event, sender, "✅ Gasto restaurado"):
         await sender.edit(
             event.conversation_id,
             event.edit_ref,
@@ -178,14 +216,6 @@ async def on_restore_click(event: ChannelEvent, user, sender: Sender, payload: s
             options=delete_options(expense.id),
         )
 
-    except ObjectDoesNotExist:
-        await sender.ack(event.ack_ref, "⚠️ Error", alert=True)
-        await sender.edit(
-            event.conversation_id,
-            event.edit_ref,
-            text="⚠️ No se pudo restaurar (el registro expiró o ya fue restaurado).",
-        )
-
 
 # ==================================================================
 #                       ROUTER DE ACCIONES
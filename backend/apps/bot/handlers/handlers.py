@@ -7,22 +7,25 @@ ContextTypes, sin import de telegram.
 import logging
 
 from asgiref.sync import sync_to_async
+from django.db import IntegrityError, InterfaceError, OperationalError
 
 from services.channels.events import ChannelEvent
 from services.channels.senders import Sender
-from services.expenses import create_expense
+from services import outbox
+from services.expenses import create_expense_with_reply
 from services.ml.categorizer import create_category_for_user
 from services.ml.helper import get_category_suggestion, record_categorization_feedback
 from services.parser.expense_parser import ExpenseParser
-from services.selectors import (
-    get_expenses,
-    get_month_stats,
-    get_user_categories_or_defaults,
-)
+from services.selectors import get_expenses, get_month_stats
 
 from apps.bot.errors import error_parsing_expenses
 from apps.bot.routing import split_command
-from apps.bot.state import clear_pending_category_state, get_pending_category_state
+from apps.bot.state import (
+    STATE_LOOKUPS,
+    clear_pending_category_state,
+    get_pending_category_state,
+    pending_only_locally,
+)
 from apps.bot.utils import (
     format_expense_confirmation,
     format_expense_list,
@@ -32,13 +35,18 @@ from apps.bot.utils import (
 )
 
 from .helpers import (
-    category_selection_options,
+    category_keyboard,
     correction_options,
     delete_options,
 )
 
 logger = logging.getLogger(__name__)
 
+# La base caída o la conexión cortada un momento. handle_message los deja
+# subir: el worker reintenta, y un reproceso no duplica el gasto (el
+# outbox lo detecta por event_key). El resto se absorbe con un aviso.
+TRANSIENT_ERRORS = (OperationalError, InterfaceError)
+
 
 # ==================================================================
 #                           COMANDOS
@@ -186,8 +194,6 @@ async def handle_new_category_input(
         )
         return
 
-    await clear_pending_category_state(event.channel, event.external_user_id)
-
     try:
         new_category = await sync_to_async(create_category_for_user)(
             user=user, name=category_name
@@ -202,6 +208,11 @@ async def handle_new_category_input(
         expense.status = Expense.STATUS_CONFIRMED
         await expense.asave()
 
+        # Recién ahora: si algo de arriba falla y el worker reintenta, el
+        # reproceso vuelve a encontrar el estado pendiente. Crear la
+        # categoría y confirmar el gasto se pueden repetir sin duplicar.
+        await clear_pending_category_state(event.channel, event.external_user_id)
+
         if previous_category != new_category:
             await record_categorization_feedback(
                 expense=expense,
@@ -217,6 +228,7 @@ async def handle_new_category_input(
         )
 
     except Expense.DoesNotExist:
+        await clear_pending_category_state(event.channel, event.external_user_id)
         await sender.reply(
             event.conversation_id,
             "⚠️ No se encontró el gasto. El estado fue limpiado.",
@@ -233,13 +245,31 @@ async def handle_message(event: ChannelEvent, user, sender: Sender) -> None:
     from apps.core.models import Expense
 
     try:
-        try:
-            pending_expense_id = await get_pending_category_state(
-                event.channel, event.external_user_id
-            )
-        except Exception as e:
-            logger.warning(f"Redis unavailable, skipping state check {e}")
+        # Reproceso del mismo evento (reintento de ARQ, replay de la DLQ):
+        # el gasto ya existe. Como mucho falta entregar la respuesta.
+        previo = await outbox.already_handled(event)
+        if previo is not None:
+            if previo.sent_at is None:
+                await outbox.deliver(previo, sender)
+            return
+
+        if event.state_hint is False and not pending_only_locally(
+            event.channel, event.external_user_id
+        ):
+            # El productor vio que no había estado ni un callback en vuelo
+            # que lo creara: no hace falta preguntarle a Redis. Salvo que
+            # el estado se haya escrito solo en memoria (Redis caído).
+            STATE_LOOKUPS.inc(outcome="skipped")
             pending_expense_id = None
+        else:
+            STATE_LOOKUPS.inc(outcome="read")
+            try:
+                pending_expense_id = await get_pending_category_state(
+                    event.channel, event.external_user_id
+                )
+            except Exception as e:
+                logger.warning(f"Redis unavailable, skipping state check {e}")
+                pending_expense_id = None
 
         if pending_expense_id:
             await handle_new_category_input(event, user, sender, pending_expense_id)
@@ -254,54 +284,70 @@ async def handle_message(event: ChannelEvent, user, sender: Sender) -> None:
 
         suggestion = await get_category_suggestion(user, message_parsed["description"])
 
-        # --- CAMINO 1: alta confianza ---
-        if suggestion.confidence >= 0.8:
-            expense = await create_expense(
-                user=user,
-                amount=message_parsed["amount"],
-                description=message_parsed["description"],
-                category=suggestion.category,
-            )
-            await sender.reply(
-                event.conversation_id,
-                format_expense_confirmation(expense, auto_categorized=True),
-                options=delete_options(expense.id),
-            )
+        # El gasto y su respuesta se escriben juntos (outbox). La respuesta
+        # se renderiza adentro de la transacción: los botones llevan el id.
+        nuevo = dict(
+            amount=message_parsed["amount"],
+            description=message_parsed["description"],
+            event_key=outbox.event_key(event),
+            channel=event.channel,
+            conversation_id=event.conversation_id,
+        )
 
-        # --- CAMINO 2: confianza media ---
-        elif suggestion.confidence >= 0.5:
-            expense = await create_expense(
-                user=user,
-                amount=message_parsed["amount"],
-                description=message_parsed["description"],
-                category=suggestion.category,
-            )
-            await sender.reply(
-                event.conversation_id,
-                format_expense_needs_confirmation(
-                    expense,
-                    suggested_category_name=(
-                        suggestion.category.name if suggestion.category else "Sin categoría"
+        try:
+            # --- CAMINO 1: alta confianza ---
+            if suggestion.confidence >= 0.8:
+                _, reply = await create_expense_with_reply(
+                    user,
+                    category=suggestion.category,
+                    render=lambda e: (
+                        format_expense_confirmation(e, auto_categorized=True),
+                        delete_options(e.id),
                     ),
-                ),
-                options=correction_options(expense.id),
+                    **nuevo,
+                )
+
+            # --- CAMINO 2: confianza media ---
+            elif suggestion.confidence >= 0.5:
+                sugerida = suggestion.category.name if suggestion.category else "Sin categoría"
+                _, reply = await create_expense_with_reply(
+                    user,
+                    category=suggestion.category,
+                    render=lambda e: (
+                        format_expense_needs_confirmation(e, suggested_category_name=sugerida),
+                        correction_options(e.id),
+                    ),
+                    **nuevo,
+                )
+
+            # --- CAMINO 3: confianza baja ---
+            else:
+                keyboard = await category_keyboard(user)
+                _, reply = await create_expense_with_reply(
+                    user,
+                    category=None,
+                    status=Expense.STATUS_PENDING,
+                    render=lambda e: (format_expense_pending(e), keyboard.render(e.id)),
+                    **nuevo,
+                )
+        except IntegrityError:
+            # Otra entrega del mismo evento (Retry con un primer intento
+            # lento, reclamo del stream) pasó already_handled a la vez y
+            # guardó primero: el event_key único rechazó este alta y la
+            # transacción no dejó nada. Ya está procesado.
+            reply = await outbox.already_handled(event)
+            if reply is None:
+                raise
+            logger.info(
+                "Evento procesado por otra entrega",
+                extra={"event_key": reply.event_key, "channel": event.channel},
             )
 
-        # --- CAMINO 3: confianza baja ---
-        else:
-            expense = await create_expense(
-                user=user,
-                amount=message_parsed["amount"],
-                description=message_parsed["description"],
-                category=None,
-                status=Expense.STATUS_PENDING,
-            )
-            categories = await get_user_categories_or_defaults(user)
-            await sender.reply(
-                event.conversation_id,
-                format_expense_pending(expense),
-                options=category_selection_options(expense.id, categories),
-            )
+        # Si falla, la fila queda pendiente y la entrega el relay del worker.
+        await outbox.deliver(reply, sender)
+
+    except TRANSIENT_ERRORS:
+        raise
 
     except Exception:
         logger.error(
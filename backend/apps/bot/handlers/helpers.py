@@ -4,7 +4,23 @@ Construcción de opciones para los mensajes del bot.
 Antes emitía InlineKeyboardMarkup de Telegram; ahora emite Option neutrales.
 El layout de filas se preserva exactamente — ver test_grid_mas_row_preserva_el_layout.
 """
+from collections import OrderedDict
+from dataclasses import dataclass
+
 from services.channels.senders import Option, Rows, grid, row
+from services.infrastructure import metrics
+from services.selectors import get_user_categories_or_defaults
+
+# Teclados de categorías por (user_id, category_version). Una versión vieja
+# nunca se vuelve a pedir: queda hasta que la desaloja el LRU.
+_MAX_KEYBOARDS = 2048
+_keyboards: OrderedDict[tuple[int, int], "CategoryKeyboard"] = OrderedDict()
+
+KEYBOARD_CACHE = metrics.counter(
+    "bot_category_keyboard_cache_total",
+    "Teclados de categorías servidos desde el cache (hit) o armados (miss)",
+    labelnames=("outcome",),
+)
 
 
 def delete_options(expense_id: int) -> Rows:
@@ -31,10 +47,46 @@ def category_selection_options(expense_id: int, categories: list) -> Rows:
     'de a dos', un número impar de categorías aparearía la última con
     'Nueva categoría' y cambiaría el layout visible.
     """
-    opciones = [
-        Option(f"cat_select:{expense_id}:{c.id}", c.name)
-        for c in categories
-    ]
-    return grid(opciones, columns=2) + row(
-        Option(f"cat_new:{expense_id}", "➕ Nueva categoría")
-    )
\ No newline at end of file
+    return CategoryKeyboard.build(categories).render(expense_id)
+
+
+@dataclass(frozen=True)
+class CategoryKeyboard:
+    """
+    El teclado de categorías sin el expense id. Cada botón es
+    (acción, sufijo, label) y su id es f"{acción}:{expense_id}{sufijo}".
+    """
+    rows: tuple[tuple[tuple[str, str, str], ...], ...]
+
+    @classmethod
+    def build(cls, categories: list) -> "CategoryKeyboard":
+        botones = [("cat_select", f":{c.id}", c.name) for c in categories]
+        filas = grid(botones, columns=2) + [[("cat_new", "", "➕ Nueva categoría")]]
+        return cls(tuple(tuple(fila) for fila in filas))
+
+    def render(self, expense_id: int) -> Rows:
+        return [
+            [Option(f"{accion}:{expense_id}{sufijo}", label) for accion, sufijo, label in fila]
+            for fila in self.rows
+        ]
+
+
+async def category_keyboard(user) -> CategoryKeyboard:
+    """
+    Teclado de categorías del usuario, sin SQL si ya se armó para su
+    category_version actual. El User llega fresco de la base en cada
+    evento, así que la versión siempre es la vigente.
+    """
+    key = (user.id, user.category_version)
+    keyboard = _keyboards.get(key)
+    if keyboard is not None:
+        _keyboards.move_to_end(key)
+        KEYBOARD_CACHE.inc(outcome="hit")
+        return keyboard
+
+    KEYBOARD_CACHE.inc(outcome="miss")
+    keyboard = CategoryKeyboard.build(await get_user_categories_or_defaults(user))
+    _keyboards[key] = keyboard
+    while len(_keyboards) > _MAX_KEYBOARDS:
+        _keyboards.popitem(last=False)
+    return keyboard
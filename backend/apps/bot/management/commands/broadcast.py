@@ -0,0 +1,47 @@
+"""
+Envíos masivos (apps/bot/broadcast.py).
+
+    python manage.py broadcast status
+    python manage.py broadcast start monthly_summary 2026-09
+    python manage.py broadcast start pending_reminder 2026-10-19
+
+start solo crea la pasada: la procesa el cron del worker (broadcast_tick),
+que la sigue desde el checkpoint si se corta.
+"""
+import asyncio
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.bot import broadcast
+from apps.core.models import BroadcastRun
+
+
+class Command(BaseCommand):
+    help = "Estado de los envíos masivos y arranque manual de una pasada"
+
+    def add_arguments(self, parser):
+        sub = parser.add_subparsers(dest="action", required=True)
+
+        status = sub.add_parser("status")
+        status.add_argument("--limit", type=int, default=10)
+
+        start = sub.add_parser("start")
+        start.add_argument("kind", choices=sorted(broadcast.KINDS))
+        start.add_argument("period", help="Mes (2026-09) o día (2026-10-19), según el tipo")
+
+    def handle(self, *args, **opts):
+        if opts["action"] == "start":
+            try:
+                run = asyncio.run(broadcast.start(opts["kind"], opts["period"]))
+            except ValueError as exc:
+                raise CommandError(str(exc))
+            self.stdout.write(self.style.SUCCESS(f"{run.key}: {run.status}, {run.total} destinatarios"))
+            return
+
+        for run in BroadcastRun.objects.order_by("-id")[:opts["limit"]]:
+            avance = run.processed / run.total * 100 if run.total else 100.0
+            self.stdout.write(
+                f"{run.key:<32} {run.status:<8} {avance:5.1f}%  "
+                f"{run.processed}/{run.total}  enviados={run.sent} "
+                f"salteados={run.skipped} fallidos={run.failed}  cursor={run.cursor}"
+            )
@@ -0,0 +1,140 @@
+"""
+Inspección y replay del dead-letter stream (apps/bot/deadletter.py).
+
+    python manage.py dlq stats
+    python manage.py dlq list --digest 3f9a1c0b2e4d --limit 20
+    python manage.py dlq replay --error OperationalError --rate 50 --dry-run
+    python manage.py dlq replay --since 90
+
+Los filtros son los mismos en los tres subcomandos. replay avanza por lotes
+a un ritmo máximo (--rate eventos/s) y se saltea los mensajes cuyo gasto
+ya quedó guardado y los callbacks (el botón sigue ahí; el ack venció hace rato).
+"""
+import asyncio
+import time
+from collections import Counter
+from datetime import datetime
+
+from django.core.management.base import BaseCommand
+
+from apps.bot import deadletter
+from services.infrastructure.redis_client import close_all
+
+
+class Command(BaseCommand):
+    help = "Lista, agrupa y reencola eventos del dead-letter stream"
+
+    def add_arguments(self, parser):
+        sub = parser.add_subparsers(dest="action", required=True)
+
+        for nombre in ("list", "stats", "replay"):
+            p = sub.add_parser(nombre)
+            p.add_argument("--error", help="Subcadena de la clase del error")
+            p.add_argument("--digest", help="Digest exacto del traceback")
+            p.add_argument("--channel")
+            p.add_argument("--stage", choices=[deadletter.STAGE_PRE_DISPATCH, deadletter.STAGE_DISPATCH])
+            p.add_argument("--since", type=int, help="Solo los últimos N minutos")
+            p.add_argument("--limit", type=int, default=0, help="Máximo de entradas (0 = todas)")
+            p.add_argument("--batch-size", type=int, default=200)
+
+            if nombre == "replay":
+                p.add_argument("--rate", type=float, default=50.0, help="Eventos por segundo")
+                p.add_argument("--dry-run", action="store_true")
+                p.add_argument(
+                    "--include-callbacks",
+                    action="store_true",
+                    help="Reencolar también clicks de botón",
+                )
+
+    def handle(self, *args, **opts):
+        asyncio.run(self._run(opts))
+
+    async def _run(self, opts):
+        try:
+            await getattr(self, f"_{opts['action']}")(opts)
+        finally:
+            await close_all()
+
+    # ---------------------------------------------------------------
+
+    async def _list(self, opts):
+        async for letter in self._filtered(opts):
+            cuando = datetime.fromtimestamp(letter.failed_at).isoformat(timespec="seconds")
+            self.stdout.write(
+                f"{letter.entry_id}  {cuando}  {letter.digest}  {letter.stage:<12}  "
+                f"try={letter.attempt}  {letter.channel}:{letter.event.get('message_id')}  "
+                f"{letter.error}: {letter.message[:80]}"
+            )
+
+    async def _stats(self, opts):
+        por_digest = Counter()
+        ejemplo = {}
+        async for letter in self._filtered(opts):
+            por_digest[letter.digest] += 1
+            ejemplo.setdefault(letter.digest, letter)
+
+        for digest, total in por_digest.most_common():
+            letter = ejemplo[digest]
+            self.stdout.write(
+                f"{total:>7}  {digest}  {letter.stage:<12}  {letter.error}: {letter.message[:80]}"
+            )
+        self.stdout.write(f"Total: {sum(por_digest.values())}")
+
+    async def _replay(self, opts):
+        intervalo = 1.0 / opts["rate"] if opts["rate"] > 0 else 0.0
+        proximo = time.monotonic()
+        resultado = Counter()
+
+        async for letter in self._filtered(opts):
+            if letter.is_callback and not opts["include_callbacks"]:
+                resultado["callbacks salteados"] += 1
+                continue
+
+            if await deadletter.side_effect_landed(letter):
+                resultado["ya aplicados"] += 1
+                if not opts["dry_run"]:
+                    await deadletter.delete(letter.entry_id)
+                continue
+
+            if opts["dry_run"]:
+                resultado["a reencolar"] += 1
+                continue
+
+            # Ritmo parejo en vez de ráfagas: el replay compite con el
+            # tráfico vivo por los mismos slots del worker.
+            espera = proximo - time.monotonic()
+            if espera > 0:
+                await asyncio.sleep(espera)
+            proximo = max(proximo, time.monotonic()) + intervalo
+
+            if await deadletter.replay(letter):
+                resultado["reencolados"] += 1
+            else:
+                resultado["ya reencolados"] += 1
+
+        for clave, total in resultado.items():
+            self.stdout.write(f"{clave}: {total}")
+        self.stdout.write(self.style.SUCCESS("Replay terminado" + (" (dry-run)" if opts["dry_run"] else "")))
+
+    # ---------------------------------------------------------------
+
+    async def _filtered(self, opts):
+        desde = time.time() - opts["since"] * 60 if opts["since"] else None
+        vistos = 0
+
+        async for letter in deadletter.iter_entries(batch_size=opts["batch_size"]):
+            if desde is not None and letter.failed_at < desde:
+                continue
+            if opts["error"] and opts["error"] not in letter.error:
+                continue
+            if opts["digest"] and letter.digest != opts["digest"]:
+                continue
+            if opts["channel"] and letter.channel != opts["channel"]:
+                continue
+            if opts["stage"] and letter.stage != opts["stage"]:
+                continue
+
+            yield letter
+            vistos += 1
+            if opts["limit"] and vistos >= opts["limit"]:
+                return
@@ -0,0 +1,78 @@
+"""
+Memoria de Redis por familia de claves, para dimensionar la instancia.
+
+    python manage.py redis_memory
+    python manage.py redis_memory --sample 500
+
+Por cada familia recorre las claves con SCAN (no bloquea a Redis como
+KEYS), mide MEMORY USAGE de las primeras --sample y extrapola el promedio
+al total. Al final, used_memory de INFO: la diferencia con la suma es
+overhead del servidor y claves fuera de estas familias.
+"""
+import asyncio
+
+from django.core.management.base import BaseCommand
+
+from services.infrastructure.redis_client import close_all, get_redis
+
+# nombre, purpose (database), patrones de SCAN
+FAMILIES = (
+    ("idempotency", "cache", ("idempotency:*",)),
+    ("coalescing", "cache", ("click:*", "repeat:*")),
+    ("ratelimit", "cache", ("ratelimit:*",)),
+    ("raw", "cache", ("raw:*",)),
+    ("state", "state", ("cat_state*",)),
+    ("jobs", "jobs", ("arq:job:*",)),
+    ("results", "jobs", ("arq:result:*",)),
+    ("queues", "jobs", ("arq:queue*", "events:*", "dlq:*")),
+)
+
+
+class Command(BaseCommand):
+    help = "Estima la memoria de Redis por familia de claves"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sample", type=int, default=200, help="Claves medidas por familia"
+        )
+        parser.add_argument(
+            "--scan-count", type=int, default=1000, help="COUNT de cada SCAN"
+        )
+
+    def handle(self, *args, **opts):
+        asyncio.run(self._run(opts))
+
+    async def _run(self, opts):
+        try:
+            await self._report(opts)
+        finally:
+            await close_all()
+
+    async def _report(self, opts):
+        self.stdout.write(
+            f"{'familia':<12} {'claves':>10} {'medidas':>8} {'prom. B':>9} {'total MiB':>10}"
+        )
+        total = 0
+        for nombre, purpose, patrones in FAMILIES:
+            redis = await get_redis(purpose)
+            claves, medidas, bytes_medidos = 0, 0, 0
+            for patron in patrones:
+                async for key in redis.scan_iter(match=patron, count=opts["scan_count"]):
+                    claves += 1
+                    if medidas < opts["sample"]:
+                        # None si la clave venció entre el SCAN y la medición.
+                        usage = await redis.memory_usage(key)
+                        if usage is not None:
+                            medidas += 1
+                            bytes_medidos += usage
+
+            promedio = bytes_medidos / medidas if medidas else 0
+            estimado = promedio * claves
+            total += estimado
+            self.stdout.write(
+                f"{nombre:<12} {claves:>10} {medidas:>8} {promedio:>9.0f} {estimado / 2**20:>10.1f}"
+            )
+
+        info = await (await get_redis("jobs")).info("memory")
+        self.stdout.write(f"Total estimado: {total / 2**20:.1f} MiB")
+        self.stdout.write(f"used_memory: {info['used_memory'] / 2**20:.1f} MiB")
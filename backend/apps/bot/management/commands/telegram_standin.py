@@ -0,0 +1,66 @@
+"""
+Levanta el stand-in local de la Bot API (services/channels/telegram/standin.py).
+
+    python manage.py telegram_standin --port 8081 --latency 0.15 --jitter 0.1 \
+        --rate 30 --chat-rate 1 --chat-burst 3 --throttle-rate 0.01
+
+y el worker con TELEGRAM_API_URL=http://127.0.0.1:8081/bot.
+"""
+import asyncio
+
+from django.core.management.base import BaseCommand
+
+from services.channels.telegram.standin import StandInConfig, TelegramStandIn
+
+
+class Command(BaseCommand):
+    help = "Stand-in local de la Bot API de Telegram, para pruebas de carga y latencia"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8081)
+        parser.add_argument("--latency", type=float, default=0.0,
+                            help="Segundos de demora por respuesta")
+        parser.add_argument("--jitter", type=float, default=0.0,
+                            help="Demora extra aleatoria, entre 0 y este valor")
+        parser.add_argument("--error-rate", type=float, default=0.0,
+                            help="Fracción de pedidos que devuelven 500")
+        parser.add_argument("--throttle-rate", type=float, default=0.0,
+                            help="Fracción de pedidos que devuelven 429")
+        parser.add_argument("--retry-after", type=int, default=1,
+                            help="retry_after de los 429 de --throttle-rate")
+        parser.add_argument("--rate", type=float, default=0.0,
+                            help="Pedidos por segundo en total (0 = sin límite)")
+        parser.add_argument("--chat-rate", type=float, default=0.0,
+                            help="Pedidos por segundo por chat (0 = sin límite)")
+        parser.add_argument("--chat-burst", type=int, default=1)
+        parser.add_argument("--seed", type=int, default=None)
+
+    def handle(self, *args, **options):
+        config = StandInConfig(
+            latency=options["latency"],
+            jitter=options["jitter"],
+            error_rate=options["error_rate"],
+            throttle_rate=options["throttle_rate"],
+            retry_after=options["retry_after"],
+            rate=options["rate"],
+            chat_rate=options["chat_rate"],
+            chat_burst=options["chat_burst"],
+            seed=options["seed"],
+        )
+        standin = TelegramStandIn(config)
+        try:
+            asyncio.run(self._serve(standin, options["host"], options["port"]))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            for (method, status), count in sorted(standin.stats.items()):
+                self.stdout.write(f"{method:<24} {status}  {count}")
+
+    async def _serve(self, standin, host, port):
+        server = await standin.start(host, port)
+        self.stdout.write(self.style.SUCCESS(
+            f"Bot API stand-in en http://{host}:{standin.port}/bot<token>/ — Ctrl+C para cortar"
+        ))
+        async with server:
+            await server.serve_forever()
@@ -0,0 +1,298 @@
+"""
+Encolado de eventos del webhook en un solo round-trip a Redis.
+
+Antes eran dos pasos en dos pools: SET NX de la clave de idempotencia en
+la db de cache y después enqueue_job en la de jobs (que adentro hace
+WATCH + EXISTS + MULTI/EXEC). Dos o tres round-trips por update, y si el
+proceso moría entre los dos pasos, la clave quedaba marcada sin job.
+
+Ahora un script Lua hace todo del lado del servidor, atómico:
+
+  1. Marca de idempotencia en la db de cache, 24h. Ya estaba: DUPLICATE.
+     Con Telegram, un SETBIT en idempotency:{channel}:bits:{bucket}: el
+     update_id es un contador del bot, así que cada bitmap guarda
+     IDEMPOTENCY_BUCKET updates en 8 KiB en vez de una clave por update.
+     El TTL se renueva con cada escritura: un bit vive al menos 24h.
+     Otros canales (ids no numéricos): SET NX de
+     idempotency:{channel}:{message_id}.
+  2. Solo callbacks, con CALLBACK_COALESCE_MS: SET NX PX de
+     click:{channel}:{conversación}:{mensaje}:{botón}. Ya estaba:
+     COALESCED (doble tap, ver views._ack_response). Con el sistema
+     degradado (apps/bot/shedding.py) la ventana crece y cubre también
+     comandos no urgentes repetidos: repeat:{channel}:{conversación}:{hash}.
+  3. En la db de state, la pista de estado pendiente (ver abajo).
+  4. De vuelta en la db de jobs: si ya existe el job o su resultado
+     (mismo _job_id), JOB_EXISTS, como enqueue_job que devuelve None.
+  5. PSETEX del job + ZADD a la cola: ENQUEUED.
+
+La clave por update del formato anterior se mira también con el bitmap,
+durante un release: un reintento de un update marcado antes del deploy
+sigue siendo duplicado. El TTL de 24h hace que se extinga sola.
+
+Los pasos 1 y 2 quedan marcados aunque 3 corte: at-most-once, igual que
+antes (docs/decision_records/webhook_idempotency.md).
+
+Con PIPELINE_BACKEND=streams los pasos 4 y 5 se reemplazan por un XADD
+al stream del carril (apps/bot/streams.py), con el mismo job serializado.
+
+El job es el de ARQ: arq.jobs.serialize_job con el codec compacto, las
+mismas claves (arq:job:<id>, arq:result:<id>), el mismo score y la
+misma expiración que calcula ArqRedis.enqueue_job. El worker no nota la
+diferencia.
+
+El script cambia de db con SELECT: desde Redis 2.8.12 eso afecta solo al
+script, no a la conexión que lo llama. Las claves van igual en KEYS.
+
+Pista de estado: handle_message lee el estado de conversación
+(apps/bot/state.py) en cada mensaje, y casi siempre no hay nada. El
+productor manda el job dos veces serializado, con state_hint=False y
+con state_hint=True, y el script elige: True si existe la clave de
+estado o un marcador de callback en vuelo. Ese marcador (state.keys_for) lo
+pone el script al encolar cualquier callback del usuario, porque es
+procesando un callback que el worker crea el estado: un mensaje
+encolado detrás, antes de que el callback corra, tiene que leerlo igual.
+Dura lo mismo que el estado. Con False el worker no va a Redis.
+
+Delante del script hay un cache en memoria (IDEMPOTENCY_LOCAL_SIZE
+claves): las de updates que este proceso ya pasó por el script. Un
+reintento de Telegram que vuelve al mismo proceso se descarta sin ir a
+Redis. Solo contesta "duplicado" con certeza (la clave está en Redis
+porque el script corrió); ante la duda, pregunta a Redis, que es la
+fuente autoritativa.
+"""
+import hashlib
+from datetime import datetime, timedelta, timezone
+
+from arq.constants import job_key_prefix, result_key_prefix
+from arq.jobs import serialize_job
+from arq.utils import timestamp_ms, to_unix_ms
+from django.conf import settings
+from redis.exceptions import NoScriptError
+
+from services.channels.events import job_id_for
+from services.channels.telegram import CHANNEL as TELEGRAM
+from services.infrastructure import metrics
+from services.infrastructure.lru import TTLCache
+from services.infrastructure.redis_client import database_for, get_redis, guarded
+
+from apps.bot import state, streams
+
+# TTL = 24 HOURS is the same as Telegram max_tries TTL
+IDEMPOTENCY_TTL = 60 * 60 * 24
+
+# Ids por bitmap de idempotencia: 8 KiB por clave como mucho. Solo para
+# canales cuyo message_id es un contador del bot (update_id de Telegram),
+# donde los bits de cada bitmap se llenan casi todos.
+IDEMPOTENCY_BUCKET = 65_536
+_DENSE_IDS = frozenset({TELEGRAM})
+
+# Carril prioritario de callbacks. ARQ saca los jobs en orden de score
+# (epoch ms de ejecución); encolar un callback con el score corrido hacia
+# atrás lo pone delante de cualquier mensaje recibido en esa ventana.
+# Mismo worker, misma cola: ver docs/decision_records/callback_priority_lane.md
+CALLBACK_HEADSTART = timedelta(minutes=5)
+
+ENQUEUED = "enqueued"
+DUPLICATE = "duplicate"
+COALESCED = "coalesced"
+JOB_EXISTS = "job_exists"
+
+# KEYS: idempotencia (bitmap o clave por update), job, resultado, cola,
+#       estado, estado legacy, callback en vuelo, idempotencia por
+#       update[, click]
+# ARGV: db cache, db jobs, ttl idempotencia, job sin estado, score,
+#       expiración ms, job_id, ventana del click ms (0 = no),
+#       db state, job con estado, ttl del marcador (0 = es un mensaje),
+#       bit del update en el bitmap (-1 = clave por update)
+_CHECKS = """
+redis.call('SELECT', ARGV[1])
+local bit = tonumber(ARGV[12])
+if bit >= 0 then
+    local seen = redis.call('SETBIT', KEYS[1], bit, 1)
+    redis.call('EXPIRE', KEYS[1], ARGV[3])
+    if seen == 1 or redis.call('EXISTS', KEYS[8]) == 1 then
+        return 0
+    end
+elseif not redis.call('SET', KEYS[1], '1', 'EX', ARGV[3], 'NX') then
+    return 0
+end
+if KEYS[9] and not redis.call('SET', KEYS[9], '1', 'PX', ARGV[8], 'NX') then
+    return 3
+end
+redis.call('SELECT', ARGV[9])
+local job = ARGV[4]
+if tonumber(ARGV[11]) > 0 then
+    redis.call('SET', KEYS[7], '1', 'EX', ARGV[11])
+elseif redis.call('EXISTS', KEYS[5], KEYS[6], KEYS[7]) > 0 then
+    job = ARGV[10]
+end
+"""
+ENQUEUE_SCRIPT = _CHECKS + """
+redis.call('SELECT', ARGV[2])
+if redis.call('EXISTS', KEYS[2], KEYS[3]) > 0 then
+    return 2
+end
+redis.call('PSETEX', KEYS[2], ARGV[6], job)
+redis.call('ZADD', KEYS[4], ARGV[5], ARGV[7])
+return 1
+"""
+# Backend de streams (apps/bot/streams.py): los mismos pasos 1 a 3 y un
+# XADD recortado. KEYS[2] es el stream; KEYS[3] y KEYS[4] lo repiten
+# para no correr las posiciones. ARGV[5] es el MAXLEN aproximado.
+STREAM_SCRIPT = _CHECKS + """
+redis.call('SELECT', ARGV[2])
+redis.call('XADD', KEYS[2], 'MAXLEN', '~', ARGV[5], '*', 'job', job)
+return 1
+"""
+_SHA = hashlib.sha1(ENQUEUE_SCRIPT.encode()).hexdigest()
+_STREAM_SHA = hashlib.sha1(STREAM_SCRIPT.encode()).hexdigest()
+
+_OUTCOMES = {0: DUPLICATE, 1: ENQUEUED, 2: JOB_EXISTS, 3: COALESCED}
+
+IDEMPOTENCY_LOCAL = metrics.counter(
+    "bot_idempotency_local_total",
+    "Chequeos de idempotencia resueltos en memoria (hit) o enviados a Redis (miss)",
+    labelnames=("channel", "outcome"),
+)
+
+# Una hora: los reintentos de Telegram llegan en segundos o minutos. Con
+# 24h, una clave que ya venía de antes podría sobrevivir a la de Redis.
+IDEMPOTENCY_LOCAL_TTL = 60 * 60
+_seen = TTLCache(settings.IDEMPOTENCY_LOCAL_SIZE, IDEMPOTENCY_LOCAL_TTL)
+
+
+def _score(event, enqueue_time_ms: int, defer_ms: int = 0) -> int:
+    if not event.is_callback:
+        return enqueue_time_ms + defer_ms
+    recibido = datetime.fromtimestamp(event.received_at, tz=timezone.utc)
+    return to_unix_ms(recibido - CALLBACK_HEADSTART)
+
+
+def click_key(event) -> str:
+    if not event.is_callback:
+        texto = hashlib.sha1(event.text.encode()).hexdigest()[:16]
+        return f"repeat:{event.channel}:{event.conversation_id}:{texto}"
+    return f"click:{event.channel}:{event.conversation_id}:{event.edit_ref}:{event.text}"
+
+
+def _idempotency_key(event) -> str:
+    return f"idempotency:{event.channel}:{event.message_id}"
+
+
+def idempotency_slot(event) -> tuple[str, int]:
+    """
+    (clave, bit) donde se marca el update. Con ids densos, un bitmap por
+    cada IDEMPOTENCY_BUCKET ids; si no, la clave por update y bit -1.
+    """
+    message_id = event.message_id
+    if event.channel not in _DENSE_IDS or not message_id.isdigit():
+        return _idempotency_key(event), -1
+    bucket, bit = divmod(int(message_id), IDEMPOTENCY_BUCKET)
+    return f"idempotency:{event.channel}:bits:{bucket}", bit
+
+
+def seen_locally(event) -> bool:
+    """
+    El update ya pasó por el script en este proceso: duplicado seguro, sin
+    ir a Redis. El webhook lo pregunta antes que nada (antes del rate
+    limit, para que un reintento no gaste fichas del usuario).
+    """
+    if _idempotency_key(event) in _seen:
+        IDEMPOTENCY_LOCAL.inc(channel=event.channel, outcome="hit")
+        return True
+    IDEMPOTENCY_LOCAL.inc(channel=event.channel, outcome="miss")
+    return False
+
+
+async def enqueue_event(
+    event,
+    *,
+    function: str = "process_message",
+    defer_ms: int = 0,
+    coalesce_ms: int | None = None,
+) -> str:
+    """
+    Idempotencia, coalescing de clicks y encolado, en un round-trip.
+    Devuelve ENQUEUED, DUPLICATE, COALESCED o JOB_EXISTS. El cache local
+    se consulta antes, con seen_locally().
+
+    defer_ms corre la ejecución de un mensaje hacia adelante. coalesce_ms
+    reemplaza a CALLBACK_COALESCE_MS y, si viene, aplica también a los
+    mensajes (mismo texto en la misma conversación).
+
+    Con Redis caído o lento levanta CircuitOpen o TimeoutError en
+    milisegundos (redis_client.guarded); nada quedó marcado.
+    """
+    idempotency_key = _idempotency_key(event)
+    jobs = await get_redis("jobs")
+    job_id = job_id_for(event)
+
+    enqueue_time_ms = timestamp_ms()
+    score = _score(event, enqueue_time_ms, defer_ms)
+    expires_ms = score - enqueue_time_ms + jobs.expires_extra_ms
+
+    def _job(state_hint):
+        data = {**event.to_dict(), "state_hint": state_hint}
+        return serialize_job(
+            function, (data,), {}, None, enqueue_time_ms, serializer=jobs.job_serializer
+        )
+
+    job = _job(False)
+    # Un callback no lee estado: no hace falta la segunda versión.
+    job_with_state = job if event.is_callback else _job(True)
+
+    if coalesce_ms is None:
+        window = settings.CALLBACK_COALESCE_MS if event.is_callback else 0
+    else:
+        window = coalesce_ms
+
+    if streams.enabled():
+        # Sin score: el carril de callbacks es un stream aparte, y lo
+        # diferido por carga entra ya (espera detrás de la cola igual).
+        stream = streams.stream_for(event)
+        script, sha = STREAM_SCRIPT, _STREAM_SHA
+        targets = [stream, stream, stream]
+    else:
+        script, sha = ENQUEUE_SCRIPT, _SHA
+        targets = [
+            job_key_prefix + job_id,
+            result_key_prefix + job_id,
+            jobs.default_queue_name,
+        ]
+
+    slot, bit = idempotency_slot(event)
+    keys = [
+        slot,
+        *targets,
+        *state.keys_for(event.channel, event.external_user_id),
+        idempotency_key,
+    ]
+    args = [
+        database_for("cache"),
+        database_for("jobs"),
+        IDEMPOTENCY_TTL,
+        job,
+        settings.STREAM_MAXLEN if streams.enabled() else score,
+        expires_ms,
+        job_id,
+        window,
+        database_for("state"),
+        job_with_state,
+        state.STATE_TTL if event.is_callback else 0,
+        bit,
+    ]
+    if window:
+        keys.append(click_key(event))
+
+    # El pool ya existe salvo en la primera llamada: lo único que va a
+    # Redis es el script, y es lo que mira el breaker.
+    async with guarded("jobs"):
+        try:
+            result = await jobs.evalsha(sha, len(keys), *keys, *args)
+        except NoScriptError:
+            # Primera vez contra este servidor (o después de un SCRIPT FLUSH).
+            result = await jobs.eval(script, len(keys), *keys, *args)
+
+    # Cualquiera sea el resultado, la clave quedó en Redis.
+    _seen.set(idempotency_key)
+    return _OUTCOMES[int(result)]
@@ -0,0 +1,152 @@
+"""
+Modos de degradación del webhook según la profundidad de la cola.
+
+Si el worker se atrasa, el webhook sigue encolando sin freno: el lag
+crece a minutos y los callbacks vencen antes de procesarse. Acá el
+webhook mira cuántos jobs de ARQ ya están vencidos en la cola (ZCOUNT
+hasta ahora; los diferidos no cuentan; con el backend de streams, el lag
+del consumer group) y elige un modo:
+
+  normal      Por debajo de SHED_DEGRADED_DEPTH. Nada cambia.
+  degraded    Los comandos no urgentes (SHED_NON_URGENT_COMMANDS:
+              /history, /stats) se encolan diferidos SHED_DEFER_SECONDS.
+              Los repetidos se cortan más fuerte: la ventana de
+              coalescing de clicks pasa a SHED_COALESCE_MS y cubre
+              también esos comandos repetidos (mismo texto).
+  overloaded  Desde SHED_OVERLOADED_DEPTH. Además, los comandos no
+              urgentes no se encolan: el webhook contesta "ocupado".
+
+Los gastos y los callbacks nunca se descartan: son lo que el usuario
+espera ver. Un gasto repetido ("café 500" dos veces) son dos gastos, así
+que los mensajes comunes tampoco se coalescen.
+
+La profundidad se muestrea como mucho una vez cada SHED_SAMPLE_SECONDS
+por proceso. Mientras una muestra está en vuelo, los demás requests usan
+la anterior. Si Redis no contesta (o su breaker está abierto, ver
+redis_client.guarded), queda la última conocida.
+"""
+import logging
+import time
+from dataclasses import dataclass
+from typing import Callable
+
+from arq.utils import timestamp_ms
+from django.conf import settings
+
+from apps.bot import streams
+from apps.bot.routing import split_command
+from services.infrastructure import metrics
+from services.infrastructure.redis_client import get_redis, guarded
+
+logger = logging.getLogger(__name__)
+
+NORMAL = "normal"
+DEGRADED = "degraded"
+OVERLOADED = "overloaded"
+
+# Para el gauge: 0 normal, 1 degraded, 2 overloaded.
+_MODE_VALUES = {NORMAL: 0, DEGRADED: 1, OVERLOADED: 2}
+
+QUEUE_DEPTH = metrics.gauge(
+    "bot_queue_depth",
+    "Jobs vencidos en la cola de ARQ, según la última muestra del webhook",
+)
+LOAD_MODE = metrics.gauge(
+    "bot_load_mode",
+    "Modo de degradación del webhook: 0 normal, 1 degraded, 2 overloaded",
+)
+LOAD_SHED = metrics.counter(
+    "bot_load_shed_total",
+    "Eventos que el webhook difirió, coalesció o rechazó por carga",
+    labelnames=("mode", "action"),
+)
+
+
+@dataclass(frozen=True)
+class Plan:
+    mode: str = NORMAL
+    busy: bool = False                  # no encolar, contestar "ocupado"
+    defer_ms: int = 0
+    coalesce_ms: int | None = None      # None: la ventana normal de clicks
+
+
+class DepthSampler:
+    def __init__(self, *, clock: Callable[[], float] = time.monotonic):
+        self._clock = clock
+        self.depth = 0
+        self._expires = 0.0
+
+    async def sample(self) -> int:
+        now = self._clock()
+        if now < self._expires:
+            return self.depth
+        # Antes del await: los requests que llegan mientras tanto no salen
+        # todos a Redis a la vez.
+        self._expires = now + settings.SHED_SAMPLE_SECONDS
+        try:
+            async with guarded("jobs"):
+                jobs = await get_redis("jobs")
+                if streams.enabled():
+                    depth = await streams.backlog(jobs)
+                else:
+                    depth = await jobs.zcount(jobs.default_queue_name, "-inf", timestamp_ms())
+            self.depth = int(depth)
+        except Exception as exc:
+            logger.warning(
+                "No se pudo medir la cola, queda la última muestra",
+                extra={"error_info": str(exc), "depth": self.depth},
+            )
+            return self.depth
+        QUEUE_DEPTH.set(self.depth)
+        return self.depth
+
+    def clear(self) -> None:
+        self.depth = 0
+        self._expires = 0.0
+
+
+_sampler = DepthSampler()
+_mode = NORMAL
+
+
+def mode_for(depth: int) -> str:
+    """Umbral en 0 = ese modo apagado."""
+    overloaded, degraded = settings.SHED_OVERLOADED_DEPTH, settings.SHED_DEGRADED_DEPTH
+    if overloaded and depth >= overloaded:
+        return OVERLOADED
+    if degraded and depth >= degraded:
+        return DEGRADED
+    return NORMAL
+
+
+async def current_mode() -> str:
+    global _mode
+    if not settings.SHED_DEGRADED_DEPTH and not settings.SHED_OVERLOADED_DEPTH:
+        return NORMAL
+    depth = await _sampler.sample()
+    mode = mode_for(depth)
+    if mode != _mode:
+        logger.warning("Modo de carga cambia", extra={"from": _mode, "to": mode, "depth": depth})
+        _mode = mode
+        LOAD_MODE.set(_MODE_VALUES[mode])
+    return mode
+
+
+def is_non_urgent(event) -> bool:
+    if event.is_callback:
+        return False
+    command, _ = split_command(event.text)
+    return command in settings.SHED_NON_URGENT_COMMANDS
+
+
+def plan_for(event, mode: str) -> Plan:
+    if mode == NORMAL:
+        return Plan()
+    coalesce_ms = settings.SHED_COALESCE_MS or None
+    if event.is_callback:
+        return Plan(mode=mode, coalesce_ms=coalesce_ms)
+    if not is_non_urgent(event):
+        return Plan(mode=mode)
+    if mode == OVERLOADED:
+        return Plan(mode=mode, busy=True)
+    return Plan(mode=mode, defer_ms=settings.SHED_DEFER_SECONDS * 1000, coalesce_ms=coalesce_ms)
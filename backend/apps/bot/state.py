@@ -4,17 +4,46 @@ Alternativa liviana al ConversationHandler de PTB para flujos simples.
 
 Las claves se namespacean por canal: dos usuarios con el mismo id nativo
 en canales distintos no comparten estado.
+
+Si Redis está caído o lento (redis_client.guarded corta por timeout o
+con el breaker abierto), el estado cae a un mapa en memoria del proceso
+con el mismo TTL. Es un fallback degradado: otro proceso no lo ve y se
+pierde al reiniciar, pero el flujo de categoría nueva que empezó en este
+worker sigue funcionando y ningún mensaje espera a Redis.
 """
 import logging
 
-from services.infrastructure.redis_client import get_redis
+from redis.exceptions import RedisError
+
+from services.infrastructure import metrics
+from services.infrastructure.circuit import CircuitOpen
+from services.infrastructure.lru import TTLCache
+from services.infrastructure.redis_client import get_redis, guarded
 
 logger = logging.getLogger(__name__)
 
+STATE_LOOKUPS = metrics.counter(
+    "bot_state_lookups_total",
+    "Lecturas de estado por mensaje: hechas (read) o evitadas por la pista del productor (skipped)",
+    labelnames=("outcome",),
+)
+
+STATE_FALLBACK = metrics.counter(
+    "bot_state_fallback_total",
+    "Operaciones de estado que usaron el mapa local porque Redis no contestó",
+    labelnames=("op",),
+)
+
 STATE_TTL = 300  # 5 minutos — si el usuario no responde, el estado expira
 
 _PREFIX = "cat_state"
 
+# (canal, usuario) → (expense_id, solo_local). solo_local: la escritura a
+# Redis falló, así que esta copia es la única y se lee aunque Redis
+# vuelva. Si no, es una copia de respaldo que solo se usa sin Redis.
+_local = TTLCache(maxsize=10_000, ttl=STATE_TTL)
+_REDIS_DOWN = (CircuitOpen, RedisError, TimeoutError, OSError)
+
 
 def _key(channel: str, external_user_id: str) -> str:
     return f"{_PREFIX}:{channel}:{external_user_id}"
@@ -31,6 +60,24 @@ def _legacy_key(external_user_id: str) -> str:
     return f"{_PREFIX}:{external_user_id}"
 
 
+def _soon_key(channel: str, external_user_id: str) -> str:
+    """Callback del usuario encolado y quizás sin procesar (apps/bot/producer.py)."""
+    return f"{_PREFIX}_soon:{channel}:{external_user_id}"
+
+
+def keys_for(channel: str, external_user_id: str) -> list[str]:
+    """
+    Claves que dicen si un mensaje puede encontrar estado pendiente: la
+    actual, la legacy y el marcador de callback en vuelo. El script del
+    productor las mira para la pista state_hint del evento.
+    """
+    return [
+        _key(channel, external_user_id),
+        _legacy_key(external_user_id),
+        _soon_key(channel, external_user_id),
+    ]
+
+
 async def set_pending_category_state(
     channel: str, external_user_id: str, expense_id: int
 ) -> None:
@@ -38,8 +85,15 @@ async def set_pending_category_state(
     Marca que el usuario está en medio de crear una categoría nueva
     para un expense específico.
     """
-    redis = await get_redis("state")
-    await redis.set(_key(channel, external_user_id), expense_id, ex=STATE_TTL)
+    only_local = False
+    try:
+        async with guarded("state"):
+            redis = await get_redis("state")
+            await redis.set(_key(channel, external_user_id), expense_id, ex=STATE_TTL)
+    except _REDIS_DOWN as exc:
+        only_local = True
+        _fallback("set", exc)
+    _local.set((channel, external_user_id), (expense_id, only_local))
     logger.info(
         "Category state set",
         extra={
@@ -58,15 +112,27 @@ async def get_pending_category_state(channel: str, external_user_id: str):
     Importa porque este es el camino caliente — se ejecuta en cada
     mensaje de texto, y casi siempre devuelve None.
     """
-    redis = await get_redis("state")
-
-    actual, legacy = await redis.mget(
-        _key(channel, external_user_id),
-        _legacy_key(external_user_id),
-    )
+    local = _local.get((channel, external_user_id))
+    try:
+        async with guarded("state"):
+            redis = await get_redis("state")
+            actual, legacy = await redis.mget(
+                _key(channel, external_user_id),
+                _legacy_key(external_user_id),
+            )
+    except _REDIS_DOWN as exc:
+        _fallback("get", exc)
+        return local[0] if local else None
 
     value = actual if actual is not None else legacy
-    return int(value) if value else None
+    if value:
+        return int(value)
+    # Redis no lo tiene: vale la copia local solo si nunca llegó a Redis.
+    # Una de respaldo sin par en Redis es un estado que expiró o borró
+    # otro proceso.
+    if local and local[1]:
+        return local[0]
+    return None
 
 
 async def clear_pending_category_state(channel: str, external_user_id: str) -> None:
@@ -74,10 +140,34 @@ async def clear_pending_category_state(channel: str, external_user_id: str) -> N
     Limpia el estado después de que el flujo se completa o cancela.
 
     Borra ambos formatos: si quedara el viejo, la próxima lectura lo
-    resucitaría por el fallback.
+    resucitaría por el fallback. Si Redis no contesta, el estado de Redis
+    (si lo hay) expira solo por TTL.
     """
-    redis = await get_redis("state")
-    await redis.delete(
-        _key(channel, external_user_id),
-        _legacy_key(external_user_id),
-    )
\ No newline at end of file
+    _local.pop((channel, external_user_id))
+    try:
+        async with guarded("state"):
+            redis = await get_redis("state")
+            await redis.delete(
+                _key(channel, external_user_id),
+                _legacy_key(external_user_id),
+            )
+    except _REDIS_DOWN as exc:
+        _fallback("clear", exc)
+
+
+def pending_only_locally(channel: str, external_user_id: str) -> bool:
+    """
+    Hay un estado que se escribió sin Redis. La pista del productor
+    (state_hint) no lo ve: quien la usa para saltearse la lectura tiene
+    que preguntar esto antes.
+    """
+    local = _local.get((channel, external_user_id))
+    return bool(local and local[1])
+
+
+def _fallback(op: str, exc: Exception) -> None:
+    STATE_FALLBACK.inc(op=op)
+    logger.warning(
+        "Redis no contestó, estado en memoria local",
+        extra={"op": op, "error_type": type(exc).__name__, "error_info": str(exc)},
+    )
@@ -0,0 +1,321 @@
+"""
+Backend alternativo del pipeline sobre Redis Streams (PIPELINE_BACKEND=streams).
+
+La cola de ARQ es un sorted set: los workers compiten por el mismo ZSET,
+y un job tomado por un worker que muere queda en manos del timeout de
+ARQ, sin registro de quién lo tenía. Con streams:
+
+  - el productor hace XADD (el mismo script de idempotencia, ver
+    apps/bot/producer.py) a un stream por carril: events:callbacks y
+    events:messages. El consumidor lee primero los callbacks, que es lo
+    que el carril prioritario logra en ARQ con el score;
+  - cada worker es un consumidor del grupo "workers" (hostname:pid) y
+    lee con XREADGROUP. Redis anota qué entrada tiene cada uno (PEL);
+  - como el pool de ARQ, hasta WORKER_MAX_JOBS entradas en vuelo: apenas
+    termina una, el consumidor lee otra. Un job lento ocupa su lugar,
+    no frena al resto;
+  - XACK recién después de la etapa con efectos (dispatch): si el
+    proceso muere antes, la entrada queda pendiente;
+  - cada STREAM_CLAIM_IDLE / 2 el consumidor reclama con XAUTOCLAIM las
+    entradas pendientes hace más de STREAM_CLAIM_IDLE, de él o de un
+    worker caído. Así se recupera lo que estaba en vuelo;
+  - cada XADD recorta el stream a ~STREAM_MAXLEN entradas.
+
+La entrada lleva el job de ARQ serializado con el codec compacto, y el
+handler es el mismo process_message con el mismo ctx (job_id, job_try).
+La semántica de reintentos se mantiene:
+
+  Retry o timeout       Sin XACK: la entrada vuelve por XAUTOCLAIM, con
+                        el número de entrega como job_try. El backoff es
+                        STREAM_CLAIM_IDLE, no el defer del Retry.
+  otra excepción        XACK. process_message ya dejó el dead-letter si
+                        correspondía, como cuando ARQ da el job por fallido.
+  más de max_tries      Entregada de más (un evento que tumba al worker):
+                        dead-letter y XACK sin llamar al handler.
+
+Si el recorte se lleva una entrada pendiente (backlog mayor que
+STREAM_MAXLEN), XAUTOCLAIM la informa borrada: se cuenta como trimmed.
+"""
+import asyncio
+import logging
+import os
+import socket
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable
+
+from arq import Retry
+from arq.jobs import deserialize_job, serialize_job
+from arq.utils import timestamp_ms
+from django.conf import settings
+from redis.exceptions import ResponseError
+
+from services.channels import codec
+from services.infrastructure import metrics
+from services.infrastructure.redis_client import get_redis
+
+from apps.bot import deadletter
+
+logger = logging.getLogger(__name__)
+
+BACKEND = "streams"
+
+CALLBACK_STREAM = "events:callbacks"
+MESSAGE_STREAM = "events:messages"
+STREAMS = (CALLBACK_STREAM, MESSAGE_STREAM)     # orden de lectura
+GROUP = "workers"
+
+STREAM_DELIVERIES = metrics.counter(
+    "bot_stream_deliveries_total",
+    "Entradas del stream procesadas, por resultado",
+    labelnames=("stream", "outcome"),
+)
+STREAM_CLAIMED = metrics.counter(
+    "bot_stream_claimed_total",
+    "Entradas pendientes reclamadas con XAUTOCLAIM",
+    labelnames=("stream",),
+)
+
+Handler = Callable[..., Awaitable[None]]
+
+
+class DeliveryExhausted(Exception):
+    """La entrada se entregó más veces que max_tries sin terminar."""
+
+
+def enabled() -> bool:
+    return settings.PIPELINE_BACKEND == BACKEND
+
+
+def stream_for(event) -> str:
+    return CALLBACK_STREAM if event.is_callback else MESSAGE_STREAM
+
+
+def consumer_name() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+async def add(event: dict, *, function: str = "process_message") -> str:
+    """
+    XADD directo, sin el script del productor (sin idempotencia). Para el
+    replay del dead-letter, que ya decide qué reencolar.
+    """
+    jobs = await get_redis("jobs")
+    job = serialize_job(
+        function, (event,), {}, None, timestamp_ms(), serializer=codec.serialize_job
+    )
+    stream = CALLBACK_STREAM if event.get("type") == "callback" else MESSAGE_STREAM
+    entry_id = await jobs.xadd(
+        stream, {"job": job}, maxlen=settings.STREAM_MAXLEN, approximate=True
+    )
+    return _text(entry_id)
+
+
+async def ensure_groups(redis) -> None:
+    """Crea el grupo en cada stream (y el stream) si no existe."""
+    for stream in STREAMS:
+        try:
+            await redis.xgroup_create(stream, GROUP, id="0", mkstream=True)
+        except ResponseError as exc:
+            if "BUSYGROUP" not in str(exc):
+                raise
+
+
+async def backlog(redis) -> int:
+    """Entradas todavía sin entregar al grupo: la profundidad para shedding."""
+    total = 0
+    for stream in STREAMS:
+        for group in await redis.xinfo_groups(stream):
+            if _text(group.get("name")) == GROUP:
+                total += int(group.get("lag") or 0)
+    return total
+
+
+@dataclass
+class Delivery:
+    stream: str
+    entry_id: str
+    job: bytes | None       # None: el recorte se la llevó estando pendiente
+    attempt: int = 1
+
+
+class StreamConsumer:
+    def __init__(
+        self,
+        functions: dict[str, Handler],
+        *,
+        max_tries: int,
+        job_timeout: float,
+        max_jobs: int | None = None,
+        name: str | None = None,
+    ):
+        self.functions = functions
+        self.max_tries = max_tries
+        self.job_timeout = job_timeout
+        self.max_jobs = max_jobs or settings.WORKER_MAX_JOBS
+        self.name = name or consumer_name()
+        self._slots = asyncio.Semaphore(self.max_jobs)
+        self._tasks: set[asyncio.Task] = set()
+
+    @property
+    def free(self) -> int:
+        return self.max_jobs - len(self._tasks)
+
+    async def run(self) -> None:
+        """
+        Hasta que lo cancelen. Un error de Redis espera un segundo y sigue.
+        Al cancelarlo cancela lo que está en vuelo: queda pendiente en el
+        grupo y se reclama.
+        """
+        jobs = await get_redis("jobs")
+        await ensure_groups(jobs)
+        logger.info("Consumidor de streams listo", extra={"consumer": self.name})
+        next_claim = 0.0
+        try:
+            while True:
+                try:
+                    # Espera un lugar libre, no a que termine el lote.
+                    async with self._slots:
+                        pass
+                    if time.monotonic() >= next_claim:
+                        next_claim = time.monotonic() + settings.STREAM_CLAIM_IDLE / 2
+                        await self.process(jobs, await self.claim(jobs, self.free))
+                        continue
+                    await self.process(jobs, await self.read(jobs, self.free))
+                except asyncio.CancelledError:
+                    raise
+                except Exception as exc:
+                    logger.warning(
+                        "Falló la lectura del stream", extra={"error_info": str(exc)}, exc_info=True
+                    )
+                    await asyncio.sleep(1)
+        finally:
+            for task in self._tasks:
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def read(self, jobs, count: int) -> list[Delivery]:
+        response = await jobs.xreadgroup(
+            GROUP,
+            self.name,
+            {stream: ">" for stream in STREAMS},
+            count=count,
+            block=settings.STREAM_BLOCK_MS,
+        )
+        return [
+            Delivery(_text(stream), _text(entry_id), _job(fields))
+            for stream, entries in response or []
+            for entry_id, fields in entries
+        ]
+
+    async def claim(self, jobs, count: int) -> list[Delivery]:
+        """Pendientes hace más de STREAM_CLAIM_IDLE, con su número de entrega."""
+        idle_ms = int(settings.STREAM_CLAIM_IDLE * 1000)
+        deliveries = []
+        for stream in STREAMS:
+            _, entries, *deleted = await jobs.xautoclaim(
+                stream, GROUP, self.name, idle_ms, count=count
+            )
+            # Redis 7 las saca del PEL y las informa aparte; 6.2 las
+            # devuelve sin campos.
+            for entry_id in (deleted[0] if deleted else []):
+                deliveries.append(Delivery(stream, _text(entry_id), None))
+            entries = [(_text(i), f) for i, f in entries]
+            if not entries:
+                continue
+            STREAM_CLAIMED.inc(len(entries), stream=stream)
+            pending = await jobs.xpending_range(
+                stream, GROUP, min=entries[0][0], max=entries[-1][0],
+                count=len(entries), consumername=self.name,
+            )
+            attempts = {_text(p["message_id"]): int(p["times_delivered"]) for p in pending}
+            deliveries += [
+                Delivery(stream, entry_id, _job(fields), attempts.get(entry_id, 2))
+                for entry_id, fields in entries
+            ]
+        return deliveries
+
+    async def process(self, jobs, deliveries: list[Delivery]) -> None:
+        """
+        Arranca cada entrega en su lugar del pool y vuelve sin esperarlas.
+        XREADGROUP cuenta COUNT por stream, así que puede traer más que
+        los lugares libres: los callbacks los toman primero (carril
+        prioritario) y el resto espera a que se libere uno.
+        """
+        for delivery in sorted(deliveries, key=lambda d: d.stream != CALLBACK_STREAM):
+            await self._slots.acquire()
+            task = asyncio.create_task(self.handle(jobs, delivery))
+            self._tasks.add(task)
+            task.add_done_callback(self._done)
+
+    async def join(self) -> None:
+        """Espera lo que está en vuelo."""
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def _done(self, task: asyncio.Task) -> None:
+        self._tasks.discard(task)
+        self._slots.release()
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Entrega del stream sin terminar", exc_info=task.exception())
+
+    async def handle(self, jobs, delivery: Delivery) -> None:
+        outcome = await self._run(jobs, delivery)
+        STREAM_DELIVERIES.inc(stream=delivery.stream, outcome=outcome)
+        if outcome != "retry":
+            await jobs.xack(delivery.stream, GROUP, delivery.entry_id)
+
+    async def _run(self, jobs, delivery: Delivery) -> str:
+        job_id = f"{delivery.stream}:{delivery.entry_id}"
+        if delivery.job is None:
+            logger.error("Entrada pendiente recortada del stream", extra={"job_id": job_id})
+            return "trimmed"
+
+        try:
+            job = deserialize_job(delivery.job, deserializer=codec.deserialize_job)
+            function = self.functions[job.function]
+        except Exception as exc:
+            await deadletter.record(
+                {"stream": delivery.stream, "entry_id": delivery.entry_id},
+                exc,
+                stage=deadletter.STAGE_PRE_DISPATCH,
+                attempt=delivery.attempt,
+                job_id=job_id,
+            )
+            return "failed"
+
+        if delivery.attempt > self.max_tries:
+            await deadletter.record(
+                job.args[0] if job.args else {},
+                DeliveryExhausted(f"Entregada {delivery.attempt} veces sin terminar"),
+                stage=deadletter.STAGE_PRE_DISPATCH,
+                attempt=delivery.attempt,
+                job_id=job_id,
+            )
+            return "exhausted"
+
+        ctx = {
+            "job_id": job_id,
+            "job_try": delivery.attempt,
+            "enqueue_time": job.enqueue_time,
+            "redis": jobs,
+        }
+        try:
+            async with asyncio.timeout(self.job_timeout):
+                await function(ctx, *job.args, **job.kwargs)
+        except (Retry, TimeoutError):
+            # Queda en el PEL: vuelve por XAUTOCLAIM.
+            return "retry"
+        except Exception:
+            logger.error("Job del stream fallido", extra={"job_id": job_id}, exc_info=True)
+            return "failed"
+        return "acked"
+
+
+def _job(fields) -> bytes | None:
+    if not fields:
+        return None
+    return fields.get(b"job", fields.get("job"))
+
+
+def _text(value) -> str:
+    return value.decode() if isinstance(value, bytes) else str(value)
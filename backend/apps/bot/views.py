@@ -1,19 +1,154 @@
 import json
 import logging
+import time
 
 from django.conf import settings
-from django.http import HttpResponse
+from django.http import HttpResponse, JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 
 from services.channels.events import job_id_for
 from services.channels.registry import normalize
 from services.channels.telegram import CHANNEL as TELEGRAM
-from services.infrastructure.redis_client import get_redis
+from services.channels.telegram.inbound import slim
+from services.infrastructure import fastjson, metrics
+from services.infrastructure.circuit import CircuitOpen
+from services.infrastructure.ratelimit import ALLOWED, TokenBucket
+from services.infrastructure.redis_client import get_redis, guarded
+
+from apps.bot import producer, shedding
 
 logger = logging.getLogger(__name__)
 
-# TTL = 24 HOURS is the same as Telegram max_tries TTL
-IDEMPOTENCY_TTL = 60 * 60 * 24
+# Mismo nombre y labels que las etapas del worker: una sola consulta
+# muestra el recorrido completo. Las del webhook llevan prefijo "webhook_".
+STAGE_DURATION = metrics.histogram(
+    "bot_stage_duration_seconds",
+    "Duración de cada etapa del pipeline",
+    labelnames=("stage", "channel", "event_type"),
+)
+CALLBACKS_COALESCED = metrics.counter(
+    "bot_callbacks_coalesced_total",
+    "Clicks repetidos ackeados en el webhook sin encolarse",
+    labelnames=("channel",),
+)
+RATE_LIMIT_DECISIONS = metrics.counter(
+    "bot_rate_limit_decisions_total",
+    "Decisiones del rate limit por usuario en el webhook",
+    labelnames=("channel", "decision"),
+)
+WEBHOOK_REJECTED = metrics.counter(
+    "bot_webhook_rejected_total",
+    "Updates rechazados por el webhook antes de parsear",
+    labelnames=("reason",),
+)
+
+
+# Un balde por (canal, usuario), en la db de cache.
+_buckets = TokenBucket("ratelimit")
+
+SLOW_DOWN_TEXT = "Estás enviando muchos mensajes seguidos. Esperá unos segundos y probá de nuevo."
+
+
+async def _rate_limit(event):
+    """
+    Una ficha por evento del usuario. Si Redis falla, deja pasar: el
+    límite protege a la cola, no es motivo para perder mensajes.
+    """
+    rate, burst = settings.RATE_LIMIT_RATE, settings.RATE_LIMIT_BURST
+    if not rate or not burst:
+        return ALLOWED
+    try:
+        decision = await _buckets.take(
+            f"{event.channel}:{event.external_user_id}", rate=rate, burst=burst
+        )
+    except Exception as exc:
+        RATE_LIMIT_DECISIONS.inc(channel=event.channel, decision="error")
+        logger.warning("Rate limit sin Redis, se deja pasar", extra={"error_info": str(exc)})
+        return ALLOWED
+
+    if decision.allowed:
+        RATE_LIMIT_DECISIONS.inc(channel=event.channel, decision="allowed")
+    else:
+        RATE_LIMIT_DECISIONS.inc(
+            channel=event.channel, decision="notified" if decision.notify else "dropped"
+        )
+    return decision
+
+
+def _slow_down_response(event, decision) -> HttpResponse:
+    """
+    Evento limitado: no se encola. Un callback se ackea igual (si no, el
+    botón queda girando); el aviso sale una sola vez por episodio, en la
+    respuesta del webhook, sin pasar por el worker.
+    """
+    if event.is_callback:
+        body = {"method": "answerCallbackQuery", "callback_query_id": event.ack_ref}
+        if decision.notify:
+            body["text"] = SLOW_DOWN_TEXT
+        return JsonResponse(body)
+    if decision.notify:
+        return JsonResponse({
+            "method": "sendMessage",
+            "chat_id": event.conversation_id,
+            "text": SLOW_DOWN_TEXT,
+        })
+    return HttpResponse("OK", status=200)
+
+
+BUSY_TEXT = "Estoy con mucha carga en este momento. Probá de nuevo en unos minutos."
+
+
+def _busy_response(event) -> JsonResponse:
+    """Comando no urgente con la cola desbordada: se contesta sin encolar."""
+    return JsonResponse({
+        "method": "sendMessage",
+        "chat_id": event.conversation_id,
+        "text": BUSY_TEXT,
+    })
+
+
+def _too_large(request) -> bool:
+    """
+    El límite se mira primero en Content-Length, sin tocar request.body:
+    un cuerpo que ya declara ser grande no se lee ni se parsea. Sin header
+    (chunked), se mide el cuerpo leído.
+    """
+    limit = settings.WEBHOOK_MAX_BODY
+    if not limit:
+        return False
+    try:
+        declared = int(request.headers.get("Content-Length") or 0)
+    except ValueError:
+        declared = 0
+    return declared > limit or len(request.body) > limit
+
+
+def _ack_response(event) -> JsonResponse:
+    """
+    Ack en la respuesta del webhook: Telegram ejecuta el método que viene
+    en el cuerpo, sin otro round-trip ni pasar por el worker.
+    """
+    return JsonResponse({"method": "answerCallbackQuery", "callback_query_id": event.ack_ref})
+
+
+async def _store_raw(event, body: bytes) -> None:
+    """
+    Guarda el update crudo fuera de banda: el codec lo descarta del job.
+    Para depurar un evento concreto sin inflar cada job de la cola.
+    Son los bytes tal cual llegaron: event.raw ya es el recorte de slim().
+
+    Es solo para depurar: si Redis no contesta, se pierde y listo.
+    """
+    try:
+        async with guarded("cache"):
+            cache = await get_redis("cache")
+            await cache.set(
+                f"raw:{event.channel}:{event.message_id}",
+                body,
+                ex=settings.EVENT_RAW_TTL,
+            )
+    except Exception as exc:
+        logger.warning("No se guardó el update crudo", extra={"error_info": str(exc)})
 
 
 @csrf_exempt
@@ -31,9 +166,18 @@ async def webhook(request):
     if request.headers.get("X-Telegram-Bot-Api-Secret-Token") != secret:
         return HttpResponse("Forbidden", status=403)
 
+    if _too_large(request):
+        WEBHOOK_REJECTED.inc(reason="too_large")
+        logger.warning(
+            "Webhook body over WEBHOOK_MAX_BODY, rejected",
+            extra={"content_length": request.headers.get("Content-Length")},
+        )
+        return HttpResponse("Payload Too Large", status=413)
+
+    start = time.perf_counter()
     try:
-        json_data = request.body.decode("UTF-8")
-        payload = json.loads(json_data)
+        # Bytes directo al parser, sin decode a str (orjson si está).
+        payload = fastjson.loads(request.body)
 
         update_id = payload.get("update_id")
         if not update_id:
@@ -43,8 +187,9 @@ async def webhook(request):
             )
             return HttpResponse("Bad Request", status=400)
 
-        # 1. Normalización: acá muere el vocabulario de Telegram.
-        event = normalize(TELEGRAM, payload)
+        # 1. Normalización: acá muere el vocabulario de Telegram. Solo pasa
+        #    el subárbol que normalize lee; el resto del update no se copia.
+        event = normalize(TELEGRAM, slim(payload))
 
         if event is None:
             # Updates que el sistema no atiende (edited_message, fotos,
@@ -56,38 +201,99 @@ async def webhook(request):
             )
             return HttpResponse("OK", status=200)
 
-        # 2. Idempotencia de ventana larga (24h, la de Telegram).
-        #    SET NX es atómico: reemplaza al GET+SET que tenía carrera.
-        #    Se marca ANTES de encolar — at-most-once, ver el ADR.
-        cache = await get_redis("cache")
-        idempotency_key = f"idempotency:{event.channel}:{event.message_id}"
-
-        primera_vez = await cache.set(
-            idempotency_key, "1", ex=IDEMPOTENCY_TTL, nx=True
+        labels = {"channel": event.channel, "event_type": event.type}
+        STAGE_DURATION.observe(
+            time.perf_counter() - start, stage="webhook_normalize", **labels
         )
 
-        if not primera_vez:
+        # 2. Reintento de Telegram que este proceso ya encoló: se descarta
+        #    sin Redis y sin gastar fichas del usuario.
+        if producer.seen_locally(event):
             logger.info(
                 "Duplicate update ignored",
                 extra={"channel": event.channel, "message_id": event.message_id},
             )
             return HttpResponse("OK", status=200)
 
-        # 3. Encolado. _job_id da una segunda capa atómica de ~1h
-        #    (keep_result de ARQ). enqueue_job retorna None si el id ya existe.
-        jobs = await get_redis("jobs")
-        job = await jobs.enqueue_job(
-            "process_message",
-            event.to_dict(),
-            _job_id=job_id_for(event),
-        )
+        # 3. Rate limit por usuario: lo que pasa del límite no llega a la cola.
+        with STAGE_DURATION.time(stage="webhook_ratelimit", **labels):
+            decision = await _rate_limit(event)
+        if not decision.allowed:
+            logger.info(
+                "Evento descartado por rate limit",
+                extra={
+                    "channel": event.channel,
+                    "external_user_id": event.external_user_id,
+                    "retry_after": decision.retry_after,
+                },
+            )
+            return _slow_down_response(event, decision)
+
+        # 4. Carga: según la profundidad de la cola, lo no urgente se
+        #    difiere o se rechaza (apps/bot/shedding.py).
+        with STAGE_DURATION.time(stage="webhook_shed", **labels):
+            plan = shedding.plan_for(event, await shedding.current_mode())
+        if plan.busy:
+            shedding.LOAD_SHED.inc(mode=plan.mode, action="busy")
+            logger.info(
+                "Comando rechazado por carga",
+                extra={"channel": event.channel, "message_id": event.message_id},
+            )
+            return _busy_response(event)
 
-        if job is None:
+        # 5. Idempotencia (24h, la de Telegram), doble tap y encolado: un
+        #    script atómico, un round-trip (apps/bot/producer.py). La clave
+        #    se marca antes de encolar: at-most-once, ver el ADR.
+        try:
+            with STAGE_DURATION.time(stage="webhook_enqueue", **labels):
+                outcome = await producer.enqueue_event(
+                    event, defer_ms=plan.defer_ms, coalesce_ms=plan.coalesce_ms
+                )
+        except (CircuitOpen, TimeoutError) as exc:
+            # Redis enfermo: se corta en milisegundos en vez de colgar el
+            # request. Como con cualquier falla de Redis, 200 y Telegram
+            # no reintenta; el traceback no aporta, el breaker ya avisa.
+            logger.warning(
+                "Redis no disponible, update descartado",
+                extra={"channel": event.channel, "error_info": str(exc)},
+            )
+            return HttpResponse("Error procesado", status=200)
+
+        if outcome == producer.DUPLICATE:
+            logger.info(
+                "Duplicate update ignored",
+                extra={"channel": event.channel, "message_id": event.message_id},
+            )
+            return HttpResponse("OK", status=200)
+
+        if outcome == producer.COALESCED:
+            # Doble tap: el primer click hace el trabajo, el resto no toca
+            # ni la cola ni Postgres.
+            logger.info(
+                "Repetido absorbido",
+                extra={"channel": event.channel, "message_id": event.message_id},
+            )
+            if plan.coalesce_ms is not None:
+                shedding.LOAD_SHED.inc(mode=plan.mode, action="coalesced")
+            if not event.is_callback:
+                return HttpResponse("OK", status=200)
+            CALLBACKS_COALESCED.inc(channel=event.channel)
+            return _ack_response(event)
+
+        if outcome == producer.ENQUEUED and plan.defer_ms:
+            shedding.LOAD_SHED.inc(mode=plan.mode, action="deferred")
+
+        if outcome == producer.JOB_EXISTS:
+            # Segunda capa: el _job_id sigue en Redis WORKER_KEEP_RESULT (keep_result de ARQ).
             logger.info(
                 "Job duplicado descartado por ARQ",
                 extra={"job_id": job_id_for(event)},
             )
 
+        if settings.EVENT_RAW_TTL:
+            await _store_raw(event, request.body)
+
+        STAGE_DURATION.observe(time.perf_counter() - start, stage="webhook", **labels)
         return HttpResponse("OK", status=200)
 
     except json.JSONDecodeError:
@@ -1,5 +1,8 @@
+import asyncio
+import contextlib
 import logging
 import os
+import time
 
 import django
 
@@ -8,21 +11,67 @@ os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
 django.setup()
 
 # After setting the environment we can import the rest
+from arq import Retry
 from arq.connections import RedisSettings
+from arq.cron import cron
 from django.conf import settings
 
+from services import outbox
+from services.channels.codec import deserialize_job, serialize_job
 from services.channels.events import ChannelEvent
 from services.channels.registry import build_default_senders, normalize
 from services.channels.senders import get_sender, shutdown_all, startup_all
 from services.channels.telegram import CHANNEL as TELEGRAM
 from services.identities import get_or_create_user_by_channel
-from services.infrastructure.redis_client import close_all
+from services.infrastructure import metrics
+from services.infrastructure.concurrency import AIMDLimiter
+from services.infrastructure.redis_client import close_all, warm_up
 
+from apps.bot import broadcast, deadletter, streams
 from apps.bot.dispatcher import dispatch
 from apps.bot.errors import MENSAJE_ERROR_GENERICO
 
 logger = logging.getLogger(__name__)
 
+MAX_TRIES = 3
+
+# Segundos antes de reintentar, multiplicados por el número de intento.
+RETRY_DELAY = 5
+
+# Separadas por event_type: un click encolado detrás de una ráfaga de
+# mensajes se ve acá, no promediado con ellos.
+EVENT_QUEUE_LAG = metrics.histogram(
+    "bot_event_queue_lag_seconds",
+    "Desde la recepción en el productor hasta que el worker toma el evento",
+    labelnames=("channel", "event_type"),
+)
+EVENT_LATENCY = metrics.histogram(
+    "bot_event_latency_seconds",
+    "Desde la recepción en el productor hasta que el worker termina el evento",
+    labelnames=("channel", "event_type"),
+)
+# Etapas del worker. Lo que pasa adentro del handler se desglosa en
+# bot_handler_duration_seconds (dispatcher) y bot_sender_duration_seconds.
+STAGE_DURATION = metrics.histogram(
+    "bot_stage_duration_seconds",
+    "Duración de cada etapa del pipeline",
+    labelnames=("stage", "channel", "event_type"),
+)
+ACKS_EXPIRED = metrics.counter(
+    "bot_callback_acks_expired_total",
+    "Callbacks que llegaron al worker con el ack ya vencido",
+    labelnames=("channel",),
+)
+
+# ARQ toma hasta WORKER_MAX_JOBS; cuántos de esos tocan la base y la API
+# a la vez lo decide el limitador según la latencia de cada job.
+LIMITER = AIMDLimiter(
+    "process_message",
+    min_limit=settings.WORKER_MIN_JOBS,
+    max_limit=settings.WORKER_MAX_JOBS,
+    latency_target=settings.WORKER_LATENCY_TARGET,
+)
+
 
 # ==================================================================
 #                    CICLO DE VIDA DEL WORKER
@@ -39,12 +88,39 @@ async def startup(ctx):
     logger.info("Encendiendo worker ARQ y registrando senders...")
     build_default_senders()
     await startup_all()
+    await warm_up()
+
+    if settings.WORKER_METRICS_PORT:
+        ctx["metrics_server"] = await metrics.serve(
+            settings.WORKER_METRICS_HOST, settings.WORKER_METRICS_PORT
+        )
+
+    # Backend de streams: los eventos llegan por el consumer group, no por
+    # la cola de ARQ. ARQ sigue corriendo los crons (outbox, broadcast).
+    if streams.enabled():
+        consumer = streams.StreamConsumer(
+            {f.__name__: f for f in WorkerSettings.functions},
+            max_tries=MAX_TRIES,
+            job_timeout=WorkerSettings.job_timeout,
+        )
+        ctx["stream_consumer"] = asyncio.create_task(consumer.run(), name="stream-consumer")
     logger.info("Worker listo para procesar gastos.")
 
 
 async def shutdown(ctx):
     """Se ejecuta al apagar el worker (ej. Ctrl+C)."""
     logger.info("Apagando worker y limpiando sockets...")
+    consumer = ctx.pop("stream_consumer", None)
+    if consumer is not None:
+        # Lo que estaba en vuelo queda pendiente en el grupo: otro
+        # consumidor (o este, al volver) lo reclama.
+        consumer.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await consumer
+    server = ctx.pop("metrics_server", None)
+    if server is not None:
+        server.close()
+        await server.wait_closed()
     await shutdown_all()
     await close_all()
 
@@ -58,57 +134,156 @@ async def process_message(ctx, event: dict):
     Única task del pipeline. Recibe el evento canónico ya normalizado
     por el productor — el worker nunca ve un payload crudo de un canal.
     """
-    # --- Etapa sin efectos laterales ---
-    # Un fallo acá no escribió nada todavía: es seguro reintentar,
-    # así que se propaga para que ARQ haga su trabajo.
-    canonical = ChannelEvent.from_dict(event)
-    sender = get_sender(canonical.channel)
-
-    user, created = await get_or_create_user_by_channel(
-        canonical.channel,
-        canonical.external_user_id,
-        canonical.profile,
-    )
-
-    if created:
-        logger.info(
-            "Usuario creado desde canal",
-            extra={
-                "user_id": user.id,
-                "channel": canonical.channel,
-                "external_user_id": canonical.external_user_id,
-            },
-        )
-
-    # --- Etapa con efectos laterales ---
-    # El handler puede haber creado un gasto antes de fallar. Reintentar
-    # lo duplicaría, así que el error se absorbe acá: se loguea completo
-    # y se le avisa al usuario. Reemplaza al error_handler de PTB.
+    # --- Evento ilegible o canal sin sender ---
+    # Determinístico: reintentar daría lo mismo. Directo al dead-letter.
     try:
-        await dispatch(canonical, user, sender)
-
-    except Exception:
-        logger.error(
-            "Error procesando el evento en el worker",
-            extra={
-                "job_id": ctx.get("job_id"),
-                "job_try": ctx.get("job_try"),
-                "channel": canonical.channel,
-                "message_id": canonical.message_id,
-                "event_type": canonical.type,
-                "user_id": user.id,
-            },
-            exc_info=True,
+        canonical = ChannelEvent.from_dict(event)
+        sender = get_sender(canonical.channel)
+    except Exception as exc:
+        await deadletter.record(
+            event,
+            exc,
+            stage=deadletter.STAGE_PRE_DISPATCH,
+            attempt=ctx.get("job_try") or 1,
+            job_id=ctx.get("job_id"),
         )
+        raise
+
+    labels = {"channel": canonical.channel, "event_type": canonical.type}
+    lag = max(0.0, time.time() - canonical.received_at)
+    EVENT_QUEUE_LAG.observe(lag, **labels)
 
+    if canonical.is_callback:
+        _expire_ack_if_late(canonical, sender, lag)
+
+    # Desde acá el job usa la base y el canal: entra por el limitador.
+    async with LIMITER.slot() as outcome:
         try:
-            await sender.reply(canonical.conversation_id, MENSAJE_ERROR_GENERICO)
-        except Exception:
+            with STAGE_DURATION.time(stage="identity", **labels):
+                user, created = await get_or_create_user_by_channel(
+                    canonical.channel,
+                    canonical.external_user_id,
+                    canonical.profile,
+                )
+        except Exception as exc:
+            # Nada escrito todavía: típicamente la base caída un momento.
+            await _retry_or_dead_letter(ctx, event, exc, stage=deadletter.STAGE_PRE_DISPATCH)
+            raise
+
+        if created:
+            logger.info(
+                "Usuario creado desde canal",
+                extra={
+                    "user_id": user.id,
+                    "channel": canonical.channel,
+                    "external_user_id": canonical.external_user_id,
+                },
+            )
+
+        # --- Etapa con efectos laterales ---
+        # Mensajes: reintentables. El gasto y su respuesta se commitean
+        # juntos en el outbox, y un reproceso del mismo evento lo detecta
+        # (services/outbox.py); los comandos solo leen.
+        # Callbacks: no. Editan estado que no lleva la marca del evento, así
+        # que el error se absorbe: log completo, dead-letter y aviso al usuario.
+        # Reemplaza al error_handler de PTB.
+        try:
+            with STAGE_DURATION.time(stage="dispatch", **labels):
+                await dispatch(canonical, user, sender)
+
+        except Exception as exc:
+            if not canonical.is_callback:
+                await _retry_or_dead_letter(
+                    ctx, event, exc, stage=deadletter.STAGE_DISPATCH, record=False
+                )
+
             logger.error(
-                "No se pudo notificar el error al usuario",
-                extra={"job_id": ctx.get("job_id")},
+                "Error procesando el evento en el worker",
+                extra={
+                    "job_id": ctx.get("job_id"),
+                    "job_try": ctx.get("job_try"),
+                    "channel": canonical.channel,
+                    "message_id": canonical.message_id,
+                    "event_type": canonical.type,
+                    "user_id": user.id,
+                },
                 exc_info=True,
             )
+            outcome.fail()
+            await deadletter.record(
+                event,
+                exc,
+                stage=deadletter.STAGE_DISPATCH,
+                attempt=ctx.get("job_try") or 1,
+                job_id=ctx.get("job_id"),
+            )
+
+            try:
+                await sender.reply(canonical.conversation_id, MENSAJE_ERROR_GENERICO)
+            except Exception:
+                logger.error(
+                    "No se pudo notificar el error al usuario",
+                    extra={"job_id": ctx.get("job_id")},
+                    exc_info=True,
+                )
+
+    EVENT_LATENCY.observe(max(0.0, time.time() - canonical.received_at), **labels)
+
+
+async def _retry_or_dead_letter(
+    ctx, event: dict, exc: Exception, *, stage: str, record: bool = True
+) -> None:
+    """
+    Con intentos restantes levanta Retry: ARQ solo reencola ante Retry (o
+    timeout); cualquier otra excepción termina el job como fallido.
+
+    En el último intento vuelve sin levantar, y el que llama sigue con su
+    camino de fallo. Con record=True deja antes la entrada en el
+    dead-letter stream.
+    """
+    attempt = ctx.get("job_try") or 1
+    if attempt < MAX_TRIES:
+        logger.warning(
+            "Fallo reintentable, se reencola",
+            extra={"job_id": ctx.get("job_id"), "job_try": attempt, "stage": stage},
+            exc_info=True,
+        )
+        raise Retry(defer=RETRY_DELAY * attempt) from exc
+
+    if record:
+        await deadletter.record(
+            event, exc, stage=stage, attempt=attempt, job_id=ctx.get("job_id")
+        )
+
+
+async def relay_outbox(ctx):
+    """Cron: entrega las respuestas del outbox que el camino rápido no pudo."""
+    enviadas = await outbox.relay()
+    if enviadas:
+        logger.info("Outbox: respuestas pendientes entregadas", extra={"sent": enviadas})
+
+
+async def broadcast_tick(ctx):
+    """Cron: avanza los envíos masivos en curso (apps/bot/broadcast.py)."""
+    await broadcast.tick()
+
+
+def _expire_ack_if_late(canonical: ChannelEvent, sender, lag: float) -> None:
+    """
+    Pasado el deadline del canal, el ack solo puede fallar: se omite en vez
+    de gastar un round-trip y un warning. El trabajo real (y el edit del
+    mensaje) se hace igual.
+    """
+    deadline = getattr(sender, "ack_deadline", None)
+    if deadline is None or lag <= deadline:
+        return
+
+    logger.info(
+        "Ack vencido, se omite",
+        extra={"channel": canonical.channel, "message_id": canonical.message_id, "lag": lag},
+    )
+    ACKS_EXPIRED.inc(channel=canonical.channel)
+    canonical.ack_ref = None
 
 
 async def process_telegram_message(ctx, payload):
@@ -140,9 +315,23 @@ class WorkerSettings:
 
     functions = [process_message, process_telegram_message]
 
+    # Barrido del outbox y envíos masivos. unique (por defecto en cron)
+    # evita que dos workers corran el mismo tick.
+    cron_jobs = [
+        cron(relay_outbox, second={0, 10, 20, 30, 40, 50}, run_at_startup=True),
+        cron(broadcast_tick, second=30),
+    ]
+
     on_startup = startup
     on_shutdown = shutdown
 
-    max_jobs = 10
+    # Codec compacto (services/channels/codec.py). Lee también los jobs
+    # pickle encolados antes del deploy: el worker se despliega primero.
+    job_serializer = serialize_job
+    job_deserializer = deserialize_job
+
+    # Techo del limitador adaptativo (LIMITER), no la concurrencia efectiva.
+    max_jobs = settings.WORKER_MAX_JOBS
     job_timeout = 60
-    max_tries = 3
\ No newline at end of file
+    keep_result = settings.WORKER_KEEP_RESULT
+    max_tries = MAX_TRIES
\ No newline at end of file
@@ -0,0 +1,37 @@
+# Generated by Django 5.2 on 2026-10-19 08:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_backfill_channel_identities'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxMessage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('channel', models.CharField(help_text='Canal de salida', max_length=32)),
+                ('conversation_id', models.CharField(help_text='Destino en el canal', max_length=64)),
+                ('event_key', models.CharField(blank=True, help_text='Evento que originó la respuesta (canal:message_id)', max_length=100, null=True, unique=True)),
+                ('text', models.TextField(help_text='Texto ya renderizado')),
+                ('options', models.JSONField(blank=True, help_text='Filas de opciones: [[{id, label}, ...], ...]', null=True)),
+                ('parse_mode', models.CharField(blank=True, default='', max_length=16)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('sent_at', models.DateTimeField(blank=True, help_text='Entregada al canal', null=True)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True, default='')),
+                ('claim', models.UUIDField(blank=True, null=True)),
+                ('locked_until', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Mensaje saliente',
+                'verbose_name_plural': 'Mensajes salientes',
+                'db_table': 'outbox_messages',
+                'indexes': [models.Index(condition=models.Q(('sent_at__isnull', True)), fields=['id'], name='idx_outbox_pending')],
+            },
+        ),
+    ]
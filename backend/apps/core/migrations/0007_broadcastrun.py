@@ -0,0 +1,36 @@
+# Generated by Django 5.2 on 2026-10-19 08:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_outboxmessage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BroadcastRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(help_text='Tipo de envío', max_length=32)),
+                ('key', models.CharField(help_text='Tipo y período', max_length=64, unique=True)),
+                ('status', models.CharField(choices=[('running', 'En curso'), ('done', 'Terminado')], default='running', max_length=10)),
+                ('cursor', models.BigIntegerField(default=0, help_text='Último User.id procesado')),
+                ('total', models.PositiveIntegerField(default=0, help_text='Destinatarios al arrancar')),
+                ('processed', models.PositiveIntegerField(default=0)),
+                ('sent', models.PositiveIntegerField(default=0)),
+                ('skipped', models.PositiveIntegerField(default=0, help_text='Sin contenido o sin canal')),
+                ('failed', models.PositiveIntegerField(default=0, help_text='Quedaron para el relay del outbox')),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Envío masivo',
+                'verbose_name_plural': 'Envíos masivos',
+                'db_table': 'broadcast_runs',
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-19 08:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_broadcastrun'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='category_version',
+            field=models.PositiveIntegerField(default=0, help_text='Sube con cada cambio en sus categorías (o en las globales). Invalida el teclado cacheado'),
+        ),
+    ]
@@ -29,6 +29,10 @@ class User(AbstractUser):
         help_text="Username de Telegram (sin @)",
     )
     notifications_enabled = models.BooleanField(default=True, help_text="Si el usuario quiere recibir notificaciones del bot")
+    category_version = models.PositiveIntegerField(
+        default=0,
+        help_text="Sube con cada cambio en sus categorías (o en las globales). Invalida el teclado cacheado",
+    )
 
     class Meta:
         db_table = "users"
@@ -90,6 +94,52 @@ class Category(models.Model):
             return f"{self.name} (Global)"
         return f"{self.name} - {self.user.username if self.user else 'Sin usuario'}"
 
+    # Lo que muestra el teclado de categorías, y a quién.
+    KEYBOARD_FIELDS = ("name", "is_default", "user_id")
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._keyboard_snapshot = instance._keyboard_fields()
+        return instance
+
+    def save(self, *args, **kwargs):
+        antes = getattr(self, "_keyboard_snapshot", None)
+        super().save(*args, **kwargs)
+        ahora = self._keyboard_fields()
+        if antes != ahora:
+            # Si cambió de dueño, el teclado viejo también queda desactualizado.
+            self._bump_category_version(antes, ahora)
+        self._keyboard_snapshot = ahora
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        self._bump_category_version(self._keyboard_fields())
+        return result
+
+    def _keyboard_fields(self) -> tuple:
+        # __dict__: un campo diferido (only/defer) no dispara otra query.
+        return tuple(self.__dict__.get(field) for field in self.KEYBOARD_FIELDS)
+
+    @classmethod
+    def _bump_category_version(cls, *estados):
+        """
+        Invalida el teclado de categorías cacheado (apps/bot/handlers/helpers.py)
+        de los usuarios que la ven en alguno de `estados` (None = no existía).
+        Una global está en el teclado de todos. Los update()/delete() de
+        queryset no pasan por acá: tienen que subir la versión a mano.
+        """
+        duenos = set()
+        for estado in filter(None, estados):
+            _, is_default, user_id = estado
+            if is_default or user_id is None:
+                User.objects.update(category_version=models.F("category_version") + 1)
+                return
+            duenos.add(user_id)
+        User.objects.filter(id__in=duenos).update(
+            category_version=models.F("category_version") + 1
+        )
+
 
 class Expense(models.Model):
     """
@@ -334,4 +384,100 @@ class ChannelIdentity(models.Model):
         ]
 
     def __str__(self):
-        return f"{self.channel}:{self.external_id} → {self.user.username}"
\ No newline at end of file
+        return f"{self.channel}:{self.external_id} → {self.user.username}"
+
+
+class OutboxMessage(models.Model):
+    """
+    Respuesta del bot pendiente de envío (transactional outbox).
+
+    Se escribe en la misma transacción que el efecto que confirma (el gasto):
+    o existen los dos o ninguno. Un relay la entrega al Sender del canal y
+    marca sent_at. Ver services/outbox.py.
+
+    event_key identifica el evento que la produjo ("canal:message_id"). Es
+    único: reprocesar el mismo evento encuentra la fila y no repite el gasto.
+    """
+
+    channel = models.CharField(max_length=32, help_text="Canal de salida")
+    conversation_id = models.CharField(max_length=64, help_text="Destino en el canal")
+    event_key = models.CharField(
+        max_length=100,
+        unique=True,
+        null=True,
+        blank=True,
+        help_text="Evento que originó la respuesta (canal:message_id)",
+    )
+    text = models.TextField(help_text="Texto ya renderizado")
+    options = models.JSONField(
+        null=True,
+        blank=True,
+        help_text="Filas de opciones: [[{id, label}, ...], ...]",
+    )
+    parse_mode = models.CharField(max_length=16, blank=True, default="")
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True, help_text="Entregada al canal")
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True, default="")
+
+    # Reclamo del relay: quién la está enviando y hasta cuándo. Un relay que
+    # muere deja el reclamo vencido y otro la retoma.
+    claim = models.UUIDField(null=True, blank=True)
+    locked_until = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = "outbox_messages"
+        verbose_name = "Mensaje saliente"
+        verbose_name_plural = "Mensajes salientes"
+        indexes = [
+            models.Index(
+                fields=["id"],
+                condition=models.Q(sent_at__isnull=True),
+                name="idx_outbox_pending",
+            ),
+        ]
+
+    def __str__(self):
+        estado = "enviado" if self.sent_at else "pendiente"
+        return f"#{self.pk} {self.channel}:{self.conversation_id} ({estado})"
+
+
+class BroadcastRun(models.Model):
+    """
+    Una pasada de un envío masivo (resumen mensual, recordatorio de
+    pendientes). Es el checkpoint: cursor es el último User.id procesado,
+    así que una pasada cortada sigue desde ahí. Ver apps/bot/broadcast.py.
+
+    key identifica el período ("monthly_summary:2026-09"): una por período.
+    """
+
+    STATUS_RUNNING = "running"
+    STATUS_DONE = "done"
+    STATUS_CHOICES = [
+        (STATUS_RUNNING, "En curso"),
+        (STATUS_DONE, "Terminado"),
+    ]
+
+    kind = models.CharField(max_length=32, help_text="Tipo de envío")
+    key = models.CharField(max_length=64, unique=True, help_text="Tipo y período")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_RUNNING)
+
+    cursor = models.BigIntegerField(default=0, help_text="Último User.id procesado")
+    total = models.PositiveIntegerField(default=0, help_text="Destinatarios al arrancar")
+    processed = models.PositiveIntegerField(default=0)
+    sent = models.PositiveIntegerField(default=0)
+    skipped = models.PositiveIntegerField(default=0, help_text="Sin contenido o sin canal")
+    failed = models.PositiveIntegerField(default=0, help_text="Quedaron para el relay del outbox")
+
+    started_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = "broadcast_runs"
+        verbose_name = "Envío masivo"
+        verbose_name_plural = "Envíos masivos"
+
+    def __str__(self):
+        return f"{self.key} ({self.processed}/{self.total})"
@@ -0,0 +1,5 @@
+"""
+Benchmarks reproducibles del pipeline. No corren en CI.
+
+Se ejecutan desde backend/:  python -m benchmarks.<modulo>
+"""
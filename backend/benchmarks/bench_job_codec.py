@@ -0,0 +1,97 @@
+"""
+Tamaño y velocidad del codec compacto de jobs contra pickle.
+
+    python -m benchmarks.bench_job_codec [--iterations N]
+
+Mide el camino real: arq.jobs.serialize_job y deserialize_job_raw, con el
+serializer por defecto (pickle del dict completo, raw incluido) y con el
+codec. Sin Redis ni Django.
+"""
+import argparse
+import pickle
+import timeit
+
+from arq.jobs import deserialize_job_raw, serialize_job
+
+from services.channels.codec import deserialize_job, serialize_job as compact_job
+from services.channels.telegram.inbound import normalize
+
+# Updates con la forma real que manda Telegram, incluidos los campos que el
+# worker no lee (chat completo, entities, language_code).
+TEXT_UPDATE = {
+    "update_id": 423934621,
+    "message": {
+        "message_id": 293,
+        "date": 1753439000,
+        "from": {
+            "id": 123456789, "is_bot": False, "first_name": "Ivan",
+            "last_name": "Vallejos", "username": "ivanvallejoss", "language_code": "es",
+        },
+        "chat": {
+            "id": 123456789, "first_name": "Ivan", "last_name": "Vallejos",
+            "username": "ivanvallejoss", "type": "private",
+        },
+        "text": "almuerzo con el equipo 3500",
+    },
+}
+
+CALLBACK_UPDATE = {
+    "update_id": 423934622,
+    "callback_query": {
+        "id": "4382138471298347123",
+        "from": TEXT_UPDATE["message"]["from"],
+        "chat_instance": "-8123749812734981",
+        "data": "cat_select:55:3",
+        "message": {
+            "message_id": 294,
+            "date": 1753439100,
+            "from": {"id": 7000000000, "is_bot": True, "first_name": "SmartExpense",
+                     "username": "SmartExpenseBot"},
+            "chat": TEXT_UPDATE["message"]["chat"],
+            "text": "💾 Gasto guardado — categoría pendiente\n\n💵 Monto: $3.500\n"
+                    "📝 Descripción: almuerzo con el equipo\n📅 25 Jul 2025, 10:30\n\n"
+                    "¿A qué categoría pertenece este gasto?",
+            "reply_markup": {"inline_keyboard": [
+                [{"text": f"Cat{i}", "callback_data": f"cat_select:55:{i}"},
+                 {"text": f"Cat{i + 1}", "callback_data": f"cat_select:55:{i + 1}"}]
+                for i in range(0, 10, 2)
+            ]},
+        },
+    },
+}
+
+
+def _medir(nombre, update, iterations):
+    event = normalize(update, received_at=1753440000.5).to_dict()
+    args = (event,)
+
+    filas = []
+    for etiqueta, ser, deser in (
+        ("pickle", pickle.dumps, pickle.loads),
+        ("codec", compact_job, deserialize_job),
+    ):
+        blob = serialize_job("process_message", args, {}, None, 1, serializer=ser)
+        enc = timeit.timeit(
+            lambda: serialize_job("process_message", args, {}, None, 1, serializer=ser),
+            number=iterations,
+        )
+        dec = timeit.timeit(
+            lambda: deserialize_job_raw(blob, deserializer=deser), number=iterations
+        )
+        filas.append((nombre, etiqueta, len(blob), enc / iterations * 1e6, dec / iterations * 1e6))
+    return filas
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--iterations", type=int, default=20000)
+    opts = parser.parse_args()
+
+    print(f"{'evento':<10}{'formato':<9}{'bytes':>7}{'encode µs':>12}{'decode µs':>12}")
+    for nombre, update in (("message", TEXT_UPDATE), ("callback", CALLBACK_UPDATE)):
+        for fila in _medir(nombre, update, opts.iterations):
+            print(f"{fila[0]:<10}{fila[1]:<9}{fila[2]:>7}{fila[3]:>12.2f}{fila[4]:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Latencia del webhook bajo carga concurrente: encolado en dos pasos contra
+el script atómico de apps/bot/producer.py.
+
+    python -m benchmarks.bench_webhook_enqueue [--requests N] [--concurrency C]
+
+Pega contra el Redis de REDIS_URL (el de desarrollo, o un
+`docker run -p 6379:6379 redis:7`): el round-trip es justamente lo que se
+mide. Usa una cola propia y borra lo que escribió; no lo corras contra el
+Redis de producción.
+
+Cada modo manda N updates distintos por la vista real (webhook), de a C a
+la vez, y reporta p50 / p99 / máximo del tiempo de respuesta:
+
+  - dos_pasos: el camino anterior. SET NX en cache + enqueue_job en jobs.
+  - script:    producer.enqueue_event, un EVALSHA.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+from unittest.mock import patch
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.test import RequestFactory  # noqa: E402
+
+from apps.bot import producer  # noqa: E402
+from apps.bot.views import webhook  # noqa: E402
+from services.channels.events import job_id_for  # noqa: E402
+from services.infrastructure.redis_client import close_all, get_redis  # noqa: E402
+
+QUEUE = "bench:webhook"
+
+
+async def _dos_pasos(event, *, function="process_message", defer_ms=0, coalesce_ms=None):
+    """El webhook antes del script, tal cual: dos pools, dos pasos."""
+    cache = await get_redis("cache")
+    if not await cache.set(
+        f"idempotency:{event.channel}:{event.message_id}", "1",
+        ex=producer.IDEMPOTENCY_TTL, nx=True,
+    ):
+        return producer.DUPLICATE
+    jobs = await get_redis("jobs")
+    job = await jobs.enqueue_job(
+        function, event.to_dict(), _job_id=job_id_for(event), _queue_name=QUEUE
+    )
+    return producer.ENQUEUED if job else producer.JOB_EXISTS
+
+
+def _update(update_id: int) -> bytes:
+    return json.dumps({
+        "update_id": update_id,
+        "message": {
+            "message_id": 1,
+            "date": 1753439000,
+            "from": {"id": 111, "first_name": "Bench"},
+            "chat": {"id": 111, "type": "private"},
+            "text": "almuerzo 3500",
+        },
+    }).encode()
+
+
+async def _medir(enqueue, base: int, requests: int, concurrency: int) -> list[float]:
+    rf = RequestFactory()
+    headers = {"HTTP_X_TELEGRAM_BOT_API_SECRET_TOKEN": settings.TELEGRAM_WEBHOOK_TOKEN}
+    semaforo = asyncio.Semaphore(concurrency)
+    tiempos = []
+
+    async def _uno(update_id):
+        request = rf.post("/bot/telegram/webhook/", data=_update(update_id),
+                          content_type="application/json", **headers)
+        async with semaforo:
+            start = time.perf_counter()
+            await webhook(request)
+            tiempos.append(time.perf_counter() - start)
+
+    with patch.object(producer, "enqueue_event", new=enqueue):
+        await asyncio.gather(*(_uno(base + i) for i in range(requests)))
+    return tiempos
+
+
+async def _limpiar(base: int, requests: int) -> None:
+    cache, jobs = await get_redis("cache"), await get_redis("jobs")
+    ids = [f"telegram:{base + i}" for i in range(requests)]
+    await cache.delete(*(f"idempotency:{i}" for i in ids))
+    await jobs.delete(*(f"arq:job:{i}" for i in ids), QUEUE)
+
+
+async def main_async(opts) -> None:
+    # Todos los updates son del mismo usuario: con el rate limit prendido,
+    # pasada la ráfaga nada llegaría al encolado que se quiere medir.
+    settings.RATE_LIMIT_BURST = 0
+    jobs = await get_redis("jobs")
+    cola_original = jobs.default_queue_name
+    jobs.default_queue_name = QUEUE         # el script encola en la cola del bench
+    try:
+        print(f"{'modo':<11}{'req':>7}{'conc':>6}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+        base = int(time.time()) * 1000
+        for nombre, enqueue in (("dos_pasos", _dos_pasos), ("script", producer.enqueue_event)):
+            # Calentamiento: pools abiertos y script cargado.
+            await _medir(enqueue, base, 50, opts.concurrency)
+            await _limpiar(base, 50)
+            base += 50
+
+            tiempos = sorted(await _medir(enqueue, base, opts.requests, opts.concurrency))
+            await _limpiar(base, opts.requests)
+            base += opts.requests
+
+            p99 = tiempos[int(len(tiempos) * 0.99) - 1]
+            print(
+                f"{nombre:<11}{opts.requests:>7}{opts.concurrency:>6}"
+                f"{statistics.median(tiempos) * 1000:>10.2f}{p99 * 1000:>10.2f}"
+                f"{tiempos[-1] * 1000:>10.2f}"
+            )
+    finally:
+        jobs.default_queue_name = cola_original
+        await close_all()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -11,4 +11,16 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Después de get_asgi_application: necesitan los settings cargados.
+from services.infrastructure import redis_client  # noqa: E402
+from services.infrastructure.lifespan import Lifespan  # noqa: E402
+
+# Pools de Redis del loop del servidor: se abren al arrancar y se cierran
+# al apagar, como en el worker.
+application = Lifespan(
+    django_application,
+    on_startup=[redis_client.warm_up],
+    on_shutdown=[redis_client.close_all],
+)
@@ -29,9 +29,108 @@ JWT_SECRET_KEY = env("JWT_SECRET_KEY")
 
 TELEGRAM_TOKEN = env("TELEGRAM_BOT_TOKEN")
 TELEGRAM_WEBHOOK_TOKEN = env('TELEGRAM_WEBHOOK_TOKEN')
+# Base de la Bot API para los envíos. Vacío = api.telegram.org. Para el
+# stand-in local (manage.py telegram_standin): http://127.0.0.1:8081/bot
+TELEGRAM_API_URL = env('TELEGRAM_API_URL', default='')
 
 REDIS_URL = env('REDIS_URL', default='redis://localhost:6379/0')
 
+# Todos los purposes (jobs, state, cache) en la db de REDIS_URL, con un
+# solo pool. Para Redis sin SELECT (administrados, Cluster).
+REDIS_SHARED_DB = env.bool('REDIS_SHARED_DB', default=False)
+
+# Pools de services/infrastructure/redis_client.py, uno por event loop y
+# por database. Conexiones como máximo, segundos de espera por una libre,
+# cada cuánto se verifica (PING) una conexión quieta y a los cuántos
+# segundos ociosa se cierra (0 = nunca).
+REDIS_MAX_CONNECTIONS = env.int('REDIS_MAX_CONNECTIONS', default=50)
+REDIS_POOL_TIMEOUT = env.float('REDIS_POOL_TIMEOUT', default=2.0)
+REDIS_HEALTH_CHECK_INTERVAL = env.int('REDIS_HEALTH_CHECK_INTERVAL', default=30)
+REDIS_IDLE_TIMEOUT = env.float('REDIS_IDLE_TIMEOUT', default=300.0)
+
+# Llamadas del camino caliente a Redis (redis_client.guarded): tope por
+# llamada en segundos, umbral de "lenta" para el circuit breaker y cuánto
+# queda abierto. Redis sano contesta en menos de un milisegundo.
+REDIS_CALL_TIMEOUT = env.float('REDIS_CALL_TIMEOUT', default=0.5)
+REDIS_SLOW_CALL = env.float('REDIS_SLOW_CALL', default=0.1)
+REDIS_BREAKER_OPEN_FOR = env.float('REDIS_BREAKER_OPEN_FOR', default=10.0)
+
+# El update crudo no viaja en el job (ver services/channels/codec.py).
+# Con un valor > 0 el webhook lo guarda aparte, en la db de cache, bajo
+# raw:{channel}:{message_id} durante esa cantidad de segundos. 0 = descartar.
+EVENT_RAW_TTL = env.int('EVENT_RAW_TTL', default=0)
+
+# Backend del pipeline: "arq" (cola de ARQ) o "streams" (Redis Streams con
+# consumer group, apps/bot/streams.py). Con streams: entradas por stream
+# (MAXLEN aproximado), segundos pendiente antes de que otro consumidor la
+# reclame (más que el job_timeout de 60s) y cuánto bloquea XREADGROUP.
+PIPELINE_BACKEND = env('PIPELINE_BACKEND', default='arq')
+STREAM_MAXLEN = env.int('STREAM_MAXLEN', default=100_000)
+STREAM_CLAIM_IDLE = env.float('STREAM_CLAIM_IDLE', default=90.0)
+STREAM_BLOCK_MS = env.int('STREAM_BLOCK_MS', default=5000)
+
+# Clicks repetidos del mismo botón (doble/triple tap) dentro de esta
+# ventana, en milisegundos, se ackean en el webhook sin encolarse. 0 = apagado.
+CALLBACK_COALESCE_MS = env.int('CALLBACK_COALESCE_MS', default=2000)
+
+# Claves de idempotencia que cada proceso web recuerda en memoria para
+# descartar reintentos sin ir a Redis (apps/bot/producer.py). 0 = apagado.
+IDEMPOTENCY_LOCAL_SIZE = env.int('IDEMPOTENCY_LOCAL_SIZE', default=50_000)
+
+# Tamaño máximo, en bytes, del cuerpo que acepta el webhook. Más grande:
+# 413 sin parsear. Un update de texto ronda 1 KiB. 0 = sin límite.
+WEBHOOK_MAX_BODY = env.int('WEBHOOK_MAX_BODY', default=64 * 1024)
+
+# Rate limit por usuario en el webhook (services/infrastructure/ratelimit.py):
+# ráfaga de RATE_LIMIT_BURST eventos, que se recupera a RATE_LIMIT_RATE
+# eventos por segundo. Lo que pasa del límite se descarta con un aviso.
+# Cualquiera de los dos en 0 = apagado.
+RATE_LIMIT_BURST = env.int('RATE_LIMIT_BURST', default=20)
+RATE_LIMIT_RATE = env.float('RATE_LIMIT_RATE', default=0.5)
+
+# Degradación por profundidad de la cola (apps/bot/shedding.py). Con
+# SHED_DEGRADED_DEPTH jobs vencidos sin tomar, los comandos no urgentes se
+# difieren SHED_DEFER_SECONDS y los repetidos se coalescen en SHED_COALESCE_MS;
+# con SHED_OVERLOADED_DEPTH, esos comandos se rechazan con "ocupado".
+# Umbral en 0 = ese modo apagado.
+SHED_DEGRADED_DEPTH = env.int('SHED_DEGRADED_DEPTH', default=500)
+SHED_OVERLOADED_DEPTH = env.int('SHED_OVERLOADED_DEPTH', default=2000)
+SHED_SAMPLE_SECONDS = env.float('SHED_SAMPLE_SECONDS', default=1.0)
+SHED_DEFER_SECONDS = env.int('SHED_DEFER_SECONDS', default=30)
+SHED_COALESCE_MS = env.int('SHED_COALESCE_MS', default=10_000)
+SHED_NON_URGENT_COMMANDS = env.list('SHED_NON_URGENT_COMMANDS', default=['history', 'stats'])
+
+# Envíos masivos (apps/bot/broadcast.py): tipos que el cron programa solo
+# (monthly_summary, pending_reminder). Vacío = ninguno; igual se pueden
+# lanzar a mano con manage.py broadcast start.
+BROADCASTS = env.list('BROADCASTS', default=[])
+BROADCAST_BATCH_SIZE = env.int('BROADCAST_BATCH_SIZE', default=200)
+
+# Concurrencia del worker (services/infrastructure/concurrency.py).
+# WORKER_MAX_JOBS es el techo (max_jobs de ARQ); el límite efectivo se
+# ajusta entre el mínimo y ese techo según la latencia de cada job.
+WORKER_MAX_JOBS = env.int('WORKER_MAX_JOBS', default=10)
+WORKER_MIN_JOBS = env.int('WORKER_MIN_JOBS', default=2)
+WORKER_LATENCY_TARGET = env.float('WORKER_LATENCY_TARGET', default=2.0)
+
+# Segundos que ARQ guarda el resultado de cada job (arq:result:*). Mientras
+# está, un _job_id repetido no se vuelve a encolar: es la segunda capa de
+# idempotencia. Ver cuánto ocupa con manage.py redis_memory.
+WORKER_KEEP_RESULT = env.int('WORKER_KEEP_RESULT', default=3600)
+
+# Pool de conexiones hacia la Bot API (services/channels/telegram/transport.py).
+# Por defecto una conexión por job concurrente. Keep-alive en segundos;
+# HTTP/2 solo si está instalado h2 (python-telegram-bot[http2]).
+TELEGRAM_POOL_SIZE = env.int('TELEGRAM_POOL_SIZE', default=WORKER_MAX_JOBS)
+TELEGRAM_KEEPALIVE = env.float('TELEGRAM_KEEPALIVE', default=30.0)
+TELEGRAM_HTTP2 = env.bool('TELEGRAM_HTTP2', default=True)
+
+# Métricas Prometheus. El worker las sirve en su propio puerto (0 = apagado);
+# el proceso web en /metrics/, solo con METRICS_TOKEN como Bearer (vacío = 404).
+WORKER_METRICS_HOST = env('WORKER_METRICS_HOST', default='127.0.0.1')
+WORKER_METRICS_PORT = env.int('WORKER_METRICS_PORT', default=0)
+METRICS_TOKEN = env('METRICS_TOKEN', default='')
+
 # ----------------------------
 #   DataBase configuration
 # ----------------------------
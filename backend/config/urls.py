@@ -3,16 +3,27 @@ from django.conf import settings
 from django.conf.urls.static import static
 from django.contrib import admin
 from django.contrib.staticfiles.urls import staticfiles_urlpatterns
-from django.http import JsonResponse
+from django.http import Http404, HttpResponse, JsonResponse
 from django.urls import include, path
 
+from services.infrastructure import metrics
+
 
 def health(request):
     return JsonResponse({"status": "ok"})
 
 
+def metrics_view(request):
+    """Métricas del proceso web (webhook). El worker expone las suyas aparte."""
+    token = settings.METRICS_TOKEN
+    if not token or request.headers.get("Authorization") != f"Bearer {token}":
+        raise Http404
+    return HttpResponse(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+
 urlpatterns = [
     path("health/", health),
+    path("metrics/", metrics_view),
     path("admin/", admin.site.urls),
     path("bot/", include("apps.bot.urls")),
     path("dashboard/", include("apps.web.urls")),
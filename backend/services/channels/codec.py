@@ -0,0 +1,148 @@
+"""
+Codec compacto de jobs para ARQ.
+
+ARQ serializa cada job con pickle por defecto, y el evento canónico viaja
+como dict completo: nombres de campo repetidos en cada job y el update
+crudo de Telegram en `raw`, que el worker nunca lee en el camino caliente.
+
+Formato en Redis:
+
+    MAGIC (1 byte) + versión (1 byte) + msgpack del job de ARQ
+
+El job de ARQ conserva su forma ({t, f, a, k, et}); lo único que cambia es
+el primer argumento de las tasks de EVENT_FUNCTIONS, que viaja como array
+posicional con los campos de la versión y sin `raw`.
+
+El contrato con el productor y con el Bridge Go sigue siendo un dict: la
+compactación ocurre solo en el cable. Jobs encolados con pickle antes del
+deploy se siguen leyendo (ver deserialize_job).
+
+ARQ usa el mismo serializer para los resultados, y el de un job fallido
+es la excepción. msgpack no sabe codificarla: viaja como extensión
+EXC_EXT con [módulo, clase, args] y se reconstruye al leer. Si la clase
+no se puede importar o instanciar, vuelve como JobError con el nombre y
+el mensaje originales.
+"""
+import importlib
+import pickle
+from typing import Any
+
+import msgpack
+
+# 0xC1 es el único byte que msgpack declara "never used", y pickle (protocolo
+# 2+) arranca siempre con 0x80: ningún job válido de los dos formatos
+# empieza con este byte.
+MAGIC = b"\xc1"
+
+CODEC_VERSION = 2
+
+# Tipo de extensión de msgpack para excepciones (resultados de jobs fallidos).
+EXC_EXT = 1
+
+_SCALARS = (str, int, float, bool, type(None))
+
+# Campos del evento por versión, en orden. Agregar un campo = versión nueva;
+# las viejas se conservan para leer jobs en vuelo durante el deploy.
+EVENT_FIELDS: dict[int, tuple[str, ...]] = {
+    1: (
+        "channel",
+        "external_user_id",
+        "text",
+        "message_id",
+        "timestamp",
+        "received_at",
+        "type",
+        "conversation_id",
+        "edit_ref",
+        "ack_ref",
+        "profile",
+    ),
+}
+# v2: + state_hint. Un job v1 en vuelo se lee con state_hint=None.
+EVENT_FIELDS[2] = (*EVENT_FIELDS[1], "state_hint")
+
+# Tasks cuyo primer argumento es un evento canónico.
+EVENT_FUNCTIONS = frozenset({"process_message"})
+
+
+class UnsupportedCodecVersion(ValueError):
+    """Job escrito por un productor más nuevo que este worker."""
+
+
+class JobError(Exception):
+    """Excepción de un resultado cuya clase original no se pudo reconstruir."""
+
+
+def pack_event(event: dict[str, Any], version: int = CODEC_VERSION) -> list:
+    """Dict del evento → array posicional. `raw` se descarta."""
+    return [event.get(name) for name in _fields(version)]
+
+
+def unpack_event(values: list, version: int = CODEC_VERSION) -> dict[str, Any]:
+    """Array posicional → dict aceptado por ChannelEvent.from_dict."""
+    return dict(zip(_fields(version), values))
+
+
+def serialize_job(data: dict[str, Any]) -> bytes:
+    """job_serializer de ARQ. También se usa para los resultados."""
+    packed = msgpack.packb(_compact(data), use_bin_type=True, default=_encode_exception)
+    return MAGIC + bytes([CODEC_VERSION]) + packed
+
+
+def deserialize_job(blob: bytes) -> dict[str, Any]:
+    """job_deserializer de ARQ. Acepta el formato compacto y el pickle previo."""
+    if blob[:1] != MAGIC:
+        # Ventana de migración: jobs encolados con el serializer por defecto.
+        # Se elimina cuando la cola y los resultados (keep_result) se drenen.
+        return pickle.loads(blob)
+
+    version = blob[1]
+    data = msgpack.unpackb(
+        blob[2:], raw=False, strict_map_key=False, ext_hook=_decode_exception
+    )
+    return _expand(data, version)
+
+
+def _fields(version: int) -> tuple[str, ...]:
+    try:
+        return EVENT_FIELDS[version]
+    except KeyError:
+        raise UnsupportedCodecVersion(f"Versión de codec desconocida: {version}") from None
+
+
+def _compact(data: dict[str, Any]) -> dict[str, Any]:
+    args = data.get("a")
+    if data.get("f") in EVENT_FUNCTIONS and args and isinstance(args[0], dict):
+        data = {**data, "a": [pack_event(args[0]), *args[1:]]}
+    return data
+
+
+def _expand(data: dict[str, Any], version: int) -> dict[str, Any]:
+    args = data.get("a")
+    if data.get("f") in EVENT_FUNCTIONS and args and isinstance(args[0], list):
+        data["a"] = [unpack_event(args[0], version), *args[1:]]
+    return data
+
+
+def _encode_exception(obj: Any) -> msgpack.ExtType:
+    if not isinstance(obj, BaseException):
+        raise TypeError(f"can not serialize {type(obj).__name__!r}")
+    cls = type(obj)
+    args = [a if isinstance(a, _SCALARS) else str(a) for a in obj.args]
+    payload = msgpack.packb([cls.__module__, cls.__qualname__, args], use_bin_type=True)
+    return msgpack.ExtType(EXC_EXT, payload)
+
+
+def _decode_exception(code: int, payload: bytes) -> Any:
+    if code != EXC_EXT:
+        return msgpack.ExtType(code, payload)
+    module, qualname, args = msgpack.unpackb(payload, raw=False)
+    try:
+        cls = importlib.import_module(module)
+        for name in qualname.split("."):
+            cls = getattr(cls, name)
+        if isinstance(cls, type) and issubclass(cls, BaseException):
+            return cls(*args)
+    except Exception:
+        pass
+    return JobError(f"{qualname}: {', '.join(map(str, args))}")
@@ -31,6 +31,18 @@ class ChannelEvent:
     ack_ref: str | None = None
     profile: dict[str, Any] = field(default_factory=dict)
 
+    # Epoch (con fracción) en que el productor recibió el evento. A diferencia
+    # de timestamp — que para mensajes es la hora de envío que informa el
+    # canal — mide la latencia real del pipeline. Jobs encolados antes de
+    # que existiera el campo caen a timestamp.
+    received_at: float = 0.0
+
+    # Lo pone el productor al encolar (apps/bot/producer.py): False = el
+    # usuario no tenía estado de conversación pendiente ni un callback en
+    # vuelo que pudiera crearlo; el worker se ahorra la lectura. None = no
+    # se sabe (otro productor, job viejo) y se lee como siempre.
+    state_hint: bool | None = None
+
     def __post_init__(self):
         if not self.channel:
             raise InvalidEvent("channel es obligatorio")
@@ -46,6 +58,7 @@ class ChannelEvent:
         self.message_id = str(self.message_id)
         self.conversation_id = str(self.conversation_id or self.external_user_id)
         self.timestamp = int(self.timestamp)
+        self.received_at = float(self.received_at or self.timestamp)
 
     @property
     def is_callback(self) -> bool:
@@ -61,6 +74,9 @@ class ChannelEvent:
 
         Lanza TypeError si el dict trae claves desconocidas — es intencional:
         detecta jobs en vuelo con un esquema viejo en vez de ignorarlos.
+
+        Acepta los dos formatos en vuelo: el dict completo de los jobs pickle
+        (con `raw`) y el que expande el codec compacto (sin `raw`).
         """
         return cls(**data)
 
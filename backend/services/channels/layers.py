@@ -0,0 +1,151 @@
+"""
+Capas alrededor de un Sender.
+
+Cada capa implementa el mismo protocolo y delega en el sender de adentro,
+así se apilan sin que el worker ni los handlers se enteren:
+
+    register(InstrumentedSender(TelegramSender(token)))
+
+Los atributos que la capa no define (ack_deadline, por ejemplo) se leen
+del sender envuelto.
+"""
+import time
+
+from services.channels.senders import RetryHint, Rows, Sender
+from services.infrastructure import metrics
+from services.infrastructure.circuit import CircuitBreaker, CircuitOpen
+
+SENDER_DURATION = metrics.histogram(
+    "bot_sender_duration_seconds",
+    "Duración de cada llamada al canal de salida",
+    labelnames=("channel", "method", "outcome"),
+)
+
+
+class SenderLayer:
+    """Base: delega todo. Las subclases redefinen lo que les interesa."""
+
+    def __init__(self, inner: Sender):
+        self.inner = inner
+        self.channel = inner.channel
+
+    def __getattr__(self, name):
+        # Solo se llama para atributos que la capa no tiene.
+        return getattr(self.inner, name)
+
+    async def startup(self) -> None:
+        await self.inner.startup()
+
+    async def shutdown(self) -> None:
+        await self.inner.shutdown()
+
+    async def reply(
+        self,
+        external_user_id: str,
+        text: str,
+        *,
+        options: Rows | None = None,
+        parse_mode: str | None = None,
+    ) -> str | None:
+        return await self.inner.reply(
+            external_user_id, text, options=options, parse_mode=parse_mode
+        )
+
+    async def edit(
+        self,
+        external_user_id: str,
+        edit_ref: str,
+        *,
+        text: str | None = None,
+        options: Rows | None = None,
+        parse_mode: str | None = None,
+    ) -> None:
+        await self.inner.edit(
+            external_user_id, edit_ref, text=text, options=options, parse_mode=parse_mode
+        )
+
+    async def ack(self, ack_ref: str, text: str = "", *, alert: bool = False) -> None:
+        await self.inner.ack(ack_ref, text, alert=alert)
+
+
+class InstrumentedSender(SenderLayer):
+    """
+    Histograma de duración por método y resultado (ok / error).
+
+    ack pasa derecho: por contrato nunca propaga (TelegramSender.ack loguea
+    y se traga el error), así que todo ack saldría "ok".
+    """
+
+    async def reply(self, external_user_id, text, *, options=None, parse_mode=None):
+        return await self._timed(
+            "reply", super().reply(external_user_id, text, options=options, parse_mode=parse_mode)
+        )
+
+    async def edit(self, external_user_id, edit_ref, *, text=None, options=None, parse_mode=None):
+        await self._timed(
+            "edit",
+            super().edit(external_user_id, edit_ref, text=text, options=options, parse_mode=parse_mode),
+        )
+
+    async def _timed(self, method: str, call):
+        start = time.perf_counter()
+        outcome = "error"
+        try:
+            result = await call
+            outcome = "ok"
+            return result
+        finally:
+            SENDER_DURATION.observe(
+                time.perf_counter() - start,
+                channel=self.channel,
+                method=method,
+                outcome=outcome,
+            )
+
+
+class CircuitBreakerSender(SenderLayer):
+    """
+    Corta las llamadas al canal cuando su API se degrada
+    (services/infrastructure/circuit.py), en vez de que cada job espere
+    los timeouts HTTP. Un breaker por canal: bot_circuit_state{circuit="sender:<canal>"}.
+
+    Con el circuito abierto, reply/edit levantan CircuitOpen al
+    instante. retry_hint lo traduce a un retry_after hasta la próxima
+    prueba, así el throttle difiere el envío y el outbox deja la fila para
+    el relay (services/outbox.py): nada se pierde, se manda al volver.
+
+    Cuenta como falla lo que el canal clasifica como transitorio (red,
+    timeouts, 5xx). Un 400 o un 429 muestran que la API responde.
+
+    ack pasa derecho y no cuenta: nunca propaga, así que un ack fallido se
+    vería como éxito (y cerraría el circuito siendo la prueba), y con el
+    circuito abierto levantaría CircuitOpen, que el contrato no permite.
+    """
+
+    def __init__(self, inner: Sender, breaker: CircuitBreaker | None = None):
+        super().__init__(inner)
+        self.breaker = breaker or CircuitBreaker(f"sender:{inner.channel}")
+
+    async def reply(self, external_user_id, text, *, options=None, parse_mode=None):
+        async with self.breaker.guard(is_failure=self._is_failure):
+            return await super().reply(external_user_id, text, options=options, parse_mode=parse_mode)
+
+    async def edit(self, external_user_id, edit_ref, *, text=None, options=None, parse_mode=None):
+        async with self.breaker.guard(is_failure=self._is_failure):
+            await super().edit(
+                external_user_id, edit_ref, text=text, options=options, parse_mode=parse_mode
+            )
+
+    def retry_hint(self, exc: Exception) -> RetryHint | None:
+        if isinstance(exc, CircuitOpen):
+            return RetryHint(retry_after=exc.retry_after)
+        inner = getattr(self.inner, "retry_hint", None)
+        return inner(exc) if inner else None
+
+    def _is_failure(self, exc: Exception) -> bool:
+        inner = getattr(self.inner, "retry_hint", None)
+        if inner is None:
+            return True
+        hint = inner(exc)
+        # None: error del pedido. retry_after: rate limit. Ninguno es la API caída.
+        return hint is not None and hint.retry_after is None
@@ -39,7 +39,12 @@ def build_default_senders() -> None:
 
     Agregar WhatsApp = dos líneas acá. El worker no se entera.
     """
+    from services.channels.layers import CircuitBreakerSender, InstrumentedSender
     from services.channels.senders import register
     from services.channels.telegram.outbound import build_sender as build_telegram
+    from services.channels.throttle import ThrottledSender
 
-    register(build_telegram())
\ No newline at end of file
+    # El throttle va afuera: la instrumentación mide la llamada a la API,
+    # no la espera en la cola. El breaker, entre los dos: ve cada intento
+    # real y, abierto, el throttle difiere con su retry_after.
+    register(ThrottledSender(CircuitBreakerSender(InstrumentedSender(build_telegram()))))
\ No newline at end of file
@@ -37,6 +37,21 @@ def grid(options: list[Option], columns: int = 2) -> Rows:
     return [options[i:i + columns] for i in range(0, len(options), columns)]
 
 
+@dataclass(frozen=True)
+class RetryHint:
+    """
+    Cómo reintentar un envío que falló. Lo da el sender con
+    `retry_hint(exc)`; None significa error permanente.
+
+    retry_after: segundos que el canal pidió esperar (429). None = backoff
+        propio.
+    may_have_landed: el pedido pudo haberse procesado (timeout de lectura,
+        5xx). Solo se reintenta si la operación es idempotente.
+    """
+    retry_after: float | None = None
+    may_have_landed: bool = False
+
+
 class OptionsNotSupported(ValueError):
     """
     El canal no puede renderizar esta cantidad/forma de opciones.
@@ -82,6 +97,9 @@ class Sender(Protocol):
         """
         Acusa recibo de una acción. Canales sin este concepto: no-op.
         Nunca debe propagar excepción: fallar el ack no puede tumbar el job.
+
+        Un canal cuyo ack caduca declara `ack_deadline` (segundos desde la
+        recepción). El worker no intenta acks vencidos: pasa ack_ref=None.
         """
         ...
 
@@ -18,7 +18,7 @@ from services.channels.events import EVENT_CALLBACK, EVENT_MESSAGE, ChannelEvent
 from services.channels.telegram import CHANNEL
 
 
-def normalize(payload: dict[str, Any], *, received_at: int | None = None) -> ChannelEvent | None:
+def normalize(payload: dict[str, Any], *, received_at: float | None = None) -> ChannelEvent | None:
     """
     Args:
         payload: Update crudo de Telegram
@@ -27,7 +27,7 @@ def normalize(payload: dict[str, Any], *, received_at: int | None = None) -> Cha
     Returns:
         ChannelEvent, o None si el update no es procesable.
     """
-    received_at = int(received_at if received_at is not None else time.time())
+    received_at = float(received_at if received_at is not None else time.time())
 
     update_id = payload.get("update_id")
     if update_id is None:
@@ -47,6 +47,52 @@ def normalize(payload: dict[str, Any], *, received_at: int | None = None) -> Cha
     return None
 
 
+def slim(payload: dict[str, Any]) -> dict[str, Any]:
+    """
+    Solo lo que lee normalize. Un callback trae el mensaje original completo
+    (texto, entities, el teclado entero); un mensaje, el chat y el usuario
+    con todos sus campos. El resto se suelta acá, antes de que el evento lo
+    copie a `raw` y to_dict() lo vuelva a copiar.
+    """
+    slimmed: dict[str, Any] = {"update_id": payload.get("update_id")}
+
+    query = payload.get("callback_query")
+    if isinstance(query, dict):
+        source = query.get("message") if isinstance(query.get("message"), dict) else {}
+        slimmed["callback_query"] = {
+            "id": query.get("id"),
+            "data": query.get("data"),
+            "from": _slim_user(query.get("from")),
+            "message": {
+                "message_id": source.get("message_id"),
+                "chat": _slim_chat(source.get("chat")),
+            },
+        }
+        return slimmed
+
+    message = payload.get("message")
+    if isinstance(message, dict):
+        slimmed["message"] = {
+            "text": message.get("text"),
+            "date": message.get("date"),
+            "from": _slim_user(message.get("from")),
+            "chat": _slim_chat(message.get("chat")),
+        }
+    return slimmed
+
+
+def _slim_user(user) -> dict[str, Any] | None:
+    if not isinstance(user, dict):
+        return None
+    return {k: user[k] for k in ("id", "username", "first_name", "last_name") if k in user}
+
+
+def _slim_chat(chat) -> dict[str, Any] | None:
+    if not isinstance(chat, dict):
+        return None
+    return {"id": chat.get("id")}
+
+
 def _from_message(payload, message, message_id, received_at) -> ChannelEvent | None:
     sender = message.get("from") or {}
     external_user_id = sender.get("id")
@@ -63,11 +109,12 @@ def _from_message(payload, message, message_id, received_at) -> ChannelEvent | N
         text=message["text"],
         message_id=message_id,
         # Telegram provee la hora de envío del mensaje.
-        timestamp=message.get("date") or received_at,
+        timestamp=message.get("date") or int(received_at),
         edit_ref=None,
         ack_ref=None,
         profile=_profile(sender),
         raw=payload,
+        received_at=received_at,
     )
 
 
@@ -93,11 +140,12 @@ def _from_callback_query(payload, message_id, received_at) -> ChannelEvent | Non
         text=data,
         message_id=message_id,
         # Telegram no informa cuándo se apretó el botón. Usamos la recepción.
-        timestamp=received_at,
+        timestamp=int(received_at),
         edit_ref=_str_or_none(source_message.get("message_id")),
         ack_ref=_str_or_none(query.get("id")),
         profile=_profile(sender),
         raw=payload,
+        received_at=received_at,
     )
 
 
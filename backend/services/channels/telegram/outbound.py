@@ -6,11 +6,13 @@ HTTP de la API — no como dispatcher (ver D1). El worker nunca lo importa.
 """
 import logging
 
+import httpx
 from telegram import Bot, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.error import BadRequest
+from telegram.error import BadRequest, NetworkError, RetryAfter
 
-from services.channels.senders import Option, Rows
+from services.channels.senders import Option, RetryHint, Rows
 from services.channels.telegram import CHANNEL
+from services.channels.telegram.transport import PoolConfig, build_requests
 
 logger = logging.getLogger(__name__)
 
@@ -22,10 +24,27 @@ _NOT_MODIFIED = "message is not modified"
 class TelegramSender:
     channel = CHANNEL
 
-    def __init__(self, token: str):
+    # answerCallbackQuery caduca a los ~60s de apretado el botón. Con margen
+    # para el round-trip: pasado este punto el worker ni lo intenta.
+    ack_deadline = 55
+
+    # Límites de envío de la Bot API (ver services/channels/throttle.py):
+    # ~30 mensajes/s en total y ~1/s por chat, con ráfagas cortas toleradas.
+    rate_limit = 30.0
+    chat_rate_limit = 1.0
+    chat_burst = 3
+
+    def __init__(
+        self, token: str, *, base_url: str | None = None, pool: PoolConfig | None = None
+    ):
         if not token:
             raise ValueError("TELEGRAM_TOKEN no está configurado")
-        self._bot = Bot(token=token)
+        # pool: tamaño, keep-alive y HTTP/2 (services/channels/telegram/transport.py).
+        kwargs = build_requests(pool or PoolConfig())
+        # base_url: otra Bot API (el stand-in local, services/channels/telegram/standin.py).
+        if base_url:
+            kwargs["base_url"] = base_url
+        self._bot = Bot(token=token, **kwargs)
 
     async def startup(self) -> None:
         await self._bot.initialize()
@@ -86,7 +105,11 @@ class TelegramSender:
         answerCallbackQuery caduca a los ~60s. Un ack vencido no debe
         propagar: el trabajo real ya se hizo. Hoy PTB lo tapa con el
         error_handler; acá lo hacemos explícito.
+
+        ack_ref=None es un ack que el worker ya dio por vencido: no-op.
         """
+        if not ack_ref:
+            return
         try:
             await self._bot.answer_callback_query(
                 callback_query_id=ack_ref,
@@ -96,6 +119,24 @@ class TelegramSender:
         except Exception:
             logger.warning("Fallo el ack del callback", extra={"ack_ref": ack_ref}, exc_info=True)
 
+    def retry_hint(self, exc: Exception) -> RetryHint | None:
+        """Clasifica un error de la Bot API para el scheduler de salida."""
+        if isinstance(exc, RetryAfter):
+            return RetryHint(retry_after=float(exc.retry_after))
+        if isinstance(exc, BadRequest):
+            # BadRequest hereda de NetworkError pero es permanente.
+            return None
+        if isinstance(exc, NetworkError):
+            # TimedOut incluido. PTB encadena el error de httpx (raise ... from):
+            # sin conexión (pool lleno, connect fallido) el pedido no salió;
+            # un read timeout, un 5xx o un corte a mitad, no se sabe.
+            return RetryHint(may_have_landed=not isinstance(exc.__cause__, _NOT_SENT))
+        return None
+
+
+# Errores de httpx que garantizan que el pedido nunca llegó a la API.
+_NOT_SENT = (httpx.PoolTimeout, httpx.ConnectError, httpx.ConnectTimeout)
+
 
 def _to_markup(options: Rows | None) -> InlineKeyboardMarkup | None:
     if not options:
@@ -113,4 +154,12 @@ def _to_button(option: Option) -> InlineKeyboardButton:
 def build_sender() -> TelegramSender:
     """Fábrica desde settings. Se llama en el startup del worker."""
     from django.conf import settings
-    return TelegramSender(token=settings.TELEGRAM_TOKEN)
\ No newline at end of file
+    return TelegramSender(
+        token=settings.TELEGRAM_TOKEN,
+        base_url=settings.TELEGRAM_API_URL or None,
+        pool=PoolConfig(
+            size=settings.TELEGRAM_POOL_SIZE,
+            keepalive=settings.TELEGRAM_KEEPALIVE,
+            http2=settings.TELEGRAM_HTTP2,
+        ),
+    )
\ No newline at end of file
@@ -0,0 +1,284 @@
+"""
+Stand-in local de la Bot API de Telegram, para carga y latencia.
+
+Los tests mockean a nivel Sender, así que nunca ejercitan el camino de
+salida real: python-telegram-bot, httpx, el pool de conexiones, el
+throttle y el manejo de 429. Esto es un servidor HTTP que habla el mismo
+protocolo que api.telegram.org para los métodos que usa TelegramSender:
+
+    getMe (lo llama Bot.initialize), sendMessage, editMessageText,
+    editMessageReplyMarkup, answerCallbackQuery
+
+Comportamiento configurable (StandInConfig):
+
+  - latency / jitter: demora de cada respuesta.
+  - error_rate: fracción de pedidos que devuelven 500.
+  - throttle_rate: fracción que devuelve 429 con `retry_after` fijo.
+  - rate / chat_rate / chat_burst: límites reales con token buckets
+    (global y por chat). Pasados, 429 con el retry_after que corresponde.
+  - Editar con el mismo contenido devuelve el 400 "message is not
+    modified", como la API real.
+
+TelegramSender apunta acá con TELEGRAM_API_URL (ver settings):
+
+    python manage.py telegram_standin --port 8081 --latency 0.15
+    TELEGRAM_API_URL=http://127.0.0.1:8081/bot
+
+Solo para desarrollo: no valida el token ni persiste nada.
+"""
+import asyncio
+import json
+import logging
+import math
+import random
+import time
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+from urllib.parse import parse_qsl
+
+from services.channels.throttle import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Mensajes recordados para detectar ediciones sin cambios. Los más viejos
+# se olvidan: editarlos nunca da "not modified".
+_MAX_MESSAGES = 10_000
+
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 429: "Too Many Requests",
+            500: "Internal Server Error"}
+
+
+@dataclass
+class StandInConfig:
+    latency: float = 0.0
+    jitter: float = 0.0
+    error_rate: float = 0.0
+    throttle_rate: float = 0.0
+    retry_after: int = 1
+    # 0 = sin límite. Los de la API real son ~30/s y ~1/s por chat.
+    rate: float = 0.0
+    chat_rate: float = 0.0
+    chat_burst: int = 1
+    seed: int | None = None
+
+
+class TelegramStandIn:
+    """
+    El servidor. `stats` cuenta respuestas por (método, status) para que un
+    benchmark compare lo que mandó con lo que la "API" vio.
+    """
+
+    def __init__(self, config: StandInConfig | None = None):
+        self.config = config or StandInConfig()
+        self.stats: Counter[tuple[str, int]] = Counter()
+        self._random = random.Random(self.config.seed)
+        self._global: TokenBucket | None = None
+        self._chats: dict[str, TokenBucket] = {}
+        self._messages: OrderedDict[tuple[str, int], tuple] = OrderedDict()
+        self._next_id: Counter[str] = Counter()
+        self._server: asyncio.AbstractServer | None = None
+
+    @property
+    def port(self) -> int:
+        return self._server.sockets[0].getsockname()[1]
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> asyncio.AbstractServer:
+        self._server = await asyncio.start_server(self._handle, host, port)
+        logger.info("Stand-in de la Bot API escuchando", extra={"host": host, "port": self.port})
+        return self._server
+
+    async def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    # ---------------------------------------------------------------
+    #   HTTP: HTTP/1.1 con keep-alive, que es lo que usa httpx
+    # ---------------------------------------------------------------
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    return          # el cliente cerró la conexión
+
+                headers = {}
+                while (line := await reader.readline()).strip():
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length") or 0))
+
+                path = request_line.split(b" ")[1].decode()
+                status, payload = await self._dispatch(
+                    path, _parse_body(body, headers.get("content-type", ""))
+                )
+
+                data = json.dumps(payload).encode()
+                writer.write(
+                    f"HTTP/1.1 {status} {_REASONS.get(status, '')}\r\n"
+                    f"Content-Type: application/json\r\n"
+                    f"Content-Length: {len(data)}\r\n\r\n".encode()
+                    + data
+                )
+                await writer.drain()
+
+                if headers.get("connection", "").lower() == "close":
+                    return
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except Exception:
+            logger.warning("Fallo atendiendo un pedido del stand-in", exc_info=True)
+        finally:
+            writer.close()
+
+    # ---------------------------------------------------------------
+    #   Bot API
+    # ---------------------------------------------------------------
+
+    async def _dispatch(self, path: str, params: dict) -> tuple[int, dict]:
+        # /bot<token>/<método>
+        method = path.rstrip("/").rsplit("/", 1)[-1].split("?", 1)[0]
+        status, payload = await self._respond(method, params)
+        self.stats[(method, status)] += 1
+        return status, payload
+
+    async def _respond(self, method: str, params: dict) -> tuple[int, dict]:
+        config = self.config
+        if config.latency or config.jitter:
+            await asyncio.sleep(config.latency + self._random.uniform(0, config.jitter))
+
+        handler = _METHODS.get(method)
+        if handler is None:
+            return _error(404, "Not Found")
+        if method == "getMe":
+            return handler(self, params)
+
+        if self._random.random() < config.error_rate:
+            return _error(500, "Internal Server Error")
+        if self._random.random() < config.throttle_rate:
+            return _too_many(config.retry_after)
+
+        espera = self._take(str(params.get("chat_id", "")))
+        if espera:
+            return _too_many(math.ceil(espera))
+
+        return handler(self, params)
+
+    def _take(self, chat_id: str) -> float:
+        """0 si el pedido entra en los límites; si no, segundos hasta que entre."""
+        config = self.config
+        now = time.monotonic()
+        buckets = []
+        if config.rate:
+            if self._global is None:
+                self._global = TokenBucket(config.rate, config.rate, now)
+            buckets.append(self._global)
+        if config.chat_rate and chat_id:
+            bucket = self._chats.get(chat_id)
+            if bucket is None:
+                bucket = self._chats[chat_id] = TokenBucket(
+                    config.chat_rate, config.chat_burst, now
+                )
+            buckets.append(bucket)
+
+        espera = max((b.delay(now) for b in buckets), default=0.0)
+        if espera:
+            return espera
+        for bucket in buckets:
+            bucket.take(now)
+        return 0.0
+
+    def _get_me(self, params: dict) -> tuple[int, dict]:
+        return _ok({"id": 1, "is_bot": True, "first_name": "StandIn", "username": "standin_bot"})
+
+    def _send_message(self, params: dict) -> tuple[int, dict]:
+        chat_id = str(params["chat_id"])
+        self._next_id[chat_id] += 1
+        message_id = self._next_id[chat_id]
+        self._remember(chat_id, message_id, params.get("text"), params.get("reply_markup"))
+        return _ok(_message(chat_id, message_id, params))
+
+    def _edit_message(self, params: dict) -> tuple[int, dict]:
+        chat_id, message_id = str(params["chat_id"]), int(params["message_id"])
+        previo = self._messages.get((chat_id, message_id))
+        text = params.get("text", previo[0] if previo else None)
+        markup = params.get("reply_markup")
+
+        if previo == (text, markup):
+            return _error(
+                400,
+                "Bad Request: message is not modified: specified new message content "
+                "and reply markup are exactly the same as a current content and reply "
+                "markup of the message",
+            )
+        self._remember(chat_id, message_id, text, markup)
+        return _ok(_message(chat_id, message_id, {**params, "text": text}))
+
+    def _answer_callback_query(self, params: dict) -> tuple[int, dict]:
+        if not params.get("callback_query_id"):
+            return _error(400, "Bad Request: query is too old and response timeout expired")
+        return _ok(True)
+
+    def _remember(self, chat_id: str, message_id: int, text, markup) -> None:
+        self._messages[(chat_id, message_id)] = (text, markup)
+        self._messages.move_to_end((chat_id, message_id))
+        while len(self._messages) > _MAX_MESSAGES:
+            self._messages.popitem(last=False)
+
+
+_METHODS = {
+    "getMe": TelegramStandIn._get_me,
+    "sendMessage": TelegramStandIn._send_message,
+    "editMessageText": TelegramStandIn._edit_message,
+    "editMessageReplyMarkup": TelegramStandIn._edit_message,
+    "answerCallbackQuery": TelegramStandIn._answer_callback_query,
+}
+
+
+def _parse_body(body: bytes, content_type: str) -> dict:
+    """
+    python-telegram-bot manda form-urlencoded con los valores no escalares
+    codificados en JSON; otros clientes mandan JSON directo.
+    """
+    if not body:
+        return {}
+    if content_type.startswith("application/json"):
+        return json.loads(body)
+    params = {}
+    for name, value in parse_qsl(body.decode(), keep_blank_values=True):
+        try:
+            params[name] = json.loads(value)
+        except ValueError:
+            params[name] = value
+    return params
+
+
+def _message(chat_id: str, message_id: int, params: dict) -> dict:
+    message = {
+        "message_id": message_id,
+        "date": int(time.time()),
+        "chat": {"id": int(chat_id) if chat_id.lstrip("-").isdigit() else chat_id,
+                 "type": "private"},
+    }
+    if params.get("text") is not None:
+        message["text"] = str(params["text"])
+    if params.get("reply_markup"):
+        message["reply_markup"] = params["reply_markup"]
+    return message
+
+
+def _ok(result) -> tuple[int, dict]:
+    return 200, {"ok": True, "result": result}
+
+
+def _error(code: int, description: str) -> tuple[int, dict]:
+    return code, {"ok": False, "error_code": code, "description": description}
+
+
+def _too_many(retry_after: int) -> tuple[int, dict]:
+    retry_after = max(1, int(retry_after))
+    status, payload = _error(429, f"Too Many Requests: retry after {retry_after}")
+    payload["parameters"] = {"retry_after": retry_after}
+    return status, payload
@@ -0,0 +1,163 @@
+"""
+Transporte HTTP de TelegramSender: pools de conexiones configurables y
+medidos.
+
+El request por defecto de python-telegram-bot abre un pool de una sola
+conexión. Con varios jobs enviando a la vez, los pedidos hacen fila
+detrás de esa conexión (y con pool_timeout=1s, fallan con "Pool
+timeout"). Acá el pool se dimensiona desde settings y se instrumenta:
+
+  - pool_size: conexiones máximas. Por defecto WORKER_MAX_JOBS, la
+    concurrencia máxima del worker.
+  - keepalive: segundos que una conexión ociosa queda abierta para
+    reusarse. Abrir una contra api.telegram.org (TCP + TLS) cuesta más
+    que el pedido.
+  - HTTP/2 cuando está instalado `h2` (python-telegram-bot[http2]): se
+    negocia por ALPN y multiplexa los pedidos sobre una conexión. Sin
+    TLS (el stand-in local) queda HTTP/1.1.
+
+Un solo pool, "send". El bot recibe los updates por webhook y solo hace
+llamadas cortas (sendMessage, editMessageText, answerCallbackQuery): no
+hay long polls ni subidas de archivos que aparten una conexión por
+mucho tiempo, así que no hay nada que separar. getUpdates queda con el
+request por defecto de PTB, que nunca se usa. Si aparecen envíos de
+archivos, van en su propio pool.
+
+Métricas, por pool, a partir de los eventos de trace de httpcore:
+
+  - bot_http_pool_wait_seconds: desde que el pedido entra al transporte
+    hasta que tiene conexión (nueva o reusada).
+  - bot_http_connections_created_total: conexiones TCP abiertas. Contra
+    la cantidad de pedidos, da la tasa de reuso.
+  - bot_http_requests_in_flight: pedidos en curso. Pegado a pool_size,
+    el pool es el cuello de botella.
+"""
+import importlib.util
+import logging
+import time
+from dataclasses import dataclass
+
+import httpx
+from telegram.request import HTTPXRequest
+
+from services.infrastructure import metrics
+
+logger = logging.getLogger(__name__)
+
+HTTP_POOL_WAIT = metrics.histogram(
+    "bot_http_pool_wait_seconds",
+    "Espera de un pedido a la Bot API hasta tener conexión",
+    labelnames=("pool",),
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+HTTP_CONNECTIONS = metrics.counter(
+    "bot_http_connections_created_total",
+    "Conexiones abiertas hacia la Bot API",
+    labelnames=("pool",),
+)
+HTTP_IN_FLIGHT = metrics.gauge(
+    "bot_http_requests_in_flight",
+    "Pedidos a la Bot API en curso",
+    labelnames=("pool",),
+)
+
+# Primer evento de httpcore una vez que el pedido tiene conexión: o empieza
+# a abrir una, o manda los headers por una reusada.
+_GOT_CONNECTION = (
+    "connection.connect_tcp.started",
+    "http11.send_request_headers.started",
+    "http2.send_request_headers.started",
+)
+
+
+def http2_available() -> bool:
+    return importlib.util.find_spec("h2") is not None
+
+
+@dataclass(frozen=True)
+class PoolConfig:
+    size: int = 10
+    keepalive: float = 30.0
+    http2: bool = True
+    connect_timeout: float = 5.0
+    read_timeout: float = 5.0
+    write_timeout: float = 5.0
+    pool_timeout: float = 1.0
+
+
+class InstrumentedTransport(httpx.AsyncBaseTransport):
+    """Envuelve el transporte de httpx y mide cada pedido con su trace."""
+
+    def __init__(self, inner: httpx.AsyncBaseTransport, pool: str):
+        self.inner = inner
+        self.pool = pool
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        start = time.perf_counter()
+        waiting = True
+        previous = request.extensions.get("trace")
+
+        async def trace(event: str, info: dict) -> None:
+            nonlocal waiting
+            if waiting and event in _GOT_CONNECTION:
+                waiting = False
+                HTTP_POOL_WAIT.observe(time.perf_counter() - start, pool=self.pool)
+            if event == "connection.connect_tcp.complete":
+                HTTP_CONNECTIONS.inc(pool=self.pool)
+            if previous is not None:
+                await previous(event, info)
+
+        request.extensions["trace"] = trace
+        HTTP_IN_FLIGHT.inc(pool=self.pool)
+        try:
+            return await self.inner.handle_async_request(request)
+        finally:
+            HTTP_IN_FLIGHT.dec(pool=self.pool)
+
+    async def aclose(self) -> None:
+        await self.inner.aclose()
+
+
+class PooledRequest(HTTPXRequest):
+    """
+    HTTPXRequest con el transporte de arriba. PTB sigue manejando
+    timeouts por pedido, errores y el ciclo de vida del cliente.
+    """
+
+    def __init__(self, config: PoolConfig, *, pool: str):
+        # Antes de super().__init__, que construye el cliente.
+        self._config = config
+        self._pool = pool
+        http2 = config.http2 and http2_available()
+        super().__init__(
+            connection_pool_size=config.size,
+            connect_timeout=config.connect_timeout,
+            read_timeout=config.read_timeout,
+            write_timeout=config.write_timeout,
+            pool_timeout=config.pool_timeout,
+            http_version="2" if http2 else "1.1",
+        )
+
+    def _build_client(self) -> httpx.AsyncClient:
+        config = self._config
+        transport = httpx.AsyncHTTPTransport(
+            limits=httpx.Limits(
+                max_connections=config.size,
+                max_keepalive_connections=config.size,
+                keepalive_expiry=config.keepalive,
+            ),
+            # Ambos: HTTP/2 solo si el servidor lo ofrece por ALPN.
+            http1=True,
+            http2=self.http_version != "1.1",
+        )
+        kwargs = {k: v for k, v in self._client_kwargs.items() if k not in ("http1", "http2")}
+        return httpx.AsyncClient(
+            **{**kwargs, "transport": InstrumentedTransport(transport, self._pool)}
+        )
+
+
+def build_requests(config: PoolConfig) -> dict:
+    """El pool de envío, listo para Bot(**build_requests(config))."""
+    if config.http2 and not http2_available():
+        logger.info("HTTP/2 pedido pero h2 no está instalado: se usa HTTP/1.1")
+    return {"request": PooledRequest(config, pool="send")}
@@ -0,0 +1,427 @@
+"""
+Envíos de salida al ritmo que permite el canal.
+
+Telegram tolera ~30 mensajes por segundo en total y ~1 por segundo por
+chat; pasado eso contesta 429. Antes cada handler llamaba a la API en
+línea y una ráfaga terminaba en el camino de error genérico del worker.
+
+ThrottledSender pone reply y edit en una cola por chat y devuelve. El
+scheduler los despacha respetando dos token buckets (global y por chat):
+
+  - Un chat con cola no frena a los demás: se atiende primero el chat que
+    antes tenga token disponible.
+  - El orden dentro de un chat se conserva (reply y después edit).
+  - Backpressure: con `max_pending` envíos en cola, el handler espera
+    lugar. Eso alarga el job y el limitador del worker lo ve.
+
+El ack no pasa por acá: no cuenta para esos límites y caduca.
+
+Consecuencia: un fallo de la API en reply/edit ya no llega al handler ni
+al camino de error del worker (el gasto ya está guardado).
+
+Reintentos: el sender clasifica el error con `retry_hint(exc)`
+(services.channels.senders.RetryHint). Un envío reintentable vuelve al
+frente de la cola de su chat y el bucket del chat se bloquea el tiempo
+de espera, así que no ocupa un slot del worker ni se adelanta a lo que
+venía detrás:
+
+  - 429: se espera exactamente el retry_after que pidió el canal.
+  - Transitorio: backoff exponencial con jitter.
+  - Un envío que pudo haber llegado (timeout de lectura) solo se
+    reintenta si es idempotente: edit sí, reply no (duplicaría).
+  - Los que esperan el resultado (wait=True, el outbox) no se reintentan
+    acá: reciben el error y difieren por su cuenta.
+
+Lo que se agota o no es reintentable se loguea y se cuenta en
+bot_outbound_failures_total.
+"""
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from functools import partial
+from typing import Awaitable, Callable
+
+from services.channels.layers import SenderLayer
+from services.channels.senders import RetryHint, Sender
+from services.infrastructure import metrics
+
+logger = logging.getLogger(__name__)
+
+OUTBOUND_PENDING = metrics.gauge(
+    "bot_outbound_pending",
+    "Envíos en cola esperando token",
+    labelnames=("channel",),
+)
+OUTBOUND_WAIT = metrics.histogram(
+    "bot_outbound_wait_seconds",
+    "Desde que el handler pide el envío hasta que sale hacia la API",
+    labelnames=("channel", "method"),
+)
+OUTBOUND_FAILURES = metrics.counter(
+    "bot_outbound_failures_total",
+    "Envíos que fallaron después de salir de la cola, sin más reintentos",
+    labelnames=("channel", "method"),
+)
+OUTBOUND_RETRIES = metrics.counter(
+    "bot_outbound_retries_total",
+    "Envíos devueltos a la cola para reintentar",
+    labelnames=("channel", "method", "reason"),
+)
+OUTBOUND_DEFERRED = metrics.counter(
+    "bot_outbound_deferred_seconds_total",
+    "Tiempo total que los reintentos difirieron envíos",
+    labelnames=("channel", "method"),
+)
+
+
+class TokenBucket:
+    """`rate` tokens por segundo, hasta `capacity` acumulados."""
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now: float) -> float:
+        """Segundos hasta que haya un token. 0 si ya hay."""
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now: float) -> None:
+        self._refill(now)
+        self.tokens -= 1
+
+    def full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+    def block(self, now: float, seconds: float) -> None:
+        """Sin tokens durante `seconds`: delay() lo reporta hasta entonces."""
+        self._refill(now)
+        self.tokens = min(self.tokens, 1 - seconds * self.rate)
+
+
+@dataclass
+class _Send:
+    chat_id: str
+    method: str
+    call: Callable[[], Awaitable]
+    done: asyncio.Future | None = None
+    idempotent: bool = False
+    attempt: int = 0
+    queued_at: float = field(default_factory=time.monotonic)
+
+
+class OutboundScheduler:
+    def __init__(
+        self,
+        channel: str,
+        *,
+        rate: float,
+        chat_rate: float,
+        chat_burst: int = 1,
+        max_pending: int = 500,
+        drain_timeout: float = 10.0,
+        retry_hint: Callable[[Exception], RetryHint | None] | None = None,
+        max_retries: int = 5,
+        backoff_base: float = 0.5,
+        backoff_cap: float = 30.0,
+    ):
+        self.channel = channel
+        self.rate = rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_pending = max_pending
+        self.drain_timeout = drain_timeout
+        self.retry_hint = retry_hint
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+
+        self._queues: dict[str, deque[_Send]] = {}
+        self._buckets: dict[str, TokenBucket] = {}
+        self._global: TokenBucket | None = None
+        self._pending = 0
+        self._running: set[asyncio.Task] = set()
+        self._busy: set[str] = set()
+        self._changed: asyncio.Event | None = None
+        self._space: asyncio.Condition | None = None
+        self._task: asyncio.Task | None = None
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    async def start(self) -> None:
+        self._global = TokenBucket(self.rate, self.rate, time.monotonic())
+        self._changed = asyncio.Event()
+        self._space = asyncio.Condition()
+        self._task = asyncio.create_task(self._run(), name=f"outbound:{self.channel}")
+
+    async def close(self) -> None:
+        """Drena lo que quedó en cola (hasta drain_timeout) y corta."""
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(self._drained(), timeout=self.drain_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(
+                "Envíos descartados al apagar",
+                extra={"channel": self.channel, "pending": self._pending},
+            )
+        self._task.cancel()
+        for task in self._running:
+            task.cancel()
+        for cola in self._queues.values():
+            for send in cola:
+                if send.done is not None and not send.done.done():
+                    send.done.set_exception(ConnectionError("Scheduler de salida cerrado"))
+        await asyncio.gather(self._task, *self._running, return_exceptions=True)
+        self._task = None
+
+    async def submit(
+        self,
+        chat_id: str,
+        method: str,
+        call: Callable[[], Awaitable],
+        *,
+        wait: bool = False,
+        idempotent: bool = False,
+    ):
+        """
+        Encola el envío. Espera solo si la cola está llena, salvo con
+        wait=True: ahí espera a que el canal responda y devuelve su
+        resultado o propaga su error.
+
+        idempotent: repetirlo no tiene efecto extra; habilita reintentar
+        aunque el primer intento haya podido llegar.
+        """
+        if self._task is None:
+            # Sin scheduler corriendo (tests, scripts): envío directo.
+            return await call()
+
+        async with self._space:
+            await self._space.wait_for(lambda: self._pending < self.max_pending)
+            self._pending += 1
+
+        chat_id = str(chat_id)
+        done = asyncio.get_running_loop().create_future() if wait else None
+        self._queues.setdefault(chat_id, deque()).append(
+            _Send(chat_id, method, call, done, idempotent)
+        )
+        OUTBOUND_PENDING.set(self._pending, channel=self.channel)
+        self._changed.set()
+
+        if done is not None:
+            return await done
+
+    # ---------------------------------------------------------------
+
+    async def _run(self) -> None:
+        while True:
+            now = time.monotonic()
+            chat_id, wait = self._next_ready(now)
+
+            if chat_id is None:
+                await self._wait_for_change(None)
+                continue
+            if wait > 0:
+                await self._wait_for_change(wait)
+                continue
+
+            self._global.take(now)
+            self._bucket(chat_id, now).take(now)
+            send = self._queues[chat_id].popleft()
+            self._busy.add(chat_id)
+            self._forget_if_idle(chat_id, now)
+
+            task = asyncio.create_task(self._execute(send))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    def _next_ready(self, now: float) -> tuple[str | None, float]:
+        """
+        Chat con cola que antes tiene token, y cuánto falta para poder enviar.
+        Un chat con un envío en curso espera a que termine: así se conserva
+        el orden aunque el bucket permita ráfagas.
+        """
+        elegido, espera_chat = None, float("inf")
+        for chat_id, cola in self._queues.items():
+            if not cola or chat_id in self._busy:
+                continue
+            espera = self._bucket(chat_id, now).delay(now)
+            if espera < espera_chat:
+                elegido, espera_chat = chat_id, espera
+        if elegido is None:
+            return None, 0.0
+        return elegido, max(espera_chat, self._global.delay(now))
+
+    async def _wait_for_change(self, timeout: float | None) -> None:
+        self._changed.clear()
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _execute(self, send: _Send) -> None:
+        OUTBOUND_WAIT.observe(
+            max(0.0, time.monotonic() - send.queued_at), channel=self.channel, method=send.method
+        )
+        try:
+            result = await send.call()
+        except Exception as exc:
+            if self._requeue(send, exc):
+                # Sigue pendiente: no se libera lugar en la cola.
+                self._busy.discard(send.chat_id)
+                self._changed.set()
+                return
+            OUTBOUND_FAILURES.inc(channel=self.channel, method=send.method)
+            if send.done is not None:
+                # Quien espera decide qué hacer con el error.
+                if not send.done.done():
+                    send.done.set_exception(exc)
+            else:
+                logger.warning(
+                    "Fallo un envío de salida",
+                    extra={"channel": self.channel, "method": send.method,
+                           "attempt": send.attempt},
+                    exc_info=True,
+                )
+        else:
+            if send.done is not None and not send.done.done():
+                send.done.set_result(result)
+        await self._finished(send)
+
+    async def _finished(self, send: _Send) -> None:
+        self._busy.discard(send.chat_id)
+        self._changed.set()
+        async with self._space:
+            self._pending -= 1
+            self._space.notify_all()
+        OUTBOUND_PENDING.set(self._pending, channel=self.channel)
+
+    def _requeue(self, send: _Send, exc: Exception) -> bool:
+        """
+        Devuelve el envío al frente de la cola de su chat, diferido, si el
+        error lo permite. El pending no cambia: el envío sigue en curso.
+        """
+        if send.done is not None or self.retry_hint is None or send.attempt >= self.max_retries:
+            return False
+        hint = self.retry_hint(exc)
+        if hint is None or (hint.may_have_landed and not send.idempotent):
+            return False
+
+        if hint.retry_after is not None:
+            delay, reason = hint.retry_after, "rate_limited"
+        else:
+            # Backoff exponencial con jitter: la mitad fija, la otra al azar,
+            # para que los chats que fallaron juntos no vuelvan juntos.
+            techo = min(self.backoff_cap, self.backoff_base * 2 ** send.attempt)
+            delay, reason = techo / 2 + random.uniform(0, techo / 2), "transient"
+
+        now = time.monotonic()
+        send.attempt += 1
+        send.queued_at = now + delay
+        self._queues.setdefault(send.chat_id, deque()).appendleft(send)
+        self._bucket(send.chat_id, now).block(now, delay)
+
+        OUTBOUND_RETRIES.inc(channel=self.channel, method=send.method, reason=reason)
+        OUTBOUND_DEFERRED.inc(delay, channel=self.channel, method=send.method)
+        logger.info(
+            "Envío diferido para reintentar",
+            extra={
+                "channel": self.channel,
+                "method": send.method,
+                "attempt": send.attempt,
+                "delay": round(delay, 3),
+                "reason": reason,
+            },
+        )
+        return True
+
+    def _bucket(self, chat_id: str, now: float) -> TokenBucket:
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst, now)
+        return bucket
+
+    def _forget_if_idle(self, chat_id: str, now: float) -> None:
+        # Un chat sin cola y con el bucket lleno es indistinguible de uno
+        # nuevo: se borra para que el dict no crezca con cada usuario.
+        if not self._queues[chat_id]:
+            del self._queues[chat_id]
+        for cid in [c for c, b in self._buckets.items() if c not in self._queues and b.full(now)]:
+            del self._buckets[cid]
+
+    async def _drained(self) -> None:
+        async with self._space:
+            await self._space.wait_for(lambda: self._pending == 0)
+
+
+class ThrottledSender(SenderLayer):
+    """
+    reply y edit pasan por el scheduler; ack y el resto van directo.
+
+    Los límites salen del sender envuelto (`rate_limit`, `chat_rate_limit`,
+    `chat_burst`), igual que `ack_deadline`.
+    """
+
+    def __init__(self, inner: Sender, *, max_pending: int = 500):
+        super().__init__(inner)
+        self.scheduler = OutboundScheduler(
+            inner.channel,
+            rate=inner.rate_limit,
+            chat_rate=inner.chat_rate_limit,
+            chat_burst=getattr(inner, "chat_burst", 1),
+            max_pending=max_pending,
+            retry_hint=getattr(inner, "retry_hint", None),
+        )
+
+    async def startup(self) -> None:
+        await super().startup()
+        await self.scheduler.start()
+
+    async def shutdown(self) -> None:
+        await self.scheduler.close()
+        await super().shutdown()
+
+    async def reply(self, external_user_id, text, *, options=None, parse_mode=None):
+        await self.scheduler.submit(
+            external_user_id,
+            "reply",
+            partial(self.inner.reply, external_user_id, text, options=options, parse_mode=parse_mode),
+        )
+        # El id del mensaje todavía no existe. Ningún handler lo usa.
+        return None
+
+    async def deliver(self, external_user_id, text, *, options=None, parse_mode=None):
+        """
+        reply que espera la confirmación del canal y propaga su error. Para
+        quien necesita saber si el mensaje salió (services/outbox.py).
+        """
+        return await self.scheduler.submit(
+            external_user_id,
+            "reply",
+            partial(self.inner.reply, external_user_id, text, options=options, parse_mode=parse_mode),
+            wait=True,
+        )
+
+    async def edit(self, external_user_id, edit_ref, *, text=None, options=None, parse_mode=None):
+        await self.scheduler.submit(
+            external_user_id,
+            "edit",
+            partial(
+                self.inner.edit,
+                external_user_id, edit_ref, text=text, options=options, parse_mode=parse_mode,
+            ),
+            # Repetir el edit deja el mensaje igual ("not modified" se ignora).
+            idempotent=True,
+        )
@@ -7,6 +7,7 @@ from apps.core.models import Expense, Category, DeletedObject
 from .selectors import get_category_by_id
 
 from services.ml.helper import _record_feedback_sync
+from services.outbox import _add_reply_sync
 
 from asgiref.sync import sync_to_async
 from django.contrib.contenttypes.models import ContentType
@@ -17,8 +18,7 @@ from datetime import datetime
 
 from decimal import Decimal
 
-@sync_to_async
-def create_expense(
+def _create_expense_sync(
     user, 
     amount:float, 
     description:str, 
@@ -29,6 +29,7 @@ def create_expense(
     ):
     """
     Create a new Expense for the user.
+    Sync version: callable from inside another transaction (see create_expense_with_reply).
     """
     if not date:
         date = timezone.now()
@@ -50,6 +51,28 @@ def create_expense(
     return expense
 
 
+create_expense = sync_to_async(_create_expense_sync)
+
+
+@sync_to_async
+def create_expense_with_reply(user, *, event_key, channel, conversation_id, render, **fields):
+    """
+    Create the expense and its confirmation reply in the same transaction.
+    render(expense) -> (text, options): the reply needs the expense id for its buttons.
+    Returns (expense, outbox_message). See services/outbox.py.
+    """
+    with transaction.atomic():
+        expense = _create_expense_sync(user, **fields)
+        text, options = render(expense)
+        message = _add_reply_sync(
+            event_key=event_key,
+            channel=channel,
+            conversation_id=conversation_id,
+            text=text,
+            options=options,
+        )
+    return expense, message
+
 
 @sync_to_async
 def update_expense(
@@ -0,0 +1,201 @@
+"""
+Circuit breaker genérico.
+
+Cuando una dependencia se degrada (la API de un canal, Redis), cada
+llamada espera su timeout completo antes de fallar, y todos los slots
+del worker terminan colgados de la misma dependencia. El breaker mira
+una ventana móvil de resultados y, pasado un umbral, deja de llamar:
+
+  closed     Las llamadas pasan. Se registran resultado y duración.
+             Con al menos `min_calls` en la ventana, si la fracción de
+             fallas o de llamadas lentas (> `slow_call`) supera su
+             umbral, abre.
+  open       Las llamadas fallan al instante con CircuitOpen durante
+             `open_for` segundos. Quien llama decide qué hacer con eso
+             (diferir, usar un fallback).
+  half_open  Pasado `open_for`, deja salir hasta `probes` llamadas de
+             prueba. Si salen bien, cierra con la ventana limpia; si
+             alguna falla, vuelve a abrir.
+
+Uso:
+
+    breaker = CircuitBreaker("sender:telegram")
+    breaker.check()          # CircuitOpen si no hay que llamar
+    start = time.monotonic()
+    try:
+        result = await call()
+    except Exception:
+        breaker.record(False, time.monotonic() - start)
+        raise
+    breaker.record(True, time.monotonic() - start)
+
+O `async with breaker.guard():`, que hace lo mismo.
+
+El estado es del proceso: cada worker decide por lo que él ve.
+"""
+import logging
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Callable
+
+from services.infrastructure import metrics
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+HALF_OPEN = "half_open"
+OPEN = "open"
+
+# Para el gauge: 0 cerrado, 1 medio abierto, 2 abierto.
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+CIRCUIT_STATE = metrics.gauge(
+    "bot_circuit_state",
+    "Estado del circuit breaker: 0 closed, 1 half_open, 2 open",
+    labelnames=("circuit",),
+)
+CIRCUIT_TRANSITIONS = metrics.counter(
+    "bot_circuit_transitions_total",
+    "Cambios de estado del circuit breaker",
+    labelnames=("circuit", "state"),
+)
+CIRCUIT_REJECTED = metrics.counter(
+    "bot_circuit_rejected_total",
+    "Llamadas que el breaker cortó sin intentarlas",
+    labelnames=("circuit",),
+)
+
+
+class CircuitOpen(Exception):
+    """La dependencia está cortada. `retry_after`: segundos hasta la próxima prueba."""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"Circuito {name!r} abierto; se prueba en {retry_after:.1f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        name: str,
+        *,
+        window: float = 30.0,
+        min_calls: int = 10,
+        failure_rate: float = 0.5,
+        slow_call: float = 5.0,
+        slow_rate: float = 0.8,
+        open_for: float = 30.0,
+        probes: int = 1,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.name = name
+        self.window = window
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call = slow_call
+        self.slow_rate = slow_rate
+        self.open_for = open_for
+        self.probes = probes
+        self._clock = clock
+
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probing = 0
+        # (instante, falló, fue lenta)
+        self._calls: deque[tuple[float, bool, bool]] = deque()
+        CIRCUIT_STATE.set(_STATE_VALUES[CLOSED], circuit=name)
+
+    @property
+    def state(self) -> str:
+        if self._state == OPEN and self._clock() - self._opened_at >= self.open_for:
+            self._transition(HALF_OPEN)
+        return self._state
+
+    def retry_after(self) -> float:
+        """Segundos hasta que el breaker deje salir una prueba. 0 si ya deja."""
+        if self.state != OPEN:
+            return 0.0
+        return max(0.0, self.open_for - (self._clock() - self._opened_at))
+
+    def check(self) -> None:
+        """Levanta CircuitOpen si la llamada no debe salir. Si sale, hay que record()."""
+        state = self.state
+        if state == CLOSED:
+            return
+        if state == HALF_OPEN and self._probing < self.probes:
+            self._probing += 1
+            return
+        CIRCUIT_REJECTED.inc(circuit=self.name)
+        raise CircuitOpen(self.name, self.retry_after() or self.open_for)
+
+    def record(self, ok: bool, duration: float = 0.0) -> None:
+        now = self._clock()
+        slow = duration > self.slow_call
+
+        if self._state == HALF_OPEN:
+            self._probing = max(0, self._probing - 1)
+            if ok and not slow:
+                self._calls.clear()
+                self._transition(CLOSED)
+            else:
+                self._open(now)
+            return
+        if self._state == OPEN:
+            # Una llamada que salió antes de abrir y terminó después.
+            return
+
+        self._calls.append((now, not ok, slow))
+        while self._calls and self._calls[0][0] < now - self.window:
+            self._calls.popleft()
+
+        total = len(self._calls)
+        if total < self.min_calls:
+            return
+        fallas = sum(1 for _, failed, _ in self._calls if failed)
+        lentas = sum(1 for _, _, s in self._calls if s)
+        if fallas / total >= self.failure_rate or lentas / total >= self.slow_rate:
+            logger.warning(
+                "Circuito abierto",
+                extra={"circuit": self.name, "calls": total, "failures": fallas, "slow": lentas},
+            )
+            self._open(now)
+
+    @asynccontextmanager
+    async def guard(self, *, is_failure: Callable[[Exception], bool] = lambda exc: True):
+        """
+        check() + record() alrededor del bloque. `is_failure` separa los
+        errores de salud de los del pedido (un 400 no dice nada de la API).
+        """
+        self.check()
+        start = self._clock()
+        ok = None
+        try:
+            yield
+            ok = True
+        except Exception as exc:
+            ok = not is_failure(exc)
+            raise
+        finally:
+            if ok is None:
+                # Cancelada: no dice nada de la dependencia, pero libera la prueba.
+                if self._state == HALF_OPEN:
+                    self._probing = max(0, self._probing - 1)
+            else:
+                self.record(ok, self._clock() - start)
+
+    def _open(self, now: float) -> None:
+        self._opened_at = now
+        self._probing = 0
+        self._calls.clear()
+        self._transition(OPEN)
+
+    def _transition(self, state: str) -> None:
+        if state == self._state:
+            return
+        self._state = state
+        CIRCUIT_STATE.set(_STATE_VALUES[state], circuit=self.name)
+        CIRCUIT_TRANSITIONS.inc(circuit=self.name, state=state)
+        if state != OPEN:
+            logger.info("Circuito cambia de estado", extra={"circuit": self.name, "state": state})
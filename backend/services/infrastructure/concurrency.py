@@ -0,0 +1,168 @@
+"""
+Límite de concurrencia adaptativo (AIMD) para el worker.
+
+ARQ toma hasta `max_jobs` jobs a la vez y ese número es fijo. El valor
+correcto no lo es: depende de cuánto tarda Postgres, de cuánto aguanta la
+API del canal antes de devolver 429 y de la profundidad de la cola, y las
+tres cosas cambian durante el día.
+
+El limitador se ubica adentro de la task. `max_jobs` pasa a ser el techo;
+el límite efectivo se mueve entre `min_limit` y ese techo según lo que
+se observa al completar cada job:
+
+  - Job sano (sin error, latencia <= objetivo): suma 1/límite. Con el
+    límite lleno, eso es +1 por "ventana" de jobs — crecimiento lineal.
+  - Job lento o con error: multiplica por `backoff`. Como mucho una vez
+    por `latency_target` segundos, para que los jobs que ya estaban en
+    vuelo cuando empezó el problema no lo hundan hasta el mínimo.
+
+Los jobs que esperan un lugar siguen ocupando un slot de ARQ (y corren
+contra job_timeout), pero no tocan ni la base ni la API.
+"""
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+
+from services.infrastructure import metrics
+
+logger = logging.getLogger(__name__)
+
+CONCURRENCY_LIMIT = metrics.gauge(
+    "worker_concurrency_limit",
+    "Límite de jobs en ejecución decidido por el controlador adaptativo",
+    labelnames=("limiter",),
+)
+CONCURRENCY_IN_FLIGHT = metrics.gauge(
+    "worker_concurrency_in_flight",
+    "Jobs ejecutando dentro del limitador",
+    labelnames=("limiter",),
+)
+CONCURRENCY_DECREASES = metrics.counter(
+    "worker_concurrency_decreases_total",
+    "Veces que el controlador redujo el límite",
+    labelnames=("limiter", "reason"),
+)
+
+
+class _Outcome:
+    """Lo que el job le informa al limitador. Ver AIMDLimiter.slot."""
+
+    __slots__ = ("failed",)
+
+    def __init__(self):
+        self.failed = False
+
+    def fail(self) -> None:
+        self.failed = True
+
+
+class AIMDLimiter:
+    def __init__(
+        self,
+        name: str,
+        *,
+        min_limit: int,
+        max_limit: int,
+        latency_target: float,
+        backoff: float = 0.7,
+        initial: int | None = None,
+    ):
+        if not 1 <= min_limit <= max_limit:
+            raise ValueError("Se necesita 1 <= min_limit <= max_limit")
+        if not 0 < backoff < 1:
+            raise ValueError("backoff debe estar entre 0 y 1")
+
+        self.name = name
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target = latency_target
+        self.backoff = backoff
+
+        self._limit = float(initial if initial is not None else min_limit)
+        self._in_flight = 0
+        self._last_decrease = 0.0
+        self._cond: asyncio.Condition | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._publish()
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @asynccontextmanager
+    async def slot(self):
+        """
+        Espera un lugar, ejecuta y reporta. Una excepción que atraviesa el
+        bloque cuenta como error; un error absorbido adentro se reporta con
+        `outcome.fail()`.
+
+            async with LIMITER.slot() as outcome:
+                try:
+                    await trabajo()
+                except Exception:
+                    outcome.fail()
+        """
+        await self._acquire()
+        outcome = _Outcome()
+        start = time.monotonic()
+        try:
+            yield outcome
+        except BaseException:
+            outcome.fail()
+            raise
+        finally:
+            await self._release(time.monotonic() - start, outcome.failed)
+
+    # ---------------------------------------------------------------
+
+    def _condition(self) -> asyncio.Condition:
+        # Creada perezosamente y atada al loop actual: el módulo se importa
+        # antes de que exista el loop del worker.
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._cond = asyncio.Condition()
+            self._loop = loop
+        return self._cond
+
+    async def _acquire(self) -> None:
+        cond = self._condition()
+        async with cond:
+            await cond.wait_for(lambda: self._in_flight < self.limit)
+            self._in_flight += 1
+        self._publish()
+
+    async def _release(self, latency: float, failed: bool) -> None:
+        cond = self._condition()
+        async with cond:
+            self._in_flight -= 1
+            self._adjust(latency, failed)
+            cond.notify_all()
+        self._publish()
+
+    def _adjust(self, latency: float, failed: bool) -> None:
+        if not failed and latency <= self.latency_target:
+            self._limit = min(self.max_limit, self._limit + 1 / max(self._limit, 1))
+            return
+
+        now = time.monotonic()
+        if now - self._last_decrease < self.latency_target:
+            return
+
+        anterior = self.limit
+        self._limit = max(float(self.min_limit), self._limit * self.backoff)
+        self._last_decrease = now
+        reason = "error" if failed else "latency"
+        CONCURRENCY_DECREASES.inc(limiter=self.name, reason=reason)
+        logger.info(
+            "Límite de concurrencia reducido",
+            extra={"limiter": self.name, "reason": reason, "from": anterior, "to": self.limit},
+        )
+
+    def _publish(self) -> None:
+        CONCURRENCY_LIMIT.set(self.limit, limiter=self.name)
+        CONCURRENCY_IN_FLIGHT.set(self._in_flight, limiter=self.name)
@@ -0,0 +1,24 @@
+"""
+Parseo de JSON desde bytes: orjson si está instalado, si no la stdlib.
+
+orjson parsea directo de bytes y es varias veces más rápido que json
+para los updates del webhook. Es opcional (pip install orjson): sin él,
+json.loads también acepta bytes y se ahorra el decode a str.
+
+Los errores de parseo son json.JSONDecodeError con cualquiera de los
+dos (orjson.JSONDecodeError hereda de él).
+"""
+import json
+
+try:
+    import orjson
+except ImportError:                         # pragma: no cover - depende del entorno
+    orjson = None
+
+BACKEND = "orjson" if orjson is not None else "json"
+
+
+def loads(data: bytes | str):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
@@ -0,0 +1,60 @@
+"""
+Hooks de arranque y apagado para la app ASGI.
+
+El ASGIHandler de Django solo atiende HTTP: un mensaje de lifespan le
+levanta ValueError y uvicorn sigue sin hooks. Este wrapper atiende el
+lifespan y le pasa el resto a Django:
+
+    application = Lifespan(
+        get_asgi_application(),
+        on_startup=[redis_client.warm_up],
+        on_shutdown=[redis_client.close_all],
+    )
+
+Los hooks corren en el loop del servidor, el mismo de los requests: los
+pools que abren son los que después usan las vistas.
+"""
+import logging
+from typing import Awaitable, Callable, Sequence
+
+logger = logging.getLogger(__name__)
+
+Hook = Callable[[], Awaitable[None]]
+
+
+class Lifespan:
+    def __init__(
+        self,
+        app,
+        *,
+        on_startup: Sequence[Hook] = (),
+        on_shutdown: Sequence[Hook] = (),
+    ):
+        self.app = app
+        self.on_startup = list(on_startup)
+        self.on_shutdown = list(on_shutdown)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "lifespan":
+            return await self.app(scope, receive, send)
+
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                if not await self._run(self.on_startup, "startup", send):
+                    return
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                if await self._run(self.on_shutdown, "shutdown", send):
+                    await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _run(self, hooks: Sequence[Hook], phase: str, send) -> bool:
+        for hook in hooks:
+            try:
+                await hook()
+            except Exception as exc:
+                logger.exception(f"Falló un hook de {phase}", extra={"hook": repr(hook)})
+                await send({"type": f"lifespan.{phase}.failed", "message": str(exc)})
+                return False
+        return True
@@ -0,0 +1,249 @@
+"""
+Métricas en proceso, exportables en el formato de texto de Prometheus.
+
+Deliberadamente mínimo: contadores, gauges e histogramas con labels, sin
+dependencias nuevas. Cada proceso (webhook, worker) tiene su propio
+registro; la agregación entre procesos es trabajo del scraper.
+
+Las métricas se declaran a nivel de módulo en quien las usa:
+
+    CALLBACK_LATENCY = metrics.histogram(
+        "bot_event_latency_seconds", "...", labelnames=("event_type",)
+    )
+    CALLBACK_LATENCY.observe(0.42, event_type="callback")
+
+Declarar dos veces el mismo nombre devuelve la misma instancia — los
+módulos se pueden importar en cualquier orden.
+"""
+import asyncio
+import logging
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Buckets por defecto, en segundos. Cubren desde un round-trip a Redis
+# hasta el ack de Telegram vencido (~60s).
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_lock = threading.Lock()
+_REGISTRY: dict[str, "_Metric"] = {}
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: dict[tuple[str, ...], object] = {}
+
+    def _key(self, labels: dict) -> tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(
+                f"{self.name}: labels {sorted(labels)} no coinciden con {list(self.labelnames)}"
+            )
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, key: tuple[str, ...], extra: dict | None = None) -> str:
+        pares = list(zip(self.labelnames, key)) + list((extra or {}).items())
+        if not pares:
+            return ""
+        cuerpo = ",".join(f'{k}="{_escape(v)}"' for k, v in pares)
+        return "{" + cuerpo + "}"
+
+    def clear(self) -> None:
+        with _lock:
+            self._values.clear()
+
+    def samples(self) -> list[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        if amount < 0:
+            raise ValueError("Un counter no puede decrementar")
+        key = self._key(labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> list[str]:
+        return [
+            f"{self.name}{self._labels(key)} {_fmt(value)}"
+            for key, value in sorted(self._values.items())
+        ]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with _lock:
+            self._values[key] = float(value)
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> list[str]:
+        return [
+            f"{self.name}{self._labels(key)} {_fmt(value)}"
+            for key, value in sorted(self._values.items())
+        ]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with _lock:
+            estado = self._values.get(key)
+            if estado is None:
+                # [conteos por bucket..., sum, count]
+                estado = [0] * len(self.buckets) + [0.0, 0]
+                self._values[key] = estado
+            for i, limite in enumerate(self.buckets):
+                if value <= limite:
+                    estado[i] += 1
+            estado[-2] += value
+            estado[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observa la duración del bloque, termine bien o con excepción."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> int:
+        estado = self._values.get(self._key(labels))
+        return estado[-1] if estado else 0
+
+    def sum(self, **labels) -> float:
+        estado = self._values.get(self._key(labels))
+        return estado[-2] if estado else 0.0
+
+    def samples(self) -> list[str]:
+        lineas = []
+        for key, estado in sorted(self._values.items()):
+            for limite, conteo in zip(self.buckets, estado):
+                etiquetas = self._labels(key, {"le": _fmt(limite)})
+                lineas.append(f"{self.name}_bucket{etiquetas} {conteo}")
+            etiquetas = self._labels(key, {"le": "+Inf"})
+            lineas.append(f"{self.name}_bucket{etiquetas} {estado[-1]}")
+            lineas.append(f"{self.name}_sum{self._labels(key)} {_fmt(estado[-2])}")
+            lineas.append(f"{self.name}_count{self._labels(key)} {estado[-1]}")
+        return lineas
+
+
+def _register(cls, name, documentation, labelnames, **kwargs):
+    with _lock:
+        existente = _REGISTRY.get(name)
+        if existente is not None:
+            if not isinstance(existente, cls) or existente.labelnames != tuple(labelnames):
+                raise ValueError(f"Métrica {name!r} ya registrada con otra forma")
+            return existente
+        metrica = cls(name, documentation, tuple(labelnames), **kwargs)
+        _REGISTRY[name] = metrica
+        return metrica
+
+
+def counter(name: str, documentation: str, labelnames=()) -> Counter:
+    return _register(Counter, name, documentation, labelnames)
+
+
+def gauge(name: str, documentation: str, labelnames=()) -> Gauge:
+    return _register(Gauge, name, documentation, labelnames)
+
+
+def histogram(name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+    return _register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+
+def render() -> str:
+    """Todas las métricas registradas, en el formato de texto de Prometheus 0.0.4."""
+    lineas = []
+    for nombre in sorted(_REGISTRY):
+        metrica = _REGISTRY[nombre]
+        lineas.append(f"# HELP {nombre} {metrica.documentation}")
+        lineas.append(f"# TYPE {nombre} {metrica.kind}")
+        lineas.extend(metrica.samples())
+    return "\n".join(lineas) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+async def serve(host: str, port: int) -> asyncio.AbstractServer:
+    """
+    Exporter HTTP mínimo para procesos sin servidor web (el worker).
+
+    Responde render() a cualquier GET; no hay rutas ni keep-alive. Pensado
+    para un scraper en la misma máquina o red: no tiene autenticación.
+    """
+    async def _handle(reader, writer):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+            # Consumir los headers: cerrar con datos sin leer manda un RST.
+            while (await asyncio.wait_for(reader.readline(), timeout=5)).strip():
+                pass
+            if request_line.split(b" ", 1)[0] == b"GET":
+                status, body = "200 OK", render().encode()
+            else:
+                status, body = "405 Method Not Allowed", b""
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: {CONTENT_TYPE}\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode()
+                + body
+            )
+            await writer.drain()
+        except Exception:
+            logger.debug("Fallo atendiendo un scrape", exc_info=True)
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(_handle, host, port)
+    logger.info("Métricas expuestas", extra={"host": host, "port": port})
+    return server
+
+
+def reset() -> None:
+    """Vacía los valores sin desregistrar las métricas. Para tests."""
+    for metrica in _REGISTRY.values():
+        metrica.clear()
+
+
+def _fmt(value: float) -> str:
+    if isinstance(value, float) and math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value)) if abs(value) < 1e15 else repr(float(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
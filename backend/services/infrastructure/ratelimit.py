@@ -0,0 +1,100 @@
+"""
+Token bucket en Redis, atómico, compartido por todos los procesos.
+
+Cada clave tiene un balde de `burst` fichas que se rellena a `rate`
+fichas por segundo. Cada evento gasta una; sin fichas, el evento queda
+limitado y `retry_after` dice cuánto falta para la próxima.
+
+Todo pasa en un script Lua: leer el balde, rellenarlo por el tiempo
+transcurrido, gastar y guardar, sin carreras entre procesos web. El
+reloj es el de Redis (TIME), no el de cada proceso.
+
+Además del balde, el script marca un aviso por episodio: la primera vez
+que una clave queda limitada devuelve notify=True, y no lo vuelve a
+devolver hasta que el balde tuvo tiempo de llenarse entero. Quien llama
+decide qué hacer con eso (contestarle al usuario una sola vez).
+
+Uso:
+
+    bucket = TokenBucket("ratelimit")
+    decision = await bucket.take("telegram:111", rate=0.5, burst=20)
+    if not decision.allowed: ...
+
+Vive en la db de cache (ver redis_client), detrás de su breaker
+(redis_client.guarded). Los errores de Redis suben, también CircuitOpen
+y TimeoutError: quien llama elige si falla abierto o cerrado.
+"""
+import hashlib
+from dataclasses import dataclass
+
+from redis.exceptions import NoScriptError
+
+from services.infrastructure.redis_client import get_redis, guarded
+
+# KEYS: balde, aviso
+# ARGV: fichas por segundo, capacidad
+TAKE_SCRIPT = """
+local now = redis.call('TIME')
+local t = tonumber(now[1]) + tonumber(now[2]) / 1000000
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local refill = burst / rate
+
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or t
+tokens = math.min(burst, tokens + math.max(0, t - ts) * rate)
+
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(t))
+redis.call('EXPIRE', KEYS[1], math.ceil(refill) + 1)
+if allowed == 1 then
+    return {1, 0, 0}
+end
+
+local wait_ms = math.ceil((1 - tokens) / rate * 1000)
+local notify = 0
+if redis.call('SET', KEYS[2], '1', 'PX', math.ceil(refill * 1000), 'NX') then
+    notify = 1
+end
+return {0, wait_ms, notify}
+"""
+_SHA = hashlib.sha1(TAKE_SCRIPT.encode()).hexdigest()
+
+
+@dataclass(frozen=True)
+class Decision:
+    allowed: bool
+    retry_after: float = 0.0    # segundos hasta la próxima ficha
+    notify: bool = False        # primera negativa del episodio
+
+
+ALLOWED = Decision(allowed=True)
+
+
+class TokenBucket:
+    def __init__(self, prefix: str, *, purpose: str = "cache"):
+        self.prefix = prefix
+        self.purpose = purpose
+
+    def keys(self, key: str) -> list[str]:
+        return [f"{self.prefix}:{key}", f"{self.prefix}:notice:{key}"]
+
+    async def take(self, key: str, *, rate: float, burst: int) -> Decision:
+        """Gasta una ficha de `key`. rate en fichas por segundo, burst > 0."""
+        keys = self.keys(key)
+        async with guarded(self.purpose):
+            redis = await get_redis(self.purpose)
+            try:
+                result = await redis.evalsha(_SHA, len(keys), *keys, rate, burst)
+            except NoScriptError:
+                result = await redis.eval(TAKE_SCRIPT, len(keys), *keys, rate, burst)
+
+        allowed, wait_ms, notify = (int(v) for v in result)
+        if allowed:
+            return ALLOWED
+        return Decision(allowed=False, retry_after=wait_ms / 1000, notify=bool(notify))
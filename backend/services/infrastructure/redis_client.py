@@ -7,17 +7,66 @@ Cada `purpose` mapea a una database distinta para aislamiento operacional.
 Databases:
     0 - jobs:  Cola de ARQ (mensajes de Telegram entrantes)
     1 - state: Estado de conversación del bot (cat_state:{channel}:{external_user_id})
-    2 - cache: Idempotencia de webhooks (idempotency:{channel}:{message_id}) 
-                y rate limiting fuutro
+    2 - cache: Idempotencia de webhooks (idempotency:{channel}:{message_id})
+                y rate limit por usuario (ratelimit:{channel}:{external_user_id})
+
+Con REDIS_SHARED_DB todos los purposes van a la db de REDIS_URL (Redis
+administrado o Cluster, que no tienen SELECT): las claves ya están
+namespaceadas y los tres comparten un solo pool de conexiones.
+
+Pools: uno por event loop y por database. Una conexión de redis-py queda
+atada al loop en el que se abrió; un pool creado en un loop (el del
+preload de gunicorn, el de un async_to_sync) y usado desde otro falla de
+formas raras. El registro es un WeakKeyDictionary por loop: un loop que
+se cierra se lleva sus pools. Cada pool:
+
+  - tiene tope de conexiones (REDIS_MAX_CONNECTIONS) y, lleno, espera
+    hasta REDIS_POOL_TIMEOUT por una libre en vez de abrir otra;
+  - hace PING antes de usar una conexión quieta más de
+    REDIS_HEALTH_CHECK_INTERVAL, y reconecta si no contesta;
+  - cierra las conexiones ociosas más de REDIS_IDLE_TIMEOUT (reap_idle,
+    que corre en segundo plano desde warm_up).
+
+Ciclo de vida: warm_up() al arrancar (worker y app ASGI, ver
+config/asgi.py) y close_all() al apagar, en el mismo loop.
+
+Llamadas protegidas: los consumidores del camino caliente (estado,
+cache, el productor de jobs) envuelven sus llamadas en guarded(purpose),
+que les pone un timeout (REDIS_CALL_TIMEOUT) y un circuit breaker por
+purpose. Un Redis lento o caído falla en milisegundos en vez de colgar
+cada mensaje hasta el timeout de la conexión; cada consumidor decide su
+fallback (CircuitOpen o TimeoutError).
 """
+import asyncio
 import logging
-from arq import create_pool
-from arq.connections import RedisSettings
+import time
+import weakref
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+
+from arq.connections import ArqRedis
 from django.conf import settings
+from redis.asyncio import BlockingConnectionPool
+from redis.exceptions import RedisError
+
+from services.channels.codec import deserialize_job, serialize_job
+from services.infrastructure import metrics
+from services.infrastructure.circuit import CircuitBreaker
 
 logger = logging.getLogger(__name__)
 
-_pools = {}
+POOL_CONNECTIONS = metrics.gauge(
+    "bot_redis_pool_connections",
+    "Conexiones de los pools de Redis de este proceso, por database",
+    labelnames=("db", "state"),
+)
+POOL_REAPED = metrics.counter(
+    "bot_redis_reaped_connections_total",
+    "Conexiones a Redis cerradas por estar ociosas",
+    labelnames=("db",),
+)
+
+_CONNECT_TIMEOUT = 1     # segundos; el mismo que usa create_pool de ARQ
 
 _DATABASES = {
     "jobs":  0,
@@ -26,41 +75,217 @@ _DATABASES = {
 }
 
 
-def _get_url_for_purpose(purpose: str) -> str:
-    """
-    Construye la URL de Redis para el purpose dado.
-    Reemplaza el número de database al final de la URL base.
-    """
+class _Pool(BlockingConnectionPool):
+    """BlockingConnectionPool que recuerda cuándo se devolvió cada conexión."""
+
+    async def release(self, connection):
+        connection.released_at = time.monotonic()
+        await super().release(connection)
+
+    async def reap(self, idle: float) -> int:
+        """Cierra las conexiones libres ociosas más de `idle` segundos."""
+        cutoff = time.monotonic() - idle
+        stale = [c for c in self._available_connections if c.released_at < cutoff]
+        if not stale:
+            return 0
+        # Fuera de la lista antes del await: nadie más las puede tomar.
+        self._available_connections = [
+            c for c in self._available_connections if c.released_at >= cutoff
+        ]
+        await asyncio.gather(*(c.disconnect() for c in stale), return_exceptions=True)
+        return len(stale)
+
+    def counts(self) -> tuple[int, int]:
+        return len(self._in_use_connections), len(self._available_connections)
+
+
+@dataclass
+class _LoopPools:
+    """Lo que el registro guarda por event loop."""
+    pools: dict[int, ArqRedis] = field(default_factory=dict)
+    reaper: asyncio.Task | None = None
+
+
+_registry: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, _LoopPools]" = (
+    weakref.WeakKeyDictionary()
+)
+_breakers: dict[str, CircuitBreaker] = {}
+
+
+def database_for(purpose: str) -> int:
+    """Número de database del purpose. Para scripts que cambian de db con SELECT."""
     if purpose not in _DATABASES:
         raise ValueError(
             f"Purpose '{purpose}' no reconocido. "
             f"Opciones válidas: {list(_DATABASES.keys())}"
         )
+    if settings.REDIS_SHARED_DB:
+        return _url_database()
+    return _DATABASES[purpose]
+
 
+def _url_database() -> int:
+    """La db de REDIS_URL (redis://host:6379/3 → 3); sin número, 0."""
+    tail = settings.REDIS_URL.rsplit("/", 1)[-1]
+    return int(tail) if tail.isdigit() else 0
+
+
+def _get_url_for_database(db: int) -> str:
+    """
+    Construye la URL de Redis para la database dada.
+    Reemplaza el número de database al final de la URL base.
+    """
     base_url = settings.REDIS_URL.rsplit("/", 1)[0]
-    db = _DATABASES[purpose]
     return f"{base_url}/{db}"
 
 
+def _loop_pools() -> _LoopPools:
+    loop = asyncio.get_running_loop()
+    entry = _registry.get(loop)
+    if entry is None:
+        entry = _registry[loop] = _LoopPools()
+    return entry
+
+
+def _create(db: int) -> ArqRedis:
+    """Sin I/O: la primera conexión se abre con el primer comando."""
+    pool = _Pool.from_url(
+        _get_url_for_database(db),
+        max_connections=settings.REDIS_MAX_CONNECTIONS,
+        timeout=settings.REDIS_POOL_TIMEOUT,
+        health_check_interval=settings.REDIS_HEALTH_CHECK_INTERVAL,
+        socket_connect_timeout=_CONNECT_TIMEOUT,
+        socket_keepalive=True,
+    )
+    return ArqRedis(
+        pool,
+        job_serializer=serialize_job,
+        job_deserializer=deserialize_job,
+    )
+
+
 async def get_redis(purpose: str = "jobs"):
     """
-    Retorna el pool de Redis para el purpose solicitado.
-    Crea el pool en el primer acceso y lo reutiliza en llamadas posteriores.
+    Retorna el pool de Redis para el purpose solicitado, en el loop actual.
+    Crea el pool en el primer acceso y lo reutiliza en llamadas posteriores
+    del mismo loop. Los purposes que caen en la misma database comparten
+    pool.
+
+    Todos los pools usan el codec compacto de jobs: enqueue_job solo se usa
+    en "jobs", pero así ningún productor puede encolar en el formato viejo.
+    """
+    db = database_for(purpose)
+    pools = _loop_pools().pools
+    if db not in pools:
+        logger.info(f"Initializing Redis pool for purpose='{purpose}' db={db}")
+        pools[db] = _create(db)
+    return pools[db]
+
+
+async def reap_idle() -> int:
+    """
+    Cierra las conexiones ociosas de los pools del loop actual y publica
+    cuántas hay. Devuelve cuántas cerró.
     """
-    if purpose not in _pools:
-        url = _get_url_for_purpose(purpose)
-        logger.info(f"Initializing Redis pool for purpose='{purpose}' db={_DATABASES[purpose]}")
-        _pools[purpose] = await create_pool(RedisSettings.from_dsn(url))
+    reaped = 0
+    for db, redis in _loop_pools().pools.items():
+        n = await redis.connection_pool.reap(settings.REDIS_IDLE_TIMEOUT)
+        if n:
+            POOL_REAPED.inc(n, db=str(db))
+            reaped += n
+        in_use, idle = redis.connection_pool.counts()
+        POOL_CONNECTIONS.set(in_use, db=str(db), state="in_use")
+        POOL_CONNECTIONS.set(idle, db=str(db), state="idle")
+    return reaped
 
-    return _pools[purpose]
+
+async def _reap_forever(interval: float) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await reap_idle()
+        except Exception as exc:
+            logger.warning("Falló el reaper de Redis", extra={"error_info": str(exc)})
+
+
+async def warm_up(purposes=tuple(_DATABASES)) -> None:
+    """
+    Hook de arranque (worker, app ASGI). Abre los pools del loop actual,
+    les hace PING y arranca el reaper de conexiones ociosas.
+
+    Un Redis caído no impide arrancar: se loguea y el breaker de cada
+    purpose se ocupa de las llamadas (ver guarded).
+    """
+    entry = _loop_pools()
+    for purpose in purposes:
+        redis = await get_redis(purpose)
+        try:
+            async with asyncio.timeout(_CONNECT_TIMEOUT * 2):
+                await redis.ping()
+        except (RedisError, OSError, TimeoutError) as exc:
+            logger.warning(
+                "Redis no contesta al arrancar",
+                extra={"purpose": purpose, "error_info": str(exc)},
+            )
+    if settings.REDIS_IDLE_TIMEOUT and entry.reaper is None:
+        entry.reaper = asyncio.create_task(
+            _reap_forever(max(1.0, settings.REDIS_IDLE_TIMEOUT / 2)),
+            name="redis-reaper",
+        )
 
 
 async def close_all() -> None:
     """
-    Cierra todos los pools abiertos limpiamente.
-    Llamar desde el shutdown hook del worker.
+    Cierra todos los pools del loop actual limpiamente, y su reaper.
+    Llamar desde el shutdown hook del worker o de la app ASGI.
     """
-    for purpose, pool in _pools.items():
-        await pool.close()
-        logger.info(f"Redis pool closed for purpose='{purpose}'")
-    _pools.clear()
\ No newline at end of file
+    loop = asyncio.get_running_loop()
+    entry = _registry.pop(loop, None)
+    if entry is None:
+        return
+    if entry.reaper is not None:
+        entry.reaper.cancel()
+    for db, redis in entry.pools.items():
+        await redis.connection_pool.disconnect()
+        logger.info(f"Redis pool closed for db={db}")
+
+
+def breaker_for(purpose: str) -> CircuitBreaker:
+    """Un breaker por purpose y por proceso: circuit "redis:{purpose}"."""
+    database_for(purpose)
+    if purpose not in _breakers:
+        _breakers[purpose] = CircuitBreaker(
+            f"redis:{purpose}",
+            min_calls=20,
+            slow_call=settings.REDIS_SLOW_CALL,
+            slow_rate=0.5,
+            open_for=settings.REDIS_BREAKER_OPEN_FOR,
+        )
+    return _breakers[purpose]
+
+
+def _is_redis_failure(exc: Exception) -> bool:
+    """Lo que dice algo de la salud de Redis; un bug del que llama, no."""
+    return isinstance(exc, (RedisError, OSError, TimeoutError))
+
+
+@asynccontextmanager
+async def guarded(purpose: str):
+    """
+    Timeout y circuit breaker alrededor del bloque:
+
+        async with guarded("state"):
+            redis = await get_redis("state")
+            value = await redis.get(key)
+
+    Levanta CircuitOpen sin tocar Redis si el breaker está abierto, y
+    TimeoutError si el bloque tarda más de REDIS_CALL_TIMEOUT.
+    """
+    async with breaker_for(purpose).guard(is_failure=_is_redis_failure):
+        async with asyncio.timeout(settings.REDIS_CALL_TIMEOUT or None):
+            yield
+
+
+def reset_breakers() -> None:
+    """Para tests: cada breaker arranca cerrado."""
+    _breakers.clear()
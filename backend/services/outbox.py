@@ -0,0 +1,252 @@
+"""
+Transactional outbox de las respuestas del bot.
+
+El problema: handle_message crea el gasto y después responde. Si el job
+muere entre las dos cosas, el gasto existe y el usuario nunca se entera;
+y reintentar el job lo duplicaba.
+
+Ahora la respuesta se escribe como fila de OutboxMessage en la misma
+transacción que el gasto (services.expenses.create_expense_with_reply).
+Entregarla es un paso aparte:
+
+  - deliver(): camino rápido, el handler la manda apenas commitea.
+  - relay(): barrido periódico (cron del worker) de lo que quedó sin
+    enviar — el camino rápido falló, o el worker murió antes.
+
+Entrega at-least-once: una fila se marca enviada después de que el canal
+confirma. Dedup por id de fila: dos relays no toman la misma fila (reclamo
+con UPDATE condicional) y una fila con sent_at no se vuelve a mandar. El
+único duplicado posible es un envío confirmado por el canal cuya marca no
+llegó a la base.
+
+event_key ("canal:message_id") es único: reprocesar el mismo evento
+encuentra la fila (already_handled) en vez de crear otro gasto. Eso es lo
+que hace reintentable la etapa de dispatch para los mensajes.
+"""
+import asyncio
+import logging
+import uuid
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.db.models import F, Q
+from django.utils import timezone
+
+from apps.core.models import OutboxMessage
+from services.channels.events import ChannelEvent
+from services.channels.senders import Option, Rows, get_sender
+from services.infrastructure import metrics
+from services.infrastructure.circuit import CircuitOpen
+
+logger = logging.getLogger(__name__)
+
+# Cuánto dura el reclamo de un relay sobre una fila. Pasado eso, si no la
+# marcó (murió a mitad de camino), otro relay la retoma.
+CLAIM_TTL = timedelta(seconds=60)
+
+# Después de tantos intentos fallidos la fila queda para revisión manual.
+MAX_ATTEMPTS = 10
+
+OUTBOX_SENT = metrics.counter(
+    "bot_outbox_sent_total",
+    "Respuestas del outbox entregadas al canal",
+    labelnames=("channel", "path"),
+)
+OUTBOX_FAILURES = metrics.counter(
+    "bot_outbox_failures_total",
+    "Intentos de entrega del outbox que fallaron",
+    labelnames=("channel",),
+)
+OUTBOX_DELIVERY_LAG = metrics.histogram(
+    "bot_outbox_delivery_lag_seconds",
+    "Desde que la respuesta se commitea hasta que el canal la confirma",
+    labelnames=("channel",),
+)
+
+
+def event_key(event: ChannelEvent) -> str:
+    return f"{event.channel}:{event.message_id}"
+
+
+def dump_options(options: Rows | None) -> list | None:
+    if not options:
+        return None
+    return [[{"id": o.id, "label": o.label} for o in fila] for fila in options]
+
+
+def load_options(data: list | None) -> Rows | None:
+    if not data:
+        return None
+    return [[Option(**o) for o in fila] for fila in data]
+
+
+def _add_reply_sync(
+    *,
+    event_key: str | None,
+    channel: str,
+    conversation_id: str,
+    text: str,
+    options: Rows | None = None,
+    parse_mode: str | None = None,
+) -> OutboxMessage:
+    """Inserta la respuesta. Se llama adentro de la transacción del efecto."""
+    return OutboxMessage.objects.create(
+        event_key=event_key,
+        channel=channel,
+        conversation_id=str(conversation_id),
+        text=text,
+        options=dump_options(options),
+        parse_mode=parse_mode or "",
+    )
+
+
+async def already_handled(event: ChannelEvent) -> OutboxMessage | None:
+    """La fila que dejó un procesamiento anterior de este evento, si hubo."""
+    return await OutboxMessage.objects.filter(event_key=event_key(event)).afirst()
+
+
+async def deliver(message: OutboxMessage, sender=None) -> bool:
+    """
+    Camino rápido: reclama y envía una fila puntual. Un fallo no propaga;
+    la fila queda para el relay.
+    """
+    claimed = await _claim(ids=[message.id])
+    if not claimed:
+        return False        # ya enviada, o la tiene otro relay
+    return await _send(claimed[0], sender or get_sender(message.channel), path="inline")
+
+
+async def deliver_many(messages: list[OutboxMessage], *, path: str = "inline") -> int:
+    """
+    Varias filas con un solo reclamo. Los envíos salen concurrentes: el
+    ritmo lo pone el throttle del sender. Devuelve cuántas se entregaron;
+    las demás quedan para el relay.
+    """
+    if not messages:
+        return 0
+    claimed = await _claim(ids=[m.id for m in messages], batch_size=len(messages))
+
+    async def _one(message: OutboxMessage) -> bool:
+        try:
+            sender = get_sender(message.channel)
+        except Exception:
+            logger.error("Outbox sin sender para el canal", extra={"outbox_id": message.id},
+                         exc_info=True)
+            return False
+        return await _send(message, sender, path=path)
+
+    return sum(await asyncio.gather(*(_one(m) for m in claimed)))
+
+
+async def relay(batch_size: int = 50) -> int:
+    """Un barrido: reclama hasta `batch_size` filas pendientes y las envía en orden."""
+    enviadas = 0
+    for message in await _claim(batch_size=batch_size):
+        try:
+            sender = get_sender(message.channel)
+        except Exception:
+            logger.error("Outbox sin sender para el canal", extra={"outbox_id": message.id},
+                         exc_info=True)
+            continue
+        enviadas += await _send(message, sender, path="relay")
+    return enviadas
+
+
+# ---------------------------------------------------------------
+
+async def _send(message: OutboxMessage, sender, *, path: str) -> bool:
+    # `deliver` espera la confirmación del canal (ThrottledSender); `reply`
+    # de un sender sin cola ya la espera.
+    send = getattr(sender, "deliver", None) or sender.reply
+    try:
+        await send(
+            message.conversation_id,
+            message.text,
+            options=load_options(message.options),
+            parse_mode=message.parse_mode or None,
+        )
+    except Exception as exc:
+        OUTBOX_FAILURES.inc(channel=message.channel)
+        logger.warning(
+            "Fallo la entrega de una respuesta del outbox",
+            extra={"outbox_id": message.id, "attempt": message.attempts},
+            exc_info=True,
+        )
+        await _release(message, exc, retry_after=_retry_after(sender, exc))
+        return False
+
+    await _mark_sent(message)
+    OUTBOX_SENT.inc(channel=message.channel, path=path)
+    OUTBOX_DELIVERY_LAG.observe(
+        (timezone.now() - message.created_at).total_seconds(), channel=message.channel
+    )
+    return True
+
+
+def _retry_after(sender, exc: Exception) -> float:
+    """Lo que pidió esperar el canal (429). 0 si no dijo nada."""
+    retry_hint = getattr(sender, "retry_hint", None)
+    hint = retry_hint(exc) if retry_hint else None
+    return (hint.retry_after or 0.0) if hint else 0.0
+
+
+@sync_to_async
+def _claim(*, ids=None, batch_size: int = 50) -> list[OutboxMessage]:
+    now = timezone.now()
+    token = uuid.uuid4()
+
+    pending = OutboxMessage.objects.filter(
+        Q(locked_until__isnull=True) | Q(locked_until__lt=now),
+        sent_at__isnull=True,
+        attempts__lt=MAX_ATTEMPTS,
+    )
+    if ids is not None:
+        pending = pending.filter(id__in=ids)
+
+    candidatos = list(pending.order_by("id").values_list("id", flat=True)[:batch_size])
+    if not candidatos:
+        return []
+
+    # UPDATE condicional: si otro relay reclamó una fila entre el SELECT y
+    # acá, la condición ya no matchea y la fila no se toma dos veces.
+    pending.filter(id__in=candidatos).update(
+        claim=token,
+        locked_until=now + CLAIM_TTL,
+        attempts=F("attempts") + 1,
+    )
+    return list(OutboxMessage.objects.filter(claim=token).order_by("id"))
+
+
+@sync_to_async
+def _mark_sent(message: OutboxMessage) -> None:
+    OutboxMessage.objects.filter(id=message.id, claim=message.claim).update(
+        sent_at=timezone.now(), claim=None, locked_until=None, last_error=""
+    )
+
+
+@sync_to_async
+def _release(message: OutboxMessage, exc: Exception, *, retry_after: float = 0.0) -> None:
+    if isinstance(exc, CircuitOpen):
+        # El breaker del canal la cortó sin mandarla: no gasta un intento y
+        # vuelve cuando el breaker deje salir la próxima prueba.
+        OutboxMessage.objects.filter(id=message.id, claim=message.claim).update(
+            claim=None,
+            attempts=F("attempts") - 1,
+            locked_until=timezone.now() + timedelta(seconds=max(retry_after, exc.retry_after)),
+            last_error=f"{type(exc).__name__}: {exc}"[:1000],
+        )
+        return
+
+    # Backoff exponencial acotado: el próximo barrido la ignora hasta entonces.
+    # Si el canal pidió esperar más (429), manda el canal.
+    espera = timedelta(seconds=max(min(2 ** message.attempts, 300), retry_after))
+    OutboxMessage.objects.filter(id=message.id, claim=message.claim).update(
+        claim=None,
+        locked_until=timezone.now() + espera,
+        last_error=f"{type(exc).__name__}: {exc}"[:1000],
+    )
+    if message.attempts >= MAX_ATTEMPTS:
+        logger.error(
+            "Respuesta del outbox abandonada tras agotar los intentos",
+            extra={"outbox_id": message.id, "channel": message.channel},
+        )
@@ -21,6 +21,16 @@ def mock_redis_state():
         yield {"get": mock_get, "clear": mock_clear}
 
 
+@pytest.fixture(autouse=True)
+def teclados_limpios():
+    """El cache de teclados es del proceso; los ids se repiten entre tests."""
+    from apps.bot.handlers import helpers
+
+    helpers._keyboards.clear()
+    yield
+    helpers._keyboards.clear()
+
+
 class FakeSender:
     """
     Sender de test que registra lo enviado en vez de hablar con una API.
@@ -0,0 +1,161 @@
+"""
+Tests de los envíos masivos: paginado por keyset, contenido por lote,
+checkpoint y reanudación sin duplicar.
+"""
+from datetime import datetime
+from decimal import Decimal
+from io import StringIO
+from unittest.mock import patch
+
+import pytest
+from asgiref.sync import sync_to_async
+from django.core.management import call_command
+
+from apps.bot import broadcast
+from apps.core.models import BroadcastRun, Expense, OutboxMessage
+from services.constants import USER_TZ
+from tests.bot.conftest import FakeSender
+from tests.factories import UserFactory
+
+pytestmark = pytest.mark.django_db(transaction=True)
+
+
+@pytest.fixture
+def sender():
+    fake = FakeSender()
+    with patch("services.outbox.get_sender", return_value=fake):
+        yield fake
+
+
+async def _usuario(*, gastos=(), notificaciones=True, status=Expense.STATUS_CONFIRMED):
+    user = await sync_to_async(UserFactory)(notifications_enabled=notificaciones)
+    for monto in gastos:
+        await Expense.objects.acreate(
+            user=user, amount=Decimal(monto), description="algo", status=status,
+            date=datetime(2026, 9, 15, 12, tzinfo=USER_TZ),
+        )
+    return user
+
+
+class TestPeriodos:
+
+    def test_resumen_mensual_los_primeros_dias_desde_las_10(self):
+        periodo = broadcast.KINDS["monthly_summary"].period
+
+        assert periodo(datetime(2026, 10, 1, 9, tzinfo=USER_TZ)) is None
+        assert periodo(datetime(2026, 10, 1, 10, tzinfo=USER_TZ)) == "2026-09"
+        assert periodo(datetime(2026, 1, 2, 8, tzinfo=USER_TZ)) == "2025-12"
+        assert periodo(datetime(2026, 10, 15, 10, tzinfo=USER_TZ)) is None
+
+    def test_recordatorio_a_las_20(self):
+        periodo = broadcast.KINDS["pending_reminder"].period
+
+        assert periodo(datetime(2026, 10, 19, 19, tzinfo=USER_TZ)) is None
+        assert periodo(datetime(2026, 10, 19, 20, tzinfo=USER_TZ)) == "2026-10-19"
+
+
+class TestPasada:
+
+    async def test_resumen_mensual_a_quien_tuvo_gastos(self, sender):
+        con_gastos = await _usuario(gastos=["1000", "500"])
+        await _usuario()                                    # sin gastos: se saltea
+        await _usuario(gastos=["700"], notificaciones=False)
+
+        run = await broadcast.start("monthly_summary", "2026-09")
+        assert run.total == 2
+        while not await broadcast.process_page(run, size=10):
+            pass
+
+        assert len(sender.replies) == 1
+        assert sender.last_reply["to"] == str(con_gastos.telegram_id)
+        assert "septiembre 2026" in sender.last_reply["text"]
+        assert "Total gastado: $1.500" in sender.last_reply["text"]
+
+        await run.arefresh_from_db()
+        assert run.status == BroadcastRun.STATUS_DONE
+        assert (run.processed, run.sent, run.skipped, run.failed) == (2, 1, 1, 0)
+
+    async def test_recordatorio_de_pendientes(self, sender):
+        await _usuario(gastos=["100", "200"], status=Expense.STATUS_PENDING)
+
+        run = await broadcast.start("pending_reminder", "2026-10-19")
+        await broadcast.process_page(run)
+
+        assert "Tenés 2 gastos sin categoría" in sender.last_reply["text"]
+
+    async def test_pagina_por_keyset_y_guarda_el_cursor(self, sender):
+        usuarios = [await _usuario(gastos=["100"]) for _ in range(3)]
+
+        run = await broadcast.start("monthly_summary", "2026-09")
+        await broadcast.process_page(run, size=2)
+
+        assert run.cursor == usuarios[1].id
+        assert run.processed == 2
+        assert len(sender.replies) == 2
+
+    async def test_repetir_una_pagina_no_duplica(self, sender):
+        """El worker murió antes del checkpoint: el tick siguiente la repite."""
+        await _usuario(gastos=["100"])
+        run = await broadcast.start("monthly_summary", "2026-09")
+
+        with patch("apps.bot.broadcast._checkpoint", side_effect=RuntimeError("worker muerto")):
+            with pytest.raises(RuntimeError):
+                await broadcast.process_page(run)
+        await broadcast.process_page(run)
+
+        assert len(sender.replies) == 1
+        assert await OutboxMessage.objects.acount() == 1
+
+    async def test_una_pasada_por_periodo(self):
+        await broadcast.start("monthly_summary", "2026-09")
+        await broadcast.start("monthly_summary", "2026-09")
+
+        assert await BroadcastRun.objects.acount() == 1
+
+
+class TestTick:
+
+    async def test_crea_la_pasada_vencida_y_la_procesa(self, sender, settings):
+        settings.BROADCASTS = ["monthly_summary"]
+        await _usuario(gastos=["100"])
+
+        await broadcast.tick(now=datetime(2026, 10, 1, 12, tzinfo=USER_TZ))
+
+        run = await BroadcastRun.objects.aget()
+        assert run.key == "monthly_summary:2026-09"
+        assert run.status == BroadcastRun.STATUS_DONE
+        assert len(sender.replies) == 1
+
+    async def test_sin_tipos_configurados_no_crea_nada(self, settings):
+        settings.BROADCASTS = []
+
+        await broadcast.tick(now=datetime(2026, 10, 1, 12, tzinfo=USER_TZ))
+
+        assert await BroadcastRun.objects.acount() == 0
+
+    async def test_sin_presupuesto_sigue_en_el_proximo_tick(self, sender, settings):
+        settings.BROADCASTS = []
+        settings.BROADCAST_BATCH_SIZE = 1
+        for _ in range(2):
+            await _usuario(gastos=["100"])
+        await broadcast.start("monthly_summary", "2026-09")
+
+        await broadcast.tick(budget=0)
+        assert len(sender.replies) == 0
+
+        await broadcast.tick()
+        assert len(sender.replies) == 2
+
+
+class TestComando:
+
+    async def test_status_muestra_el_avance(self):
+        await BroadcastRun.objects.acreate(
+            kind="monthly_summary", key="monthly_summary:2026-09", total=4, processed=1
+        )
+        out = StringIO()
+
+        await sync_to_async(call_command, thread_sensitive=False)("broadcast", "status", stdout=out)
+
+        assert "monthly_summary:2026-09" in out.getvalue()
+        assert "25.0%" in out.getvalue()
@@ -2,8 +2,10 @@
 Tests de las acciones de botón, ya agnósticas al canal.
 Cubre delete, restore y todo el flujo de categorización.
 """
+import asyncio
+
 import pytest
-from unittest.mock import MagicMock, patch
+from unittest.mock import AsyncMock, MagicMock, patch
 from django.core.exceptions import ObjectDoesNotExist
 from asgiref.sync import sync_to_async
 
@@ -349,4 +351,62 @@ class TestCatNew:
         )
         assert sender.last_ack["text"] == ""
         assert "nueva categoría" in sender.last_edit["text"].lower()
-        assert sender.last_edit["parse_mode"] == "HTML"
\ No newline at end of file
+        assert sender.last_edit["parse_mode"] == "HTML"
+
+# ============================================
+# ACK Y EDIT CONCURRENTES
+# ============================================
+
+class TestAckConcurrente:
+
+    async def test_el_ack_sale_antes_del_trabajo_en_la_base(
+        self, make_callback_event, base_data, sender
+    ):
+        """cat_list ackea sin texto: no espera a leer las categorías."""
+        data = base_data
+        ack_salio = asyncio.Event()
+        ack_original = sender.ack
+
+        async def _ack(*args, **kwargs):
+            ack_salio.set()
+            await ack_original(*args, **kwargs)
+        sender.ack = _ack
+
+        async def _categorias(user):
+            await asyncio.wait_for(ack_salio.wait(), timeout=1)
+            return []
+
+        with patch("apps.bot.handlers.helpers.get_user_categories_or_defaults", new=_categorias):
+            await on_cat_list_click(
+                make_callback_event(f"cat_list:{data['expense'].id}"),
+                data["user"], sender, str(data["expense"].id),
+            )
+
+        assert len(sender.edits) == 1
+
+    async def test_ack_fallido_no_impide_el_edit(
+        self, make_callback_event, base_data, sender
+    ):
+        data = base_data
+        sender.ack = AsyncMock(side_effect=ConnectionError("Telegram caído"))
+
+        await on_delete_click(
+            make_callback_event(f"del:{data['expense'].id}"),
+            data["user"], sender, str(data["expense"].id),
+        )
+
+        assert "Gasto eliminado" in sender.last_edit["text"]
+
+    async def test_edit_fallido_se_propaga_y_el_ack_se_espera(
+        self, make_callback_event, base_data, sender
+    ):
+        data = base_data
+        sender.edit = AsyncMock(side_effect=ConnectionError("Telegram caído"))
+
+        with pytest.raises(ConnectionError):
+            await on_delete_click(
+                make_callback_event(f"del:{data['expense'].id}"),
+                data["user"], sender, str(data["expense"].id),
+            )
+
+        assert sender.last_ack["text"] == "🗑️ Gasto eliminado"
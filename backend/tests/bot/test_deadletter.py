@@ -0,0 +1,195 @@
+"""
+Tests del dead-letter stream y del comando de replay. Redis se reemplaza
+por un stream en memoria con las tres operaciones que se usan.
+"""
+from decimal import Decimal
+from io import StringIO
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from django.core.management import call_command
+from django.utils import timezone
+
+from apps.bot import deadletter
+from apps.core.models import Expense, OutboxMessage
+
+pytestmark = pytest.mark.django_db(transaction=True)
+
+
+class FakeStream:
+    """XADD / XRANGE / XDEL sobre una lista. Ids crecientes, en bytes como arq."""
+
+    def __init__(self):
+        self.entries = []
+        self.enqueue_job = AsyncMock(return_value=MagicMock())
+
+    async def xadd(self, name, fields, maxlen=None, approximate=True):
+        entry_id = f"{len(self.entries) + 1}-0".encode()
+        self.entries.append((entry_id, {k.encode(): v.encode() for k, v in fields.items()}))
+        return entry_id
+
+    async def xrange(self, name, min="-", max="+", count=None):
+        desde = 0
+        if min.startswith("("):
+            desde = int(min[1:].split("-")[0])
+        page = [e for e in self.entries if int(e[0].split(b"-")[0]) > desde]
+        return page[:count]
+
+    async def xdel(self, name, *ids):
+        antes = len(self.entries)
+        self.entries = [e for e in self.entries if e[0].decode() not in ids]
+        return antes - len(self.entries)
+
+
+@pytest.fixture
+def stream():
+    fake = FakeStream()
+    with patch("apps.bot.deadletter.get_redis", new=AsyncMock(return_value=fake)), \
+         patch("apps.bot.management.commands.dlq.close_all", new=AsyncMock()):
+        yield fake
+
+
+def _fallar(mensaje="Explotó el handler"):
+    try:
+        raise RuntimeError(mensaje)
+    except RuntimeError as exc:
+        return exc
+
+
+async def _registrar(make_event, text="almuerzo 3500", **kwargs):
+    event = make_event(text, **kwargs).to_dict()
+    return await deadletter.record(
+        event, _fallar(), stage=deadletter.STAGE_DISPATCH, attempt=1, job_id="j1"
+    )
+
+
+class TestRecord:
+
+    async def test_guarda_evento_error_y_digest(self, make_event, stream):
+        entry_id = await _registrar(make_event)
+
+        [letter] = [letter async for letter in deadletter.iter_entries()]
+        assert letter.entry_id == entry_id
+        assert letter.event["text"] == "almuerzo 3500"
+        assert "raw" not in letter.event
+        assert letter.error == "builtins.RuntimeError"
+        assert letter.stage == deadletter.STAGE_DISPATCH
+        assert letter.job_id == "j1"
+
+    def test_mismo_lugar_mismo_digest_aunque_cambie_el_mensaje(self):
+        assert (
+            deadletter.traceback_digest(_fallar("a"))
+            == deadletter.traceback_digest(_fallar("b"))
+        )
+
+    async def test_redis_caido_no_propaga(self, make_event):
+        with patch("apps.bot.deadletter.get_redis", side_effect=ConnectionError("caído")):
+            assert await _registrar(make_event) is None
+
+    @pytest.mark.parametrize("event, guardado", [
+        (b"\x80\x04no-es-json", {"unparsed": "b'\\x80\\x04no-es-json'"}),
+        ({"channel": "telegram", "text": b"\xff"}, {"channel": "telegram", "text": "b'\\xff'"}),
+    ])
+    async def test_evento_ilegible_se_registra_igual(self, stream, event, guardado):
+        """El que llega de PRE_DISPATCH: justamente el que no se pudo leer."""
+        await deadletter.record(
+            event, _fallar(), stage=deadletter.STAGE_PRE_DISPATCH, attempt=1, job_id="j1"
+        )
+
+        [letter] = [letter async for letter in deadletter.iter_entries()]
+        assert letter.event == guardado
+
+
+class TestIterEntries:
+
+    async def test_pagina_sin_repetir(self, make_event, stream):
+        for _ in range(5):
+            await _registrar(make_event)
+
+        ids = [letter.entry_id async for letter in deadletter.iter_entries(batch_size=2)]
+
+        assert ids == ["1-0", "2-0", "3-0", "4-0", "5-0"]
+
+
+class TestSideEffectLanded:
+
+    async def test_gasto_ya_guardado(self, make_event, stream, user):
+        await _registrar(make_event, received_at=0)
+        await Expense.objects.acreate(user=user, amount=Decimal("3500"), description="almuerzo",
+                                      date=timezone.now())
+
+        [letter] = [letter async for letter in deadletter.iter_entries()]
+        assert await deadletter.side_effect_landed(letter)
+
+    async def test_respuesta_en_el_outbox(self, make_event, stream, user):
+        await _registrar(make_event)
+        await OutboxMessage.objects.acreate(
+            event_key="telegram:423934621", channel="telegram", conversation_id="1", text="ok"
+        )
+
+        [letter] = [letter async for letter in deadletter.iter_entries()]
+        assert await deadletter.side_effect_landed(letter)
+
+    async def test_sin_gasto(self, make_event, stream, user):
+        await _registrar(make_event)
+
+        [letter] = [letter async for letter in deadletter.iter_entries()]
+        assert not await deadletter.side_effect_landed(letter)
+
+
+class TestComando:
+
+    def _call(self, *args):
+        out = StringIO()
+        call_command("dlq", *args, stdout=out)
+        return out.getvalue()
+
+    async def test_replay_reencola_y_borra(self, make_event, stream, user):
+        await _registrar(make_event)
+
+        salida = await _sync(self._call, "replay", "--rate", "0")
+
+        assert "reencolados: 1" in salida
+        assert stream.entries == []
+        stream.enqueue_job.assert_awaited_once()
+        assert stream.enqueue_job.await_args.kwargs["_job_id"] == "dlq:1-0"
+
+    async def test_replay_saltea_callbacks_y_gastos_guardados(
+        self, make_event, stream, user
+    ):
+        await _registrar(make_event, "cat:1", type="callback", ack_ref="x")
+        await _registrar(make_event, received_at=0)
+        await Expense.objects.acreate(user=user, amount=Decimal("3500"), description="almuerzo",
+                                      date=timezone.now())
+
+        salida = await _sync(self._call, "replay")
+
+        assert "callbacks salteados: 1" in salida
+        assert "ya aplicados: 1" in salida
+        stream.enqueue_job.assert_not_awaited()
+        assert len(stream.entries) == 1      # queda el callback
+
+    async def test_dry_run_no_toca_nada(self, make_event, stream, user):
+        await _registrar(make_event)
+
+        salida = await _sync(self._call, "replay", "--dry-run")
+
+        assert "a reencolar: 1" in salida
+        assert len(stream.entries) == 1
+        stream.enqueue_job.assert_not_awaited()
+
+    async def test_stats_agrupa_por_digest(self, make_event, stream):
+        for _ in range(3):
+            await _registrar(make_event)
+
+        salida = await _sync(self._call, "stats")
+
+        assert "      3  " in salida
+        assert "Total: 3" in salida
+
+
+async def _sync(fn, *args):
+    """El comando hace su propio asyncio.run: corre en un thread aparte."""
+    from asgiref.sync import sync_to_async
+
+    return await sync_to_async(fn, thread_sensitive=False)(*args)
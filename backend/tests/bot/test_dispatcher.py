@@ -5,7 +5,8 @@ garantizaba el registro de handlers de PTB en setup.py.
 import pytest
 from unittest.mock import AsyncMock, MagicMock, patch
 
-from apps.bot.dispatcher import dispatch
+from apps.bot.dispatcher import HANDLER_DURATION, dispatch
+from services.infrastructure import metrics
 
 
 @pytest.fixture
@@ -119,4 +120,23 @@ class TestCallbacks:
         await dispatch(make_callback_event("/start"), user, sender)
 
         handlers["central_callback_handler"].assert_awaited_once()
-        handlers["start_command"].assert_not_awaited()
\ No newline at end of file
+        handlers["start_command"].assert_not_awaited()
+
+class TestMetricas:
+
+    async def test_mide_la_duracion_por_handler(self, make_event, user, sender, handlers):
+        metrics.reset()
+        handlers["handle_message"].__name__ = "handle_message"
+
+        await dispatch(make_event("almuerzo 3500"), user, sender)
+
+        assert HANDLER_DURATION.count(
+            channel="telegram", event_type="message", handler="handle_message"
+        ) == 1
+
+    async def test_comando_desconocido_no_se_mide(self, make_event, user, sender, handlers):
+        metrics.reset()
+
+        await dispatch(make_event("/inventado"), user, sender)
+
+        assert "bot_handler_duration_seconds_count" not in metrics.render()
@@ -3,16 +3,19 @@ Tests de integración de los handlers, ya agnósticos al canal.
 Cubre los tres caminos de handle_message y los comandos principales.
 """
 import pytest
-from unittest.mock import MagicMock, patch
+from unittest.mock import AsyncMock, MagicMock, patch
 from decimal import Decimal
 
+from django.db import OperationalError
 from django.utils import timezone
 
 from apps.bot.handlers.handlers import (
     start_command, help_command, stats_command,
     history_command, link_command, handle_message
 )
-from apps.core.models import User, Category, Expense
+from apps.bot.state import STATE_LOOKUPS
+from apps.core.models import User, Category, Expense, OutboxMessage
+from services.infrastructure import metrics
 
 from tests.constants import EXTERNAL_USER_ID
 
@@ -179,6 +182,64 @@ class TestHandleMessageThreePaths:
         assert any("cat_new" in cb for cb in sender.callback_ids(sender.last_reply))
 
 
+    @patch("apps.bot.handlers.handlers.get_category_suggestion")
+    async def test_reprocesar_el_evento_no_duplica_el_gasto(
+        self, mock_suggestion, make_event, user, sender
+    ):
+        """Reintento de ARQ o replay de la DLQ: el outbox ya tiene la respuesta."""
+        mock_suggestion.return_value = make_suggestion(confidence=0.0, category=None)
+
+        await handle_message(make_event("xyzabc 1000"), user, sender)
+        await handle_message(make_event("xyzabc 1000"), user, sender)
+
+        assert await Expense.objects.acount() == 1
+        assert len(sender.replies) == 1
+
+    @patch("apps.bot.handlers.handlers.get_category_suggestion")
+    async def test_dos_entregas_a_la_vez_no_dan_error(
+        self, mock_suggestion, make_event, user, sender
+    ):
+        """
+        Las dos pasan already_handled antes de que alguna guarde (Retry con
+        un primer intento lento, reclamo del stream). La segunda choca con
+        el event_key único: ya está procesado, no es un error del usuario.
+        """
+        from services import outbox
+
+        mock_suggestion.return_value = make_suggestion(confidence=0.0, category=None)
+        await handle_message(make_event("xyzabc 1000"), user, sender)
+
+        real = outbox.already_handled
+        vistas = []
+
+        async def _carrera(event):
+            vistas.append(event)
+            return None if len(vistas) == 1 else await real(event)
+
+        with patch.object(outbox, "already_handled", new=_carrera):
+            await handle_message(make_event("xyzabc 1000"), user, sender)
+
+        assert await Expense.objects.acount() == 1
+        assert len(sender.replies) == 1
+        assert "Ocurrió un error" not in sender.last_reply["text"]
+
+    @patch("apps.bot.handlers.handlers.get_category_suggestion")
+    async def test_reproceso_entrega_la_respuesta_que_no_salio(
+        self, mock_suggestion, make_event, user, sender
+    ):
+        mock_suggestion.return_value = make_suggestion(confidence=0.0, category=None)
+        respuesta = sender.reply
+        sender.reply = AsyncMock(side_effect=ConnectionError("Telegram caído"))
+        await handle_message(make_event("xyzabc 1000"), user, sender)
+
+        sender.reply = respuesta
+        await OutboxMessage.objects.aupdate(locked_until=None)
+        await handle_message(make_event("xyzabc 1000"), user, sender)
+
+        assert await Expense.objects.acount() == 1
+        assert "A qué categoría pertenece" in sender.last_reply["text"]
+
+
 # ============================================
 # HANDLE MESSAGE — ESTADO PENDIENTE EN REDIS
 # ============================================
@@ -220,6 +281,27 @@ class TestHandleMessagePendingState:
         assert "entre 1 y 100 caracteres" in sender.last_reply["text"]
         mock_redis_state["clear"].assert_not_called()
 
+    async def test_con_pista_sin_estado_no_lee_redis(
+        self, make_event, user, sender, mock_redis_state
+    ):
+        """El productor vio que no había estado: el camino caliente no va a Redis."""
+        metrics.reset()
+
+        await handle_message(make_event("Pizza 2000", state_hint=False), user, sender)
+
+        mock_redis_state["get"].assert_not_called()
+        assert await Expense.objects.acount() == 1
+        assert STATE_LOOKUPS.value(outcome="skipped") == 1
+
+    @pytest.mark.parametrize("hint", [True, None])
+    async def test_con_pista_positiva_o_sin_pista_lee(
+        self, hint, make_event, user, sender, mock_redis_state
+    ):
+        """None: job de otro productor o encolado antes de la pista."""
+        await handle_message(make_event("Pizza 2000", state_hint=hint), user, sender)
+
+        mock_redis_state["get"].assert_awaited_once()
+
     async def test_redis_caido_no_rompe_el_flujo(
         self, make_event, user, sender, mock_redis_state
     ):
@@ -251,4 +333,16 @@ class TestHandleMessageExceptions:
 
         await handle_message(make_event("Pizza 2000"), user, sender)
 
-        assert "Ocurrió un error al guardar tu gasto" in sender.last_reply["text"]
\ No newline at end of file
+        assert "Ocurrió un error al guardar tu gasto" in sender.last_reply["text"]
+
+    @patch("apps.bot.handlers.handlers.create_expense_with_reply")
+    async def test_error_transitorio_de_db_sube_al_worker(
+        self, mock_create, make_event, user, sender
+    ):
+        """El worker reintenta; el reproceso no duplica (event_key)."""
+        mock_create.side_effect = OperationalError("server closed the connection")
+
+        with pytest.raises(OperationalError):
+            await handle_message(make_event("Pizza 2000"), user, sender)
+
+        assert sender.replies == []
\ No newline at end of file
@@ -2,12 +2,22 @@
 Tests de construcción de opciones. Verifican los ids de callback y el
 layout de filas, que es lo que define la experiencia visible del usuario.
 """
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from asgiref.sync import sync_to_async
+
 from apps.bot.handlers.helpers import (
+    CategoryKeyboard,
+    category_keyboard,
     category_selection_options,
     correction_options,
     delete_options,
     undo_options,
 )
+from apps.core.models import Category
+from services.ml.categorizer import create_category_for_user
+from tests.factories import UserFactory
 
 
 class TestOpcionesSimples:
@@ -61,4 +71,85 @@ class TestSeleccionDeCategorias:
     def test_sin_categorias_solo_queda_nueva(self):
         filas = category_selection_options(55, [])
         assert [len(f) for f in filas] == [1]
-        assert filas[0][0].id == "cat_new:55"
\ No newline at end of file
+        assert filas[0][0].id == "cat_new:55"
+
+
+class TestTecladoCacheado:
+
+    pytestmark = pytest.mark.django_db(transaction=True)
+
+    async def test_el_segundo_pedido_no_toca_la_base(self):
+        user = await sync_to_async(UserFactory)()
+        await Category.objects.acreate(name="Comida", user=user)
+        primero = await category_keyboard(user)
+
+        with patch(
+            "apps.bot.handlers.helpers.get_user_categories_or_defaults",
+            new=AsyncMock(side_effect=AssertionError("no debería consultar")),
+        ):
+            segundo = await category_keyboard(user)
+
+        assert segundo is primero
+        assert [o.label for o in segundo.render(7)[0]] == ["Comida"]
+        assert segundo.render(7)[0][0].id.startswith("cat_select:7:")
+
+    async def test_una_categoria_nueva_sube_la_version(self):
+        user = await sync_to_async(UserFactory)()
+        await category_keyboard(user)
+
+        await sync_to_async(create_category_for_user)(user, "Viajes")
+        await user.arefresh_from_db()
+        teclado = await category_keyboard(user)
+
+        assert user.category_version == 1
+        assert "Viajes" in [o.label for fila in teclado.render(7) for o in fila]
+
+    async def test_una_global_invalida_el_de_todos(self):
+        user = await sync_to_async(UserFactory)()
+
+        await Category.objects.acreate(name="Salud", is_default=True)
+
+        await user.arefresh_from_db()
+        assert user.category_version == 1
+
+    async def test_guardar_sin_cambios_no_toca_a_los_usuarios(self):
+        user = await sync_to_async(UserFactory)()
+        salud = await Category.objects.acreate(name="Salud", is_default=True)
+        salud = await Category.objects.aget(id=salud.id)
+
+        salud.color = "#FF0000"         # no está en el teclado
+        await salud.asave()
+        await salud.asave()
+
+        await user.arefresh_from_db()
+        assert user.category_version == 1
+
+    async def test_renombrar_invalida(self):
+        user = await sync_to_async(UserFactory)()
+        comida = await Category.objects.acreate(name="Comida", user=user)
+
+        comida.name = "Almuerzos"
+        await comida.asave()
+
+        await user.arefresh_from_db()
+        assert user.category_version == 2
+
+    async def test_cambiar_de_dueno_invalida_a_los_dos(self):
+        ana, beto = [await sync_to_async(UserFactory)() for _ in range(2)]
+        cat = await Category.objects.acreate(name="Regalos", user=ana)
+
+        cat.user = beto
+        await cat.asave()
+
+        await ana.arefresh_from_db()
+        await beto.arefresh_from_db()
+        assert (ana.category_version, beto.category_version) == (2, 1)
+
+    def test_mismo_layout_que_sin_cache(self):
+        cats = [self._Cat(i, f"Cat{i}") for i in range(3)]
+
+        assert CategoryKeyboard.build(cats).render(55) == category_selection_options(55, cats)
+
+    class _Cat:
+        def __init__(self, id, name):
+            self.id, self.name = id, name
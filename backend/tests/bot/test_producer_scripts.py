@@ -0,0 +1,141 @@
+"""
+Los scripts Lua del productor (ENQUEUE_SCRIPT y STREAM_SCRIPT) contra un
+Redis de verdad: índices de KEYS/ARGV, los SELECT entre dbs y lo que
+queda escrito en cada una. test_webhook usa RedisFalso, una copia en
+Python; esto es lo que la mantiene honesta. Sin Redis, se saltea.
+"""
+import time
+
+import pytest
+
+from apps.bot import producer, state, streams
+from apps.bot.producer import COALESCED, DUPLICATE, ENQUEUED, IDEMPOTENCY_TTL, JOB_EXISTS
+from services.channels import codec
+from services.channels.events import EVENT_CALLBACK, ChannelEvent
+
+
+@pytest.fixture(autouse=True)
+def limpio(settings):
+    settings.PIPELINE_BACKEND = "arq"
+    settings.CALLBACK_COALESCE_MS = 2000
+    producer._seen.clear()
+
+
+def _mensaje(update_id=123456789, text="café 500", channel="telegram", **kwargs):
+    return ChannelEvent(
+        channel=channel, external_user_id="111", text=text, message_id=str(update_id),
+        timestamp=1753440000, received_at=time.time(), **kwargs,
+    )
+
+
+def _click(update_id=123456800, text="del:55"):
+    return _mensaje(update_id, text, type=EVENT_CALLBACK, ack_ref=f"cb{update_id}", edit_ref="2")
+
+
+async def _state_hint(jobs, event) -> bool:
+    blob = await jobs.get(f"arq:job:telegram:{event.message_id}")
+    return codec.deserialize_job(blob)["a"][0]["state_hint"]
+
+
+class TestIdempotencia:
+
+    async def test_encola_y_marca_el_bit(self, redis_real):
+        cache, jobs = redis_real["cache"], redis_real["jobs"]
+
+        assert await producer.enqueue_event(_mensaje()) == ENQUEUED
+
+        # 123456789 = 1883 * 65536 + 52501
+        assert await cache.getbit("idempotency:telegram:bits:1883", 52501) == 1
+        assert await cache.bitcount("idempotency:telegram:bits:1883") == 1
+        assert 0 < await cache.ttl("idempotency:telegram:bits:1883") <= IDEMPOTENCY_TTL
+        assert not await cache.exists("idempotency:telegram:123456789")
+        assert await jobs.exists("arq:job:telegram:123456789")
+        assert await jobs.zscore("arq:queue", "telegram:123456789") is not None
+
+    async def test_mismo_update_es_duplicado(self, redis_real):
+        await producer.enqueue_event(_mensaje())
+
+        assert await producer.enqueue_event(_mensaje()) == DUPLICATE
+        assert await redis_real["jobs"].zcard("arq:queue") == 1
+
+    async def test_vecinos_en_el_mismo_bitmap(self, redis_real):
+        await producer.enqueue_event(_mensaje(123456789))
+        assert await producer.enqueue_event(_mensaje(123456790)) == ENQUEUED
+
+        assert await redis_real["cache"].bitcount("idempotency:telegram:bits:1883") == 2
+        assert await redis_real["jobs"].zcard("arq:queue") == 2
+
+    async def test_marcado_con_la_clave_vieja_es_duplicado(self, redis_real):
+        await redis_real["cache"].set("idempotency:telegram:123456789", "1", ex=60)
+
+        assert await producer.enqueue_event(_mensaje()) == DUPLICATE
+        assert await redis_real["jobs"].zcard("arq:queue") == 0
+
+    async def test_id_no_numerico_usa_una_clave(self, redis_real):
+        evento = _mensaje("wamid.HBgL", channel="whatsapp")
+
+        assert await producer.enqueue_event(evento) == ENQUEUED
+        assert await producer.enqueue_event(evento) == DUPLICATE
+        assert 0 < await redis_real["cache"].ttl("idempotency:whatsapp:wamid.HBgL") <= IDEMPOTENCY_TTL
+
+    async def test_job_o_resultado_existente(self, redis_real):
+        await redis_real["jobs"].set("arq:result:telegram:123456789", b"x")
+
+        assert await producer.enqueue_event(_mensaje()) == JOB_EXISTS
+        assert await redis_real["jobs"].zcard("arq:queue") == 0
+
+
+class TestCoalescing:
+
+    async def test_doble_tap_devuelve_coalesced(self, redis_real):
+        assert await producer.enqueue_event(_click(123456800)) == ENQUEUED
+        assert await producer.enqueue_event(_click(123456801)) == COALESCED
+
+        clave = producer.click_key(_click())
+        assert 0 < await redis_real["cache"].pttl(clave) <= 2000
+        assert await redis_real["jobs"].zcard("arq:queue") == 1
+
+    async def test_otro_boton_pasa(self, redis_real):
+        await producer.enqueue_event(_click(123456800, "del:55"))
+
+        assert await producer.enqueue_event(_click(123456801, "del:56")) == ENQUEUED
+
+
+class TestPistaDeEstado:
+
+    async def test_sin_estado(self, redis_real):
+        await producer.enqueue_event(_mensaje())
+
+        assert await _state_hint(redis_real["jobs"], _mensaje()) is False
+
+    async def test_con_estado_pendiente(self, redis_real):
+        await redis_real["state"].set("cat_state:telegram:111", "42")
+
+        await producer.enqueue_event(_mensaje())
+
+        assert await _state_hint(redis_real["jobs"], _mensaje()) is True
+
+    async def test_callback_en_vuelo_marca_a_los_mensajes_de_atras(self, redis_real):
+        await producer.enqueue_event(_click())
+
+        marcador = state.keys_for("telegram", "111")[2]
+        assert 0 < await redis_real["state"].ttl(marcador) <= state.STATE_TTL
+
+        await producer.enqueue_event(_mensaje())
+        assert await _state_hint(redis_real["jobs"], _mensaje()) is True
+
+
+class TestStream:
+
+    async def test_xadd_al_carril_sin_tocar_la_cola(self, redis_real, settings):
+        settings.PIPELINE_BACKEND = streams.BACKEND
+        jobs = redis_real["jobs"]
+
+        assert await producer.enqueue_event(_mensaje()) == ENQUEUED
+        assert await producer.enqueue_event(_mensaje()) == DUPLICATE
+
+        [(_, campos)] = await jobs.xrange(streams.MESSAGE_STREAM)
+        job = codec.deserialize_job(campos[b"job"])
+        assert job["f"] == "process_message"
+        assert job["a"][0]["text"] == "café 500"
+        assert not await jobs.exists("arq:queue")
@@ -0,0 +1,82 @@
+"""
+Tests del comando redis_memory: cuenta por familia, mide una muestra y
+extrapola. Redis es un diccionario por purpose.
+"""
+from fnmatch import fnmatch
+from io import StringIO
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from django.core.management import call_command
+
+from apps.bot.management.commands import redis_memory
+
+
+class RedisDeMemoria:
+    def __init__(self, claves: dict[str, int]):
+        self.claves = claves        # clave -> bytes
+        self.medidas = 0
+
+    async def scan_iter(self, match, count):
+        for key in list(self.claves):
+            if fnmatch(key, match):
+                yield key.encode()
+
+    async def memory_usage(self, key):
+        self.medidas += 1
+        return self.claves.get(key.decode())
+
+    async def info(self, section):
+        return {"used_memory": 3 * 2**20}
+
+
+@pytest.fixture
+def dbs():
+    dbs = {
+        "cache": RedisDeMemoria({
+            "idempotency:telegram:bits:1883": 8_300,
+            "idempotency:telegram:bits:1884": 8_300,
+            "idempotency:whatsapp:wamid.1": 60,
+            "click:telegram:111:2:del:55": 70,
+        }),
+        "state": RedisDeMemoria({"cat_state:telegram:111": 80}),
+        "jobs": RedisDeMemoria({f"arq:result:{i}": 300 for i in range(10)}),
+    }
+
+    async def _get_redis(purpose="jobs"):
+        return dbs[purpose]
+
+    with patch.object(redis_memory, "get_redis", new=_get_redis), \
+            patch.object(redis_memory, "close_all", new=AsyncMock()):
+        yield dbs
+
+
+def _filas(salida: str) -> dict[str, list[str]]:
+    return {linea.split()[0]: linea.split()[1:] for linea in salida.splitlines()[1:]}
+
+
+def _correr(*args) -> str:
+    out = StringIO()
+    call_command("redis_memory", *args, stdout=out)
+    return out.getvalue()
+
+
+def test_cuenta_y_promedia_por_familia(dbs):
+    filas = _filas(_correr())
+
+    assert filas["idempotency"][:3] == ["3", "3", "5553"]
+    assert filas["coalescing"][:2] == ["1", "1"]
+    assert filas["state"][:2] == ["1", "1"]
+    assert filas["results"][:3] == ["10", "10", "300"]
+    assert filas["jobs"][:2] == ["0", "0"]
+
+
+def test_extrapola_desde_la_muestra(dbs):
+    filas = _filas(_correr("--sample", "4"))
+
+    assert filas["results"][:2] == ["10", "4"]
+    assert dbs["jobs"].medidas == 4
+
+
+def test_informa_used_memory(dbs):
+    assert "used_memory: 3.0 MiB" in _correr()
@@ -0,0 +1,211 @@
+"""
+Tests de los modos de degradación: umbrales, muestreo de la cola y qué
+hace el webhook en cada modo. Redis es el RedisFalso de test_webhook.
+"""
+import json
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from apps.bot import shedding
+from apps.bot.shedding import DEGRADED, NORMAL, OVERLOADED, DepthSampler, Plan
+from apps.bot.views import BUSY_TEXT, webhook
+from services.channels.events import EVENT_CALLBACK, ChannelEvent
+from services.infrastructure import metrics
+from tests.bot.test_webhook import CALLBACK_PAYLOAD, VALID_PAYLOAD, make_request
+from tests.bot.test_webhook import redis, request_factory  # noqa: F401 (fixtures)
+
+pytestmark = pytest.mark.django_db(transaction=True)
+
+
+@pytest.fixture(autouse=True)
+def umbrales(settings, monkeypatch):
+    settings.SHED_DEGRADED_DEPTH = 10
+    settings.SHED_OVERLOADED_DEPTH = 100
+    settings.SHED_SAMPLE_SECONDS = 1.0
+    settings.SHED_DEFER_SECONDS = 30
+    settings.SHED_COALESCE_MS = 10_000
+    settings.SHED_NON_URGENT_COMMANDS = ["history", "stats"]
+    shedding._sampler.clear()
+    monkeypatch.setattr(shedding, "_mode", NORMAL)
+    metrics.reset()
+
+
+def _evento(text="café 500", **kwargs):
+    return ChannelEvent(
+        channel="telegram", external_user_id="111", text=text,
+        message_id="1", timestamp=1753439000, **kwargs,
+    )
+
+
+class TestModo:
+
+    @pytest.mark.parametrize("depth, modo", [
+        (0, NORMAL), (9, NORMAL), (10, DEGRADED), (99, DEGRADED), (100, OVERLOADED),
+    ])
+    def test_umbrales(self, depth, modo):
+        assert shedding.mode_for(depth) == modo
+
+    def test_umbral_en_cero_apaga_ese_modo(self, settings):
+        settings.SHED_OVERLOADED_DEPTH = 0
+
+        assert shedding.mode_for(10_000) == DEGRADED
+
+    async def test_todo_apagado_no_mide_la_cola(self, settings):
+        settings.SHED_DEGRADED_DEPTH = 0
+        settings.SHED_OVERLOADED_DEPTH = 0
+
+        with patch.object(shedding._sampler, "sample", new=AsyncMock()) as sample:
+            assert await shedding.current_mode() == NORMAL
+
+        sample.assert_not_called()
+
+
+class TestMuestreo:
+
+    @pytest.fixture
+    def jobs(self):
+        fake = AsyncMock()
+        fake.default_queue_name = "arq:queue"
+        fake.zcount.return_value = 42
+
+        async def _get_redis(purpose="jobs"):
+            return fake
+
+        with patch("apps.bot.shedding.get_redis", new=_get_redis):
+            yield fake
+
+    async def test_cuenta_solo_los_jobs_vencidos(self, jobs):
+        assert await DepthSampler().sample() == 42
+
+        queue, minimo, maximo = jobs.zcount.await_args.args
+        assert (queue, minimo) == ("arq:queue", "-inf")
+        assert isinstance(maximo, int)
+        assert shedding.QUEUE_DEPTH.value() == 42
+
+    async def test_reusa_la_muestra_dentro_del_intervalo(self, jobs):
+        ahora = [0.0]
+        sampler = DepthSampler(clock=lambda: ahora[0])
+
+        await sampler.sample()
+        jobs.zcount.return_value = 500
+        ahora[0] = 0.5
+        assert await sampler.sample() == 42
+
+        ahora[0] = 1.0
+        assert await sampler.sample() == 500
+        assert jobs.zcount.await_count == 2
+
+    async def test_sin_redis_queda_la_ultima_muestra(self, jobs):
+        ahora = [0.0]
+        sampler = DepthSampler(clock=lambda: ahora[0])
+        await sampler.sample()
+
+        jobs.zcount.side_effect = ConnectionError("Redis caído")
+        ahora[0] = 2.0
+
+        assert await sampler.sample() == 42
+
+
+class TestPlan:
+
+    def test_normal_no_toca_nada(self):
+        assert shedding.plan_for(_evento("/stats"), NORMAL) == Plan()
+
+    def test_los_gastos_nunca_se_coalescen_ni_difieren(self):
+        for modo in (DEGRADED, OVERLOADED):
+            assert shedding.plan_for(_evento("café 500"), modo) == Plan(mode=modo)
+
+    def test_callbacks_con_ventana_mas_larga(self):
+        callback = _evento("del:55", type=EVENT_CALLBACK, ack_ref="a", edit_ref="2")
+
+        assert shedding.plan_for(callback, DEGRADED).coalesce_ms == 10_000
+        assert not shedding.plan_for(callback, OVERLOADED).busy
+
+    def test_degradado_difiere_los_no_urgentes(self):
+        plan = shedding.plan_for(_evento("/history 15"), DEGRADED)
+
+        assert plan == Plan(mode=DEGRADED, defer_ms=30_000, coalesce_ms=10_000)
+
+    def test_desbordado_rechaza_los_no_urgentes(self):
+        assert shedding.plan_for(_evento("/stats@SmartExpenseBot"), OVERLOADED).busy
+
+    def test_los_comandos_urgentes_pasan(self):
+        assert shedding.plan_for(_evento("/start"), OVERLOADED) == Plan(mode=OVERLOADED)
+
+
+class TestWebhookBajoCarga:
+
+    @pytest.fixture
+    def cargar(self, redis):
+        """Llena la cola de jobs vencidos hasta `n`."""
+        def _cargar(n):
+            for i in range(n):
+                redis.cola[f"viejo:{i}"] = 0
+        return _cargar
+
+    async def _mandar(self, request_factory, text, update_id=500):
+        data = {**VALID_PAYLOAD, "update_id": update_id,
+                "message": {**VALID_PAYLOAD["message"], "text": text}}
+        return await webhook(make_request(request_factory, data=data))
+
+    async def test_modo_observable(self, redis, request_factory, cargar):
+        cargar(10)
+
+        await self._mandar(request_factory, "café 500")
+
+        assert shedding.LOAD_MODE.value() == 1
+        assert shedding.QUEUE_DEPTH.value() == 10
+
+    async def test_difiere_el_comando_no_urgente(self, redis, request_factory, cargar):
+        cargar(10)
+
+        await self._mandar(request_factory, "/stats")
+
+        job, score = redis.ultimo
+        assert score - int(job.enqueue_time.timestamp() * 1000) == 30_000
+        assert shedding.LOAD_SHED.value(mode=DEGRADED, action="deferred") == 1
+
+    async def test_contesta_ocupado_sin_encolar(self, redis, request_factory, cargar):
+        cargar(100)
+
+        response = await self._mandar(request_factory, "/history")
+
+        assert json.loads(response.content) == {
+            "method": "sendMessage", "chat_id": "111", "text": BUSY_TEXT,
+        }
+        assert redis.encolados == 100
+        assert shedding.LOAD_SHED.value(mode=OVERLOADED, action="busy") == 1
+
+    async def test_gasto_repetido_bajo_carga_son_dos_gastos(
+        self, redis, request_factory, cargar
+    ):
+        cargar(100)
+
+        await self._mandar(request_factory, "café 500", update_id=501)
+        await self._mandar(request_factory, "café 500", update_id=502)
+
+        assert redis.encolados == 102
+        assert len(redis.scripts[-1][0]) == 8     # sin clave de coalescing
+
+    async def test_comando_no_urgente_repetido_se_coalesce(
+        self, redis, request_factory, cargar
+    ):
+        cargar(10)
+
+        await self._mandar(request_factory, "/stats", update_id=501)
+        response = await self._mandar(request_factory, "/stats", update_id=502)
+
+        assert response.content == b"OK"
+        assert redis.encolados == 11
+        assert shedding.LOAD_SHED.value(mode=DEGRADED, action="coalesced") == 1
+
+    async def test_doble_tap_con_ventana_de_carga(self, redis, request_factory, cargar):
+        cargar(10)
+        for update_id in (601, 602):
+            data = {**CALLBACK_PAYLOAD, "update_id": update_id}
+            await webhook(make_request(request_factory, data=data))
+
+        keys, args = redis.scripts[-1]
+        assert args[7] == 10_000
+        assert shedding.LOAD_SHED.value(mode=DEGRADED, action="coalesced") == 1
@@ -1,12 +1,21 @@
+import asyncio
+
 import pytest
 from unittest.mock import AsyncMock, patch
 
+from redis.exceptions import ConnectionError as RedisConnectionError
+
 from apps.bot.state import (
+    STATE_FALLBACK,
     STATE_TTL,
     clear_pending_category_state,
     get_pending_category_state,
+    pending_only_locally,
     set_pending_category_state,
 )
+from services.infrastructure import metrics
+from services.infrastructure.circuit import OPEN
+from services.infrastructure.redis_client import breaker_for
 
 pytestmark = pytest.mark.django_db(transaction=True)
 
@@ -82,4 +91,64 @@ class TestClear:
         """
         await clear_pending_category_state(TG, UID)
 
-        redis.delete.assert_called_once_with(KEY, LEGACY_KEY)
\ No newline at end of file
+        redis.delete.assert_called_once_with(KEY, LEGACY_KEY)
+
+
+class TestSinRedis:
+    """Redis caído o lento: el estado vive en memoria del proceso."""
+
+    @pytest.fixture(autouse=True)
+    def limpio(self):
+        metrics.reset()
+
+    @pytest.fixture
+    def caido(self, redis):
+        error = RedisConnectionError("Connection refused")
+        redis.set.side_effect = error
+        redis.mget.side_effect = error
+        redis.delete.side_effect = error
+        return redis
+
+    async def test_el_flujo_sigue_sin_redis(self, caido):
+        await set_pending_category_state(TG, UID, expense_id=456)
+
+        assert await get_pending_category_state(TG, UID) == 456
+        assert STATE_FALLBACK.value(op="set") == 1
+        assert STATE_FALLBACK.value(op="get") == 1
+
+        await clear_pending_category_state(TG, UID)
+        assert await get_pending_category_state(TG, UID) is None
+
+    async def test_lo_escrito_sin_redis_se_lee_cuando_vuelve(self, caido):
+        await set_pending_category_state(TG, UID, expense_id=456)
+        caido.mget.side_effect = None
+
+        assert pending_only_locally(TG, UID)
+        assert await get_pending_category_state(TG, UID) == 456
+
+    async def test_la_copia_de_respaldo_no_pisa_a_redis(self, redis):
+        """Escrito en Redis y vencido (o borrado por otro proceso): no hay estado."""
+        await set_pending_category_state(TG, UID, expense_id=456)
+
+        assert not pending_only_locally(TG, UID)
+        assert await get_pending_category_state(TG, UID) is None
+
+    async def test_redis_lento_corta_en_el_timeout(self, redis, settings):
+        settings.REDIS_CALL_TIMEOUT = 0.01
+
+        async def colgado(*keys):
+            await asyncio.sleep(10)
+
+        redis.mget.side_effect = colgado
+
+        assert await asyncio.wait_for(get_pending_category_state(TG, UID), 1) is None
+        assert STATE_FALLBACK.value(op="get") == 1
+
+    async def test_con_el_breaker_abierto_no_llama(self, caido):
+        for _ in range(breaker_for("state").min_calls):
+            await get_pending_category_state(TG, UID)
+        assert breaker_for("state").state == OPEN
+        caido.mget.reset_mock()
+
+        assert await get_pending_category_state(TG, UID) is None
+        caido.mget.assert_not_called()
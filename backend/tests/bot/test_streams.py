@@ -0,0 +1,279 @@
+"""
+Tests del backend de Redis Streams: el productor hace XADD al carril, y el
+consumidor entrega, ackea, deja pendiente o manda al dead-letter según lo
+que pase en el handler. Redis es un AsyncMock; el productor usa el
+RedisFalso de test_webhook.
+"""
+import asyncio
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from arq import Retry
+from arq.jobs import serialize_job
+from redis.exceptions import ResponseError
+
+from apps.bot import deadletter, streams
+from apps.bot.streams import (
+    CALLBACK_STREAM,
+    GROUP,
+    MESSAGE_STREAM,
+    STREAM_DELIVERIES,
+    Delivery,
+    StreamConsumer,
+)
+from apps.bot.views import webhook
+from services.channels import codec
+from services.infrastructure import metrics
+from tests.bot.test_webhook import CALLBACK_PAYLOAD, make_request
+from tests.bot.test_webhook import redis, request_factory  # noqa: F401 (fixtures)
+
+pytestmark = pytest.mark.django_db(transaction=True)
+
+EVENTO = {"channel": "telegram", "external_user_id": "111", "text": "café 500", "message_id": "9"}
+
+
+@pytest.fixture(autouse=True)
+def backend(settings):
+    settings.PIPELINE_BACKEND = "streams"
+    settings.STREAM_MAXLEN = 1000
+    settings.STREAM_CLAIM_IDLE = 90
+    settings.WORKER_MAX_JOBS = 10
+    metrics.reset()
+
+
+@pytest.fixture
+def jobs():
+    return AsyncMock()
+
+
+@pytest.fixture
+def handler():
+    return AsyncMock()
+
+
+@pytest.fixture
+def consumer(handler):
+    return StreamConsumer(
+        {"process_message": handler}, max_tries=3, job_timeout=5, name="host:1"
+    )
+
+
+@pytest.fixture
+def dlq():
+    with patch.object(deadletter, "record", new=AsyncMock()) as record:
+        yield record
+
+
+def _job(event=EVENTO, function="process_message") -> bytes:
+    return serialize_job(function, (event,), {}, None, 1753440000000, serializer=codec.serialize_job)
+
+
+async def _acks(jobs, n):
+    while jobs.xack.await_count < n:
+        await asyncio.sleep(0)
+
+
+def _entrega(attempt=1, job=None, stream=MESSAGE_STREAM, entry_id="1-0"):
+    return Delivery(stream, entry_id, _job() if job is None else job, attempt)
+
+
+class TestProductor:
+
+    async def test_mensaje_al_stream_de_mensajes(self, redis, request_factory):
+        await webhook(make_request(request_factory))
+
+        keys, args = redis.scripts[-1]
+        assert keys[1:4] == [MESSAGE_STREAM] * 3
+        assert args[4] == 1000              # MAXLEN ~
+        assert not redis.cola               # nada en la cola de ARQ
+
+    async def test_callback_a_su_carril(self, redis, request_factory, settings):
+        settings.CALLBACK_COALESCE_MS = 0
+
+        await webhook(make_request(request_factory, data=CALLBACK_PAYLOAD))
+
+        (job,) = redis.streams[CALLBACK_STREAM]
+        assert codec.deserialize_job(job)["a"][0]["text"] == "del:55"
+
+    async def test_duplicado_no_entra_dos_veces(self, redis, request_factory):
+        await webhook(make_request(request_factory))
+        await webhook(make_request(request_factory))
+
+        assert len(redis.streams[MESSAGE_STREAM]) == 1
+
+    async def test_el_consumidor_lee_lo_que_escribe_el_productor(
+        self, redis, request_factory, consumer, handler, jobs
+    ):
+        await webhook(make_request(request_factory))
+        (job,) = redis.streams[MESSAGE_STREAM]
+
+        await consumer.handle(jobs, _entrega(job=job))
+
+        ctx, event = handler.await_args.args
+        assert event["text"] == "Pizza 2000"
+        assert ctx["job_try"] == 1
+
+
+class TestEntrega:
+
+    async def test_ok_ackea(self, consumer, handler, jobs):
+        await consumer.handle(jobs, _entrega())
+
+        handler.assert_awaited_once()
+        jobs.xack.assert_awaited_once_with(MESSAGE_STREAM, GROUP, "1-0")
+        assert STREAM_DELIVERIES.value(stream=MESSAGE_STREAM, outcome="acked") == 1
+
+    async def test_retry_queda_pendiente(self, consumer, handler, jobs):
+        handler.side_effect = Retry(defer=5)
+
+        await consumer.handle(jobs, _entrega())
+
+        jobs.xack.assert_not_awaited()
+        assert STREAM_DELIVERIES.value(stream=MESSAGE_STREAM, outcome="retry") == 1
+
+    async def test_timeout_queda_pendiente(self, consumer, handler, jobs):
+        handler.side_effect = TimeoutError()
+
+        await consumer.handle(jobs, _entrega())
+
+        jobs.xack.assert_not_awaited()
+
+    async def test_fallo_terminal_ackea(self, consumer, handler, jobs):
+        """process_message ya dejó el dead-letter: como un job fallido de ARQ."""
+        handler.side_effect = ValueError("evento ilegible")
+
+        await consumer.handle(jobs, _entrega())
+
+        jobs.xack.assert_awaited_once()
+        assert STREAM_DELIVERIES.value(stream=MESSAGE_STREAM, outcome="failed") == 1
+
+    async def test_entregada_de_mas_va_al_dead_letter(self, consumer, handler, jobs, dlq):
+        await consumer.handle(jobs, _entrega(attempt=4))
+
+        handler.assert_not_awaited()
+        event, exc = dlq.await_args.args
+        assert (event["message_id"], event["text"]) == ("9", "café 500")
+        assert isinstance(exc, streams.DeliveryExhausted)
+        jobs.xack.assert_awaited_once()
+
+    async def test_funcion_desconocida_va_al_dead_letter(self, consumer, jobs, dlq):
+        await consumer.handle(jobs, _entrega(job=_job(function="nope")))
+
+        dlq.assert_awaited_once()
+        jobs.xack.assert_awaited_once()
+
+    async def test_recortada_se_cuenta(self, consumer, handler, jobs):
+        await consumer.handle(jobs, Delivery(MESSAGE_STREAM, "1-0", None))
+
+        handler.assert_not_awaited()
+        assert STREAM_DELIVERIES.value(stream=MESSAGE_STREAM, outcome="trimmed") == 1
+
+    async def test_callbacks_primero(self, handler, jobs):
+        """Con un solo lugar libre, el callback lo toma y el mensaje espera."""
+        consumer = StreamConsumer(
+            {"process_message": handler}, max_tries=3, job_timeout=5, max_jobs=1, name="host:1"
+        )
+        orden = []
+        handler.side_effect = lambda ctx, event: orden.append(ctx["job_id"])
+
+        await consumer.process(jobs, [
+            _entrega(entry_id="1-0"),
+            _entrega(stream=CALLBACK_STREAM, entry_id="2-0"),
+        ])
+        await consumer.join()
+
+        assert orden == [f"{CALLBACK_STREAM}:2-0", f"{MESSAGE_STREAM}:1-0"]
+
+
+class TestPool:
+
+    async def test_una_entrega_lenta_no_frena_la_lectura(self, handler, jobs):
+        consumer = StreamConsumer(
+            {"process_message": handler}, max_tries=3, job_timeout=5, max_jobs=2, name="host:1"
+        )
+        liberar, tercera = asyncio.Event(), asyncio.Event()
+
+        async def _handler(ctx, event):
+            if ctx["job_id"].endswith(":1-0"):
+                await liberar.wait()
+            if ctx["job_id"].endswith(":3-0"):
+                tercera.set()
+
+        handler.side_effect = _handler
+        lecturas = [
+            [[MESSAGE_STREAM.encode(), [(entry_id.encode(), {b"job": _job()})]]]
+            for entry_id in ("1-0", "2-0", "3-0")
+        ]
+
+        async def _xreadgroup(*args, **kwargs):
+            if lecturas:
+                return lecturas.pop(0)
+            await asyncio.sleep(3600)
+
+        jobs.xreadgroup.side_effect = _xreadgroup
+        jobs.xautoclaim.return_value = [b"0-0", [], []]
+
+        with patch.object(streams, "get_redis", new=AsyncMock(return_value=jobs)):
+            run = asyncio.create_task(consumer.run())
+            # La tercera se lee y termina con la primera todavía en vuelo.
+            await asyncio.wait_for(tercera.wait(), timeout=1)
+            await asyncio.wait_for(_acks(jobs, 2), timeout=1)
+
+            assert not liberar.is_set()
+            assert jobs.xreadgroup.await_args.kwargs["count"] == 1     # un lugar libre
+            run.cancel()
+            await asyncio.gather(run, return_exceptions=True)
+
+        # Cancelada en vuelo: sin XACK, queda pendiente en el grupo.
+        assert [c.args[2] for c in jobs.xack.await_args_list] == ["2-0", "3-0"]
+
+
+class TestLectura:
+
+    async def test_xreadgroup_en_ambos_carriles(self, consumer, jobs):
+        jobs.xreadgroup.return_value = [[b"events:messages", [(b"1-0", {b"job": b"x"})]]]
+
+        (entrega,) = await consumer.read(jobs, 10)
+
+        assert entrega == Delivery(MESSAGE_STREAM, "1-0", b"x", 1)
+        assert jobs.xreadgroup.await_args.args[:3] == (
+            GROUP, "host:1", {CALLBACK_STREAM: ">", MESSAGE_STREAM: ">"},
+        )
+
+    async def test_reclama_con_el_numero_de_entrega(self, consumer, jobs):
+        jobs.xautoclaim.side_effect = lambda stream, *a, **k: (
+            [b"0-0", [(b"1-0", {b"job": b"x"})], [b"0-5"]]
+            if stream == MESSAGE_STREAM else [b"0-0", [], []]
+        )
+        jobs.xpending_range.return_value = [{"message_id": b"1-0", "times_delivered": 3}]
+
+        entregas = await consumer.claim(jobs, 10)
+
+        assert entregas == [
+            Delivery(MESSAGE_STREAM, "0-5", None),
+            Delivery(MESSAGE_STREAM, "1-0", b"x", 3),
+        ]
+        assert jobs.xautoclaim.await_args.args[3] == 90_000
+        assert streams.STREAM_CLAIMED.value(stream=MESSAGE_STREAM) == 1
+
+    async def test_grupo_existente(self, jobs):
+        jobs.xgroup_create.side_effect = ResponseError("BUSYGROUP Consumer Group name already exists")
+
+        await streams.ensure_groups(jobs)
+
+        assert jobs.xgroup_create.await_count == 2
+
+
+class TestReplay:
+
+    async def test_el_que_borra_reencola(self):
+        letter = deadletter.DeadLetter(
+            entry_id="5-0", event=EVENTO, error="E", message="", digest="d",
+            stage=deadletter.STAGE_DISPATCH, attempt=3, job_id="", failed_at=0,
+        )
+        with patch.object(deadletter, "delete", new=AsyncMock(side_effect=[1, 0])), \
+                patch.object(streams, "add", new=AsyncMock()) as add:
+            assert await deadletter.replay(letter)
+            assert not await deadletter.replay(letter)
+
+        add.assert_awaited_once_with(EVENTO)
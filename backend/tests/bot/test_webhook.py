@@ -1,10 +1,23 @@
+import asyncio
 import json
+import time
+
 import pytest
-from unittest.mock import AsyncMock, MagicMock, patch
+from unittest.mock import AsyncMock, patch
+from arq.constants import default_queue_name, job_key_prefix
+from arq.jobs import deserialize_job
 from django.test import RequestFactory
 from django.conf import settings
 
-from apps.bot.views import webhook
+from apps.bot import producer, shedding
+from apps.bot.producer import CALLBACK_HEADSTART, ENQUEUE_SCRIPT, IDEMPOTENCY_LOCAL
+from apps.bot import views
+from apps.bot.views import CALLBACKS_COALESCED, RATE_LIMIT_DECISIONS, STAGE_DURATION, webhook
+from services.channels import codec
+from services.channels.events import ChannelEvent
+from services.infrastructure import metrics
+from services.infrastructure.ratelimit import Decision
+from services.infrastructure.redis_client import breaker_for, database_for
 
 pytestmark = pytest.mark.django_db(transaction=True)
 
@@ -19,6 +32,16 @@ VALID_PAYLOAD = {
     },
 }
 
+CALLBACK_PAYLOAD = {
+    "update_id": 123456791,
+    "callback_query": {
+        "id": "4382abc",
+        "from": {"id": 111, "first_name": "Ivan"},
+        "data": "del:55",
+        "message": {"message_id": 294, "chat": {"id": 111, "type": "private"}},
+    },
+}
+
 PAYLOAD_WITHOUT_UPDATE_ID = {
     "message": {
         "message_id": 1,
@@ -39,22 +62,88 @@ def request_factory():
     return RequestFactory()
 
 
+class RedisFalso:
+    """
+    Modelo en Python del script de apps/bot/producer.py: SET NX en la db de
+    cache, la pista de estado en la de state y la cola de ARQ en la de
+    jobs. El job se decodifica con el deserializer de ARQ, como lo lee el
+    worker.
+    """
+
+    default_queue_name = default_queue_name
+    expires_extra_ms = 86_400_000
+    job_serializer = staticmethod(codec.serialize_job)
+
+    def __init__(self):
+        self.claves = {}
+        self.jobs = {}
+        self.cola = {}
+        self.streams = {}       # backend de streams: stream → [job crudo]
+        self.scripts = []
+        self.set = AsyncMock(return_value=True)     # _store_raw
+        self.zcount = AsyncMock(side_effect=self._zcount)   # shedding
+        self.evalsha = AsyncMock(side_effect=self._script)
+
+    async def _script(self, sha, numkeys, *rest):
+        keys, args = list(rest[:numkeys]), list(rest[numkeys:])
+        self.scripts.append((keys, args))
+        cache, bit = args[0], int(args[11])
+        # Con bitmap, la marca es (clave, bit); la clave por update es la legacy.
+        marca = (cache, keys[0], bit) if bit >= 0 else (cache, keys[0])
+        if marca in self.claves or (bit >= 0 and (cache, keys[7]) in self.claves):
+            return 0
+        self.claves[marca] = args[2]
+        if len(keys) > 8:
+            if (cache, keys[8]) in self.claves:
+                return 3
+            self.claves[(cache, keys[8])] = args[7]
+        db_state, job = args[8], args[3]
+        if int(args[10]) > 0:
+            self.claves[(db_state, keys[6])] = args[10]
+        elif any((db_state, k) in self.claves for k in keys[4:7]):
+            job = args[9]
+        if sha == producer._STREAM_SHA:
+            self.streams.setdefault(keys[1], []).append(job)
+            return 1
+        if keys[1] in self.jobs:
+            return 2
+        self.jobs[keys[1]] = deserialize_job(job, deserializer=codec.deserialize_job)
+        self.cola[args[6]] = args[4]
+        return 1
+
+    async def _zcount(self, queue, minimo, maximo):
+        return sum(1 for score in self.cola.values() if score <= maximo)
+
+    @property
+    def encolados(self) -> int:
+        return len(self.cola)
+
+    @property
+    def ultimo(self):
+        """(job, score) del último encolado."""
+        job_id = list(self.cola)[-1]
+        return self.jobs[job_key_prefix + job_id], self.cola[job_id]
+
+
 @pytest.fixture
-def redis():
+def redis(settings):
     """
-    Los dos pools que usa el webhook: 'cache' para la clave de idempotencia
-    y 'jobs' para la cola.
+    Un solo Redis falso para los dos purposes: el script cambia de db solo.
+    El rate limit queda apagado (su script no está modelado): lo prueba
+    TestRateLimit con el balde falso.
     """
-    cache = AsyncMock()
-    cache.set.return_value = True          # primera vez por defecto
-    jobs = AsyncMock()
-    jobs.enqueue_job.return_value = MagicMock()
+    settings.RATE_LIMIT_BURST = 0
+    fake = RedisFalso()
+    producer._seen.clear()
+    shedding._sampler.clear()
 
     async def _get_redis(purpose="jobs"):
-        return cache if purpose == "cache" else jobs
+        return fake
 
-    with patch("apps.bot.views.get_redis", new=_get_redis):
-        yield {"cache": cache, "jobs": jobs}
+    with patch("apps.bot.producer.get_redis", new=_get_redis), \
+            patch("apps.bot.shedding.get_redis", new=_get_redis), \
+            patch("apps.bot.views.get_redis", new=_get_redis):
+        yield fake
 
 
 def make_request(rf, method="post", data=None, secret=None):
@@ -77,12 +166,12 @@ class TestEncolado:
         response = await webhook(make_request(request_factory))
 
         assert response.status_code == 200
-        redis["jobs"].enqueue_job.assert_called_once()
+        assert redis.encolados == 1
 
-        args, kwargs = redis["jobs"].enqueue_job.call_args
-        assert args[0] == "process_message"
+        job, _ = redis.ultimo
+        assert job.function == "process_message"
 
-        event = args[1]
+        event = job.args[0]
         assert event["channel"] == "telegram"
         assert event["external_user_id"] == "111"
         assert event["text"] == "Pizza 2000"
@@ -92,69 +181,303 @@ class TestEncolado:
         """D2: message.message_id es único por chat, update_id es global."""
         await webhook(make_request(request_factory))
 
-        event = redis["jobs"].enqueue_job.call_args[0][1]
-        assert event["message_id"] == "123456789"
+        job, _ = redis.ultimo
+        assert job.args[0]["message_id"] == "123456789"
 
     async def test_job_id_sigue_el_contrato(self, redis, request_factory):
         await webhook(make_request(request_factory))
 
-        kwargs = redis["jobs"].enqueue_job.call_args[1]
-        assert kwargs["_job_id"] == "telegram:123456789"
+        keys, args = redis.scripts[-1]
+        assert keys[1:3] == ["arq:job:telegram:123456789", "arq:result:telegram:123456789"]
+        assert args[6] == "telegram:123456789"
 
     async def test_el_worker_no_recibe_payload_crudo(self, redis, request_factory):
-        """El raw viaja adentro del evento, no como argumento suelto."""
+        """El raw no viaja en el job: el codec lo descarta (services/channels/codec.py)."""
         await webhook(make_request(request_factory))
 
-        event = redis["jobs"].enqueue_job.call_args[0][1]
-        assert event["raw"] == VALID_PAYLOAD
-        assert redis["jobs"].enqueue_job.call_args[0][1] is not VALID_PAYLOAD
+        job, _ = redis.ultimo
+        assert "raw" not in job.args[0]
 
+    async def test_mide_cada_etapa(self, redis, request_factory):
+        metrics.reset()
 
-class TestIdempotencia:
+        await webhook(make_request(request_factory))
+
+        for stage in ("webhook_normalize", "webhook_enqueue", "webhook"):
+            assert STAGE_DURATION.count(
+                stage=stage, channel="telegram", event_type="message"
+            ) == 1
+
+
+class TestFormatoDeArq:
+
+    async def test_mismo_job_que_enqueue_job(self, redis, request_factory):
+        """El script escribe lo mismo que ArqRedis.enqueue_job: el worker no nota la diferencia."""
+        # timestamp_ms redondea: el enqueue_time puede caer hasta 0.5 ms
+        # fuera del intervalo medido, de cualquiera de los dos lados.
+        antes = time.time() * 1000 - 1
+        await webhook(make_request(request_factory))
+
+        keys, args = redis.scripts[-1]
+        job, score = redis.ultimo
+        assert keys[3] == default_queue_name
+        assert job.job_try is None
+        assert antes <= job.enqueue_time.timestamp() * 1000 <= time.time() * 1000 + 1
+        assert score == int(job.enqueue_time.timestamp() * 1000)
+        assert args[5] == RedisFalso.expires_extra_ms
+
+    async def test_un_round_trip(self, redis, request_factory):
+        await webhook(make_request(request_factory))
+
+        assert redis.evalsha.await_count == 1
+        redis.set.assert_not_called()
+
+    async def test_carga_el_script_si_el_servidor_no_lo_tiene(self, redis, request_factory):
+        from redis.exceptions import NoScriptError
+
+        redis.evalsha.side_effect = NoScriptError("NOSCRIPT")
+
+        async def _eval(script, *rest):
+            return await redis._script(None, *rest)
+        redis.eval = AsyncMock(side_effect=_eval)
+
+        await webhook(make_request(request_factory))
+
+        assert redis.eval.await_args.args[0] == ENQUEUE_SCRIPT
+        assert redis.encolados == 1
+
+
+class TestPistaDeEstado:
+    """El script elige entre el job con state_hint=False y el con True."""
+
+    def _estado(self, redis, clave):
+        redis.claves[(database_for("state"), clave)] = 300
+
+    async def test_sin_estado_el_worker_no_lo_lee(self, redis, request_factory):
+        await webhook(make_request(request_factory))
+
+        job, _ = redis.ultimo
+        assert job.args[0]["state_hint"] is False
+
+    async def test_con_estado_pendiente(self, redis, request_factory):
+        self._estado(redis, "cat_state:telegram:111")
+
+        await webhook(make_request(request_factory))
+
+        job, _ = redis.ultimo
+        assert job.args[0]["state_hint"] is True
+
+    async def test_con_estado_en_el_formato_viejo(self, redis, request_factory):
+        self._estado(redis, "cat_state:111")
+
+        await webhook(make_request(request_factory))
+
+        assert redis.ultimo[0].args[0]["state_hint"] is True
 
-    async def test_marca_la_clave_antes_de_encolar(self, redis, request_factory):
+    async def test_mensaje_detras_de_un_callback_sin_procesar(self, redis, request_factory):
         """
-        Orden intencional (at-most-once): si falla entre marcar y encolar,
-        el mensaje se pierde. Preferible a un gasto duplicado.
+        El callback "Nueva categoría" crea el estado recién cuando el worker
+        lo procesa. El nombre que el usuario escribe enseguida puede
+        encolarse antes: igual tiene que leer el estado.
         """
-        orden = []
-        redis["cache"].set.side_effect = lambda *a, **k: orden.append("set") or True
-        redis["jobs"].enqueue_job.side_effect = lambda *a, **k: orden.append("enqueue")
+        await webhook(make_request(request_factory, data=CALLBACK_PAYLOAD))
+        keys, args = redis.scripts[-1]
+        assert keys[6] == "cat_state_soon:telegram:111"
+        assert args[10] == 300
+
+        await webhook(make_request(request_factory))
+
+        assert redis.ultimo[0].args[0]["state_hint"] is True
+
+    async def test_el_callback_de_otro_usuario_no_cuenta(self, redis, request_factory):
+        self._estado(redis, "cat_state_soon:telegram:222")
 
         await webhook(make_request(request_factory))
 
-        assert orden == ["set", "enqueue"]
+        assert redis.ultimo[0].args[0]["state_hint"] is False
+
+
+class TestRawFueraDeBanda:
 
-    async def test_usa_set_nx_atomico(self, redis, request_factory):
-        """El GET+SET anterior tenía carrera entre entregas simultáneas."""
+    async def test_por_defecto_el_raw_no_se_guarda(self, redis, request_factory):
         await webhook(make_request(request_factory))
 
-        kwargs = redis["cache"].set.call_args[1]
-        assert kwargs["nx"] is True
-        assert kwargs["ex"] == 60 * 60 * 24
+        redis.set.assert_not_called()
+
+    async def test_con_ttl_se_guarda_aparte(self, redis, request_factory, settings):
+        settings.EVENT_RAW_TTL = 3600
 
-    async def test_clave_namespaced_por_canal(self, redis, request_factory):
         await webhook(make_request(request_factory))
 
-        clave = redis["cache"].set.call_args[0][0]
-        assert clave == "idempotency:telegram:123456789"
+        guardado = redis.set.call_args_list[-1]
+        assert guardado.args[0] == "raw:telegram:123456789"
+        assert json.loads(guardado.args[1]) == VALID_PAYLOAD
+        assert guardado.kwargs["ex"] == 3600
 
-    async def test_duplicado_no_se_encola(self, redis, request_factory):
-        """SET NX devuelve None cuando la clave ya existía."""
-        redis["cache"].set.return_value = None
 
+class TestCarrilPrioritario:
+
+    async def test_mensaje_se_encola_sin_adelantar(self, redis, request_factory):
+        await webhook(make_request(request_factory))
+
+        job, score = redis.ultimo
+        assert score == int(job.enqueue_time.timestamp() * 1000)
+
+    async def test_callback_se_encola_delante_de_los_mensajes(self, redis, request_factory):
+        """
+        ARQ ordena por score: un score en el pasado pone el click delante de
+        los mensajes recibidos en la ventana de CALLBACK_HEADSTART.
+        """
+        await webhook(make_request(request_factory, data=CALLBACK_PAYLOAD))
+
+        job, score = redis.ultimo
+        adelanto = job.args[0]["received_at"] - score / 1000
+        assert adelanto == pytest.approx(CALLBACK_HEADSTART.total_seconds(), abs=0.001)
+
+    async def test_el_evento_lleva_la_hora_de_recepcion(self, redis, request_factory):
+        antes = time.time()
+        await webhook(make_request(request_factory, data=CALLBACK_PAYLOAD))
+
+        job, _ = redis.ultimo
+        assert antes <= job.args[0]["received_at"] <= time.time()
+
+
+class TestIdempotencia:
+
+    async def test_clave_con_ttl_de_24h_en_la_db_de_cache(self, redis, request_factory):
+        await webhook(make_request(request_factory))
+
+        keys, args = redis.scripts[-1]
+        assert args[:3] == [database_for("cache"), database_for("jobs"), 60 * 60 * 24]
+
+    async def test_update_id_en_un_bitmap_por_bucket(self, redis, request_factory):
+        """123456789 = 1883 * 65536 + 52501."""
+        await webhook(make_request(request_factory))
+
+        keys, args = redis.scripts[-1]
+        assert keys[0] == "idempotency:telegram:bits:1883"
+        assert args[11] == 52501
+        assert keys[7] == "idempotency:telegram:123456789"     # legacy, un release
+
+    async def test_ids_vecinos_comparten_bitmap(self, redis, request_factory):
+        await webhook(make_request(request_factory))
+        otro = {**VALID_PAYLOAD, "update_id": 123456790}
+        await webhook(make_request(request_factory, data=otro))
+
+        assert redis.encolados == 2
+        assert redis.scripts[0][0][0] == redis.scripts[1][0][0]
+
+    async def test_marcado_con_el_formato_viejo_es_duplicado(self, redis, request_factory):
+        """Reintento de un update que el release anterior marcó con su propia clave."""
+        redis.claves[(database_for("cache"), "idempotency:telegram:123456789")] = 86400
+
+        await webhook(make_request(request_factory))
+
+        assert redis.encolados == 0
+
+    def test_ids_no_numericos_usan_una_clave_por_update(self):
+        event = ChannelEvent(
+            channel="whatsapp", external_user_id="5491100", text="hola",
+            message_id="wamid.HBgL", timestamp=1753440000,
+        )
+
+        assert producer.idempotency_slot(event) == ("idempotency:whatsapp:wamid.HBgL", -1)
+
+    async def test_duplicado_no_se_encola(self, redis, request_factory):
+        await webhook(make_request(request_factory))
         response = await webhook(make_request(request_factory))
 
         assert response.status_code == 200
-        redis["jobs"].enqueue_job.assert_not_called()
+        assert redis.encolados == 1
+
+    async def test_reintento_al_mismo_proceso_no_va_a_redis(self, redis, request_factory):
+        metrics.reset()
+
+        await webhook(make_request(request_factory))
+        await webhook(make_request(request_factory))
+
+        assert redis.evalsha.await_count == 1
+        assert IDEMPOTENCY_LOCAL.value(channel="telegram", outcome="hit") == 1
+        assert IDEMPOTENCY_LOCAL.value(channel="telegram", outcome="miss") == 1
+
+    async def test_sin_memoria_local_decide_redis(self, redis, request_factory):
+        """Otro proceso ya lo encoló: este no lo recuerda y Redis dice duplicado."""
+        await webhook(make_request(request_factory))
+        producer._seen.clear()
+
+        await webhook(make_request(request_factory))
+
+        assert redis.evalsha.await_count == 2
+        assert redis.encolados == 1
+
+    async def test_si_el_script_falla_no_recuerda_la_clave(self, redis, request_factory):
+        redis.evalsha.side_effect = [ConnectionError("Redis caído"), 1]
+
+        await webhook(make_request(request_factory))
+
+        assert "idempotency:telegram:123456789" not in producer._seen
 
     async def test_duplicado_detectado_por_arq_no_rompe(self, redis, request_factory):
-        """Segunda capa: enqueue_job retorna None si el _job_id ya existe."""
-        redis["jobs"].enqueue_job.return_value = None
+        """Segunda capa: el job con ese _job_id todavía existe."""
+        redis.jobs["arq:job:telegram:123456789"] = object()
 
         response = await webhook(make_request(request_factory))
 
         assert response.status_code == 200
+        assert redis.encolados == 0
+
+
+def _tap(update_id, data="del:55"):
+    payload = json.loads(json.dumps(CALLBACK_PAYLOAD))
+    payload["update_id"] = update_id
+    payload["callback_query"]["id"] = f"tap{update_id}"
+    payload["callback_query"]["data"] = data
+    return payload
+
+
+class TestClicksRepetidos:
+
+    async def test_doble_tap_se_ackea_sin_encolar(self, redis, request_factory):
+        metrics.reset()
+
+        await webhook(make_request(request_factory, data=_tap(1)))
+        response = await webhook(make_request(request_factory, data=_tap(2)))
+
+        assert redis.encolados == 1
+        assert json.loads(response.content) == {
+            "method": "answerCallbackQuery", "callback_query_id": "tap2",
+        }
+        assert CALLBACKS_COALESCED.value(channel="telegram") == 1
+
+    async def test_la_clave_lleva_mensaje_y_boton(self, redis, request_factory):
+        await webhook(make_request(request_factory, data=_tap(1)))
+
+        keys, args = redis.scripts[-1]
+        assert keys[8] == "click:telegram:111:294:del:55"
+        assert args[7] == settings.CALLBACK_COALESCE_MS
+
+    async def test_otro_boton_del_mismo_mensaje_pasa(self, redis, request_factory):
+        await webhook(make_request(request_factory, data=_tap(1, "cat_list:55")))
+        await webhook(make_request(request_factory, data=_tap(2, "cat_new:55")))
+
+        assert redis.encolados == 2
+
+    async def test_los_mensajes_no_se_coalescen(self, redis, request_factory):
+        otro = {**VALID_PAYLOAD, "update_id": 2}
+
+        await webhook(make_request(request_factory))
+        await webhook(make_request(request_factory, data=otro))
+
+        assert redis.encolados == 2
+        assert len(redis.scripts[-1][0]) == 8
+
+    async def test_apagado_con_ventana_cero(self, redis, request_factory, settings):
+        settings.CALLBACK_COALESCE_MS = 0
+
+        await webhook(make_request(request_factory, data=_tap(1)))
+        await webhook(make_request(request_factory, data=_tap(2)))
+
+        assert redis.encolados == 2
 
 
 class TestUpdatesDescartados:
@@ -169,8 +492,7 @@ class TestUpdatesDescartados:
         )
 
         assert response.status_code == 200
-        redis["jobs"].enqueue_job.assert_not_called()
-        redis["cache"].set.assert_not_called()
+        redis.evalsha.assert_not_called()
 
     async def test_payload_without_update_id_is_rejected(self, request_factory):
         """
@@ -183,6 +505,114 @@ class TestUpdatesDescartados:
         assert response.status_code == 400
 
 
+class BaldeFalso:
+    """Sin relleno: cada clave tiene `burst` fichas y avisa una vez."""
+
+    def __init__(self):
+        self.gastadas = {}
+        self.avisados = set()
+        self.take = AsyncMock(side_effect=self._take)
+
+    async def _take(self, key, *, rate, burst):
+        self.gastadas[key] = self.gastadas.get(key, 0) + 1
+        if self.gastadas[key] <= burst:
+            return Decision(allowed=True)
+        notify = key not in self.avisados
+        self.avisados.add(key)
+        return Decision(allowed=False, retry_after=1 / rate, notify=notify)
+
+
+class TestRateLimit:
+
+    @pytest.fixture
+    def balde(self, redis, settings):
+        settings.RATE_LIMIT_BURST = 2
+        settings.RATE_LIMIT_RATE = 0.5
+        metrics.reset()
+        fake = BaldeFalso()
+        with patch.object(views, "_buckets", fake):
+            yield fake
+
+    async def _mandar(self, request_factory, n, base=VALID_PAYLOAD):
+        respuestas = []
+        for i in range(n):
+            data = {**base, "update_id": base["update_id"] + i}
+            respuestas.append(await webhook(make_request(request_factory, data=data)))
+        return respuestas
+
+    async def test_dentro_del_limite_se_encola(self, redis, balde, request_factory):
+        await self._mandar(request_factory, 2)
+
+        assert redis.encolados == 2
+        balde.take.assert_awaited_with("telegram:111", rate=0.5, burst=2)
+        assert RATE_LIMIT_DECISIONS.value(channel="telegram", decision="allowed") == 2
+
+    async def test_pasado_el_limite_no_llega_a_la_cola(self, redis, balde, request_factory):
+        respuestas = await self._mandar(request_factory, 5)
+
+        assert redis.encolados == 2
+        assert all(r.status_code == 200 for r in respuestas)
+        assert RATE_LIMIT_DECISIONS.value(channel="telegram", decision="notified") == 1
+        assert RATE_LIMIT_DECISIONS.value(channel="telegram", decision="dropped") == 2
+
+    async def test_avisa_una_sola_vez_en_la_respuesta(self, redis, balde, request_factory):
+        respuestas = await self._mandar(request_factory, 4)
+
+        assert json.loads(respuestas[2].content) == {
+            "method": "sendMessage", "chat_id": "111", "text": views.SLOW_DOWN_TEXT,
+        }
+        assert respuestas[3].content == b"OK"
+
+    async def test_un_callback_limitado_se_ackea_igual(
+        self, redis, balde, request_factory, settings
+    ):
+        settings.CALLBACK_COALESCE_MS = 0
+        respuestas = await self._mandar(request_factory, 4, base=CALLBACK_PAYLOAD)
+
+        assert redis.encolados == 2
+        assert json.loads(respuestas[2].content) == {
+            "method": "answerCallbackQuery", "callback_query_id": "4382abc",
+            "text": views.SLOW_DOWN_TEXT,
+        }
+        assert json.loads(respuestas[3].content) == {
+            "method": "answerCallbackQuery", "callback_query_id": "4382abc",
+        }
+
+    async def test_cada_usuario_tiene_su_balde(self, redis, balde, request_factory):
+        await self._mandar(request_factory, 3)
+        otro = {**VALID_PAYLOAD, "update_id": 9, "message": {
+            **VALID_PAYLOAD["message"], "from": {"id": 222, "first_name": "Otro"},
+        }}
+
+        await webhook(make_request(request_factory, data=otro))
+
+        assert redis.encolados == 3
+
+    async def test_un_reintento_no_gasta_fichas(self, redis, balde, request_factory):
+        for _ in range(5):
+            await webhook(make_request(request_factory))
+
+        assert balde.take.await_count == 1
+        assert redis.evalsha.await_count == 1
+        assert RATE_LIMIT_DECISIONS.value(channel="telegram", decision="notified") == 0
+
+    async def test_sin_redis_deja_pasar(self, redis, balde, request_factory):
+        balde.take.side_effect = ConnectionError("Redis caído")
+
+        await self._mandar(request_factory, 3)
+
+        assert redis.encolados == 3
+        assert RATE_LIMIT_DECISIONS.value(channel="telegram", decision="error") == 3
+
+    async def test_apagado_no_consulta_redis(self, redis, balde, request_factory, settings):
+        settings.RATE_LIMIT_RATE = 0
+
+        await self._mandar(request_factory, 5)
+
+        assert redis.encolados == 5
+        balde.take.assert_not_called()
+
+
 class TestSeguridadYTransporte:
 
     async def test_wrong_http_method_returns_405(self, request_factory):
@@ -197,6 +627,37 @@ class TestSeguridadYTransporte:
         response = await webhook(make_request(request_factory, secret="token-equivocado"))
         assert response.status_code == 403
 
+    async def test_cuerpo_declarado_grande_devuelve_413_sin_parsear(
+        self, redis, request_factory, settings
+    ):
+        settings.WEBHOOK_MAX_BODY = 1024
+        request = make_request(request_factory)
+        request.META["CONTENT_LENGTH"] = "4096"
+
+        with patch("apps.bot.views.fastjson.loads") as loads:
+            response = await webhook(request)
+
+        assert response.status_code == 413
+        loads.assert_not_called()
+        redis.evalsha.assert_not_called()
+
+    async def test_cuerpo_real_grande_devuelve_413(self, redis, request_factory, settings):
+        settings.WEBHOOK_MAX_BODY = 1024
+        payload = {**VALID_PAYLOAD, "relleno": "x" * 2048}
+
+        response = await webhook(make_request(request_factory, data=payload))
+
+        assert response.status_code == 413
+
+    async def test_sin_limite_acepta_cualquier_tamano(self, redis, request_factory, settings):
+        settings.WEBHOOK_MAX_BODY = 0
+        payload = {**VALID_PAYLOAD, "relleno": "x" * 128 * 1024}
+
+        response = await webhook(make_request(request_factory, data=payload))
+
+        assert response.status_code == 200
+        assert redis.encolados == 1
+
     async def test_malformed_json_returns_400(self, request_factory):
         request = request_factory.post(
             WEBHOOK_URL,
@@ -212,8 +673,30 @@ class TestSeguridadYTransporte:
         Cuando Redis falla, el webhook devuelve 200 igual.
         Decisión de diseño: Telegram no debe reintentar.
         """
-        redis["jobs"].enqueue_job.side_effect = Exception("Redis connection refused")
+        redis.evalsha.side_effect = Exception("Redis connection refused")
 
         response = await webhook(make_request(request_factory))
 
-        assert response.status_code == 200
\ No newline at end of file
+        assert response.status_code == 200
+
+    async def test_redis_enfermo_corta_rapido(self, redis, request_factory, settings):
+        """Timeout por llamada y después breaker abierto: ni siquiera se intenta."""
+        settings.REDIS_CALL_TIMEOUT = 0.01
+
+        async def colgado(*args):
+            await asyncio.sleep(10)
+
+        redis.evalsha.side_effect = colgado
+        for update_id in range(breaker_for("jobs").min_calls):
+            data = {**VALID_PAYLOAD, "update_id": 900 + update_id}
+            response = await asyncio.wait_for(
+                webhook(make_request(request_factory, data=data)), 1
+            )
+            assert response.status_code == 200
+
+        redis.evalsha.reset_mock()
+        data = {**VALID_PAYLOAD, "update_id": 999}
+        response = await webhook(make_request(request_factory, data=data))
+
+        assert response.status_code == 200
+        redis.evalsha.assert_not_called()
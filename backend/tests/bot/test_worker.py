@@ -2,18 +2,32 @@
 Tests de process_message: resolución de identidad, despacho y la
 semántica de errores partida por etapa.
 """
+import time
+
 import pytest
+from arq import Retry
 from unittest.mock import AsyncMock, patch
 
-from apps.bot.worker import process_message, process_telegram_message
+from apps.bot import deadletter
+from apps.bot.worker import (
+    ACKS_EXPIRED,
+    EVENT_LATENCY,
+    EVENT_QUEUE_LAG,
+    MAX_TRIES,
+    STAGE_DURATION,
+    process_message,
+    process_telegram_message,
+)
 from apps.core.models import ChannelIdentity, User
 from services.channels.senders import UnknownChannel
+from services.infrastructure import metrics
 
 from tests.constants import EXTERNAL_USER_ID
 
 pytestmark = pytest.mark.django_db(transaction=True)
 
 CTX = {"job_id": "test-job", "job_try": 1}
+ULTIMO = {**CTX, "job_try": MAX_TRIES}
 
 TELEGRAM_UPDATE = {
     "update_id": 423934621,
@@ -30,10 +44,11 @@ TELEGRAM_UPDATE = {
 
 @pytest.fixture
 def wired(sender):
-    """Sender registrado y dispatch parcheado."""
+    """Sender registrado, dispatch y dead-letter stream parcheados."""
     with patch("apps.bot.worker.get_sender", return_value=sender), \
-         patch("apps.bot.worker.dispatch", new=AsyncMock()) as mock_dispatch:
-        yield {"sender": sender, "dispatch": mock_dispatch}
+         patch("apps.bot.worker.dispatch", new=AsyncMock()) as mock_dispatch, \
+         patch("apps.bot.worker.deadletter.record", new=AsyncMock()) as mock_record:
+        yield {"sender": sender, "dispatch": mock_dispatch, "dead_letter": mock_record}
 
 
 class TestResolucionDeIdentidad:
@@ -69,35 +84,51 @@ class TestResolucionDeIdentidad:
 
 class TestSemanticaDeErrores:
 
-    async def test_error_del_handler_avisa_al_usuario_y_no_relanza(
-        self, make_event, wired
-    ):
+    async def test_error_del_handler_en_un_mensaje_se_reintenta(self, make_event, wired):
         """
-        El handler pudo haber creado el gasto antes de fallar. Reintentar
-        lo duplicaría, así que se absorbe.
+        El gasto y su respuesta se commitean juntos en el outbox y un
+        reproceso del evento lo detecta: reintentar no duplica.
         """
         wired["dispatch"].side_effect = Exception("Explotó el handler")
 
-        await process_message(CTX, make_event("almuerzo 3500").to_dict())  # no levanta
+        with pytest.raises(Retry):
+            await process_message(CTX, make_event("almuerzo 3500").to_dict())
+
+        assert wired["sender"].replies == []
+
+    async def test_ultimo_intento_avisa_al_usuario_y_no_relanza(self, make_event, wired):
+        wired["dispatch"].side_effect = Exception("Explotó el handler")
+
+        await process_message(ULTIMO, make_event("almuerzo 3500").to_dict())  # no levanta
 
         assert "Ocurrió un error al procesar tu mensaje" in wired["sender"].last_reply["text"]
 
-    async def test_canal_sin_sender_se_propaga(self, make_event):
-        """
-        Sin efectos laterales todavía: es seguro que ARQ reintente.
-        """
-        with patch("apps.bot.worker.get_sender", side_effect=UnknownChannel("x")):
+    async def test_error_en_un_callback_no_se_reintenta(self, make_callback_event, wired):
+        """Los callbacks editan estado sin marca del evento: se absorbe."""
+        wired["dispatch"].side_effect = Exception("Explotó el handler")
+
+        await process_message(CTX, make_callback_event("del:55").to_dict())  # no levanta
+
+        assert "Ocurrió un error al procesar tu mensaje" in wired["sender"].last_reply["text"]
+
+    async def test_canal_sin_sender_falla_sin_reintento(self, make_event):
+        """Determinístico: reintentar daría lo mismo."""
+        with patch("apps.bot.worker.get_sender", side_effect=UnknownChannel("x")), \
+             patch("apps.bot.worker.deadletter.record", new=AsyncMock()):
             with pytest.raises(UnknownChannel):
                 await process_message(CTX, make_event("hola").to_dict())
 
-    async def test_fallo_resolviendo_identidad_se_propaga(self, make_event, wired):
+    async def test_fallo_resolviendo_identidad_se_reintenta(self, make_event, wired):
+        """Sin efectos laterales todavía: típicamente la base caída un momento."""
         with patch(
             "apps.bot.worker.get_or_create_user_by_channel",
             side_effect=Exception("Postgres caído"),
         ):
-            with pytest.raises(Exception, match="Postgres caído"):
+            with pytest.raises(Retry) as info:
                 await process_message(CTX, make_event("hola").to_dict())
 
+        assert str(info.value.__cause__) == "Postgres caído"
+
     async def test_evento_malformado_se_propaga(self, wired):
         with pytest.raises(TypeError):
             await process_message(CTX, {"channel": "telegram", "campo_raro": 1})
@@ -107,7 +138,121 @@ class TestSemanticaDeErrores:
         wired["dispatch"].side_effect = Exception("Explotó el handler")
         wired["sender"].reply = AsyncMock(side_effect=Exception("Telegram caído"))
 
-        await process_message(CTX, make_event("hola").to_dict())  # no levanta
+        await process_message(ULTIMO, make_event("hola").to_dict())  # no levanta
+
+
+class TestDeadLetter:
+
+    async def test_error_del_handler_se_registra_al_rendirse(self, make_event, wired):
+        wired["dispatch"].side_effect = Exception("Explotó el handler")
+
+        with pytest.raises(Retry):
+            await process_message(CTX, make_event("almuerzo 3500").to_dict())
+        wired["dead_letter"].assert_not_awaited()
+
+        await process_message(ULTIMO, make_event("almuerzo 3500").to_dict())
+
+        wired["dead_letter"].assert_awaited_once()
+        event, exc = wired["dead_letter"].await_args.args
+        assert event["text"] == "almuerzo 3500"
+        assert str(exc) == "Explotó el handler"
+        assert wired["dead_letter"].await_args.kwargs == {
+            "stage": deadletter.STAGE_DISPATCH, "attempt": MAX_TRIES, "job_id": "test-job",
+        }
+
+    async def test_error_en_un_callback_se_registra_siempre(self, make_callback_event, wired):
+        wired["dispatch"].side_effect = Exception("Explotó el handler")
+
+        await process_message(CTX, make_callback_event("del:55").to_dict())
+
+        assert wired["dead_letter"].await_args.kwargs["attempt"] == 1
+
+    async def test_fallo_previo_al_dispatch_espera_al_ultimo_intento(self, make_event, wired):
+        """Los intentos intermedios los cubre el reintento de ARQ."""
+        with patch(
+            "apps.bot.worker.get_or_create_user_by_channel",
+            side_effect=Exception("Postgres caído"),
+        ):
+            with pytest.raises(Retry):
+                await process_message(CTX, make_event("hola").to_dict())
+            wired["dead_letter"].assert_not_awaited()
+
+            with pytest.raises(Exception, match="Postgres caído"):
+                await process_message(ULTIMO, make_event("hola").to_dict())
+
+        assert wired["dead_letter"].await_args.kwargs["stage"] == deadletter.STAGE_PRE_DISPATCH
+        assert wired["dead_letter"].await_args.kwargs["attempt"] == MAX_TRIES
+
+    async def test_evento_malformado_se_registra_en_el_primer_intento(self, wired):
+        with pytest.raises(TypeError):
+            await process_message(CTX, {"channel": "telegram", "campo_raro": 1})
+
+        wired["dead_letter"].assert_awaited_once()
+
+    async def test_exito_no_registra(self, make_event, wired):
+        await process_message(CTX, make_event("almuerzo 3500").to_dict())
+
+        wired["dead_letter"].assert_not_awaited()
+
+
+class TestDeadlineDelAck:
+
+    @pytest.fixture(autouse=True)
+    def metricas_limpias(self):
+        metrics.reset()
+
+    async def test_ack_vencido_se_omite(self, make_callback_event, wired):
+        """Pasado el deadline del canal el ack solo puede fallar."""
+        wired["sender"].ack_deadline = 55
+        event = make_callback_event("del:55")
+        event.received_at = time.time() - 120
+
+        await process_message(CTX, event.to_dict())
+
+        despachado = wired["dispatch"].await_args.args[0]
+        assert despachado.ack_ref is None
+        assert ACKS_EXPIRED.value(channel="telegram") == 1
+
+    async def test_ack_en_termino_se_conserva(self, make_callback_event, wired):
+        wired["sender"].ack_deadline = 55
+        event = make_callback_event("del:55")
+        event.received_at = time.time() - 2
+
+        await process_message(CTX, event.to_dict())
+
+        assert wired["dispatch"].await_args.args[0].ack_ref == "4382abc"
+        assert ACKS_EXPIRED.value(channel="telegram") == 0
+
+    async def test_canal_sin_deadline_no_toca_el_ack(self, make_callback_event, wired):
+        event = make_callback_event("del:55")
+        event.received_at = time.time() - 3600
+
+        await process_message(CTX, event.to_dict())
+
+        assert wired["dispatch"].await_args.args[0].ack_ref == "4382abc"
+
+    async def test_latencia_separada_por_tipo_de_evento(
+        self, make_event, make_callback_event, wired
+    ):
+        await process_message(CTX, make_event("almuerzo 3500").to_dict())
+        await process_message(CTX, make_callback_event("del:55").to_dict())
+
+        for event_type in ("message", "callback"):
+            assert EVENT_QUEUE_LAG.count(channel="telegram", event_type=event_type) == 1
+            assert EVENT_LATENCY.count(channel="telegram", event_type=event_type) == 1
+
+
+class TestEtapas:
+
+    async def test_mide_identidad_y_dispatch(self, make_event, wired):
+        metrics.reset()
+
+        await process_message(CTX, make_event("almuerzo 3500").to_dict())
+
+        for stage in ("identity", "dispatch"):
+            assert STAGE_DURATION.count(
+                stage=stage, channel="telegram", event_type="message"
+            ) == 1
 
 
 class TestAliasDeCompatibilidad:
@@ -0,0 +1,138 @@
+"""
+Tests del codec compacto de jobs. Sin Redis: se valida contra las mismas
+funciones de arq.jobs que usan el productor y el worker.
+"""
+import pickle
+
+import msgpack
+import pytest
+from arq.jobs import deserialize_job_raw, deserialize_result, serialize_result
+from arq.jobs import serialize_job as arq_serialize_job
+
+from services.channels.codec import (
+    EVENT_FIELDS,
+    MAGIC,
+    JobError,
+    UnsupportedCodecVersion,
+    deserialize_job,
+    pack_event,
+    serialize_job,
+)
+from services.channels.events import ChannelEvent
+from services.channels.telegram.inbound import normalize as normalize_telegram
+
+UPDATE = {
+    "update_id": 423934621,
+    "message": {
+        "message_id": 293,
+        "date": 1753439000,
+        "from": {"id": 123456789, "username": "ivanvallejoss", "first_name": "Ivan"},
+        "chat": {"id": 123456789, "type": "private"},
+        "text": "almuerzo 3500",
+    },
+}
+
+
+@pytest.fixture
+def event():
+    return normalize_telegram(UPDATE, received_at=1753440000.5)
+
+
+def _roundtrip(args, serializer=serialize_job, deserializer=deserialize_job):
+    blob = arq_serialize_job("process_message", args, {}, None, 1, serializer=serializer)
+    return blob, deserialize_job_raw(blob, deserializer=deserializer)
+
+
+class TestRoundtrip:
+
+    def test_el_worker_recibe_el_mismo_evento_sin_raw(self, event):
+        _, (function, args, kwargs, _, _) = _roundtrip((event.to_dict(),))
+
+        assert function == "process_message"
+        recuperado = ChannelEvent.from_dict(args[0])
+        assert recuperado.raw == {}
+        assert recuperado.text == event.text
+        assert recuperado.received_at == event.received_at
+        assert recuperado.profile == event.profile
+
+    def test_cubre_todos_los_campos_salvo_raw(self):
+        """Un campo nuevo en ChannelEvent sin versión nueva del codec se perdería."""
+        campos = set(ChannelEvent.__dataclass_fields__) - {"raw"}
+        assert set(EVENT_FIELDS[max(EVENT_FIELDS)]) == campos
+
+    def test_es_mas_chico_que_pickle(self, event):
+        compacto, _ = _roundtrip((event.to_dict(),))
+        viejo, _ = _roundtrip((event.to_dict(),), serializer=pickle.dumps)
+
+        assert compacto.startswith(MAGIC)
+        assert len(compacto) < len(viejo) / 2
+
+    def test_otras_funciones_no_se_tocan(self):
+        blob = arq_serialize_job("process_telegram_message", (UPDATE,), {}, None, 1,
+                                 serializer=serialize_job)
+        _, args, _, _, _ = deserialize_job_raw(blob, deserializer=deserialize_job)
+
+        assert args[0] == UPDATE
+
+
+class TestMigracion:
+
+    def test_lee_jobs_pickle_encolados_antes_del_deploy(self, event):
+        """Ventana de migración: jobs viejos con raw adentro."""
+        _, (_, args, _, _, _) = _roundtrip(
+            (event.to_dict(),), serializer=pickle.dumps
+        )
+
+        recuperado = ChannelEvent.from_dict(args[0])
+        assert recuperado.raw == UPDATE
+
+    def test_lee_jobs_v1_sin_state_hint(self, event):
+        """Jobs encolados por el productor anterior: el worker lee el estado."""
+        job = {"f": "process_message", "a": [pack_event(event.to_dict(), 1)], "k": {}}
+        blob = MAGIC + bytes([1]) + msgpack.packb(job, use_bin_type=True)
+
+        recuperado = ChannelEvent.from_dict(deserialize_job(blob)["a"][0])
+        assert recuperado.state_hint is None
+        assert recuperado.text == event.text
+
+    def test_version_desconocida_falla_ruidoso(self):
+        blob = serialize_job({"f": "process_message", "a": [[]], "k": {}, "t": None, "et": 1})
+        futuro = MAGIC + bytes([99]) + blob[2:]
+
+        with pytest.raises(UnsupportedCodecVersion):
+            deserialize_job(futuro)
+
+
+class TestResultados:
+
+    def test_resultado_no_serializable_levanta(self):
+        """
+        ARQ atrapa la excepción y reintenta con r='unable to serialize
+        result'. El codec no debe tragarse el error en silencio.
+        """
+        with pytest.raises(TypeError):
+            serialize_job({"f": "process_message", "a": [], "k": {}, "r": object()})
+
+    def test_la_excepcion_de_un_job_fallido_se_guarda(self, caplog):
+        """El resultado de un job fallido es la excepción: ARQ no debe loguear error."""
+        blob = serialize_result(
+            "process_message", (), {}, 3, 1, False, ValueError("monto inválido", 3),
+            2, 3, "ref", "arq:queue", "telegram:1", serializer=serialize_job,
+        )
+
+        resultado = deserialize_result(blob, deserializer=deserialize_job)
+
+        assert "error serializing result" not in caplog.text
+        assert type(resultado.result) is ValueError
+        assert resultado.result.args == ("monto inválido", 3)
+        assert resultado.success is False
+
+    def test_clase_desconocida_vuelve_como_job_error(self):
+        class ErrorLocal(Exception):
+            pass
+
+        blob = serialize_job({"f": "x", "a": [], "k": {}, "r": ErrorLocal("se cayó")})
+
+        resultado = deserialize_job(blob)["r"]
+        assert isinstance(resultado, JobError)
+        assert "ErrorLocal: se cayó" in str(resultado)
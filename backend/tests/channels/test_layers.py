@@ -0,0 +1,148 @@
+"""
+Tests de las capas alrededor de un Sender. Envuelven al FakeSender de
+tests/bot: lo que importa es la delegación, no el canal.
+"""
+import pytest
+from unittest.mock import AsyncMock
+
+from services.channels.layers import SENDER_DURATION, CircuitBreakerSender, InstrumentedSender
+from services.channels.senders import Sender
+from services.infrastructure import metrics
+from services.infrastructure.circuit import CIRCUIT_STATE, CircuitOpen
+from tests.bot.conftest import FakeSender
+
+
+@pytest.fixture(autouse=True)
+def metricas_limpias():
+    metrics.reset()
+    yield
+    metrics.reset()
+
+
+@pytest.fixture
+def inner():
+    s = FakeSender()
+    s.ack_deadline = 55
+    return s
+
+
+class TestDelegacion:
+
+    async def test_cumple_el_protocolo_y_delega(self, inner):
+        sender = InstrumentedSender(inner)
+
+        assert isinstance(sender, Sender)
+        assert await sender.reply("1", "hola") == "1"
+        await sender.edit("1", "294", text="chau")
+        await sender.ack("abc", "listo")
+
+        assert inner.last_reply["text"] == "hola"
+        assert inner.last_edit["text"] == "chau"
+        assert inner.last_ack["ack_ref"] == "abc"
+
+    def test_atributos_del_canal_se_leen_del_sender_envuelto(self, inner):
+        assert InstrumentedSender(inner).ack_deadline == 55
+        assert InstrumentedSender(inner).channel == "test"
+
+
+class TestInstrumentacion:
+
+    async def test_mide_cada_metodo(self, inner):
+        sender = InstrumentedSender(inner)
+
+        await sender.reply("1", "hola")
+        await sender.edit("1", "294", text="chau")
+
+        assert SENDER_DURATION.count(channel="test", method="reply", outcome="ok") == 1
+        assert SENDER_DURATION.count(channel="test", method="edit", outcome="ok") == 1
+
+    async def test_error_se_mide_y_se_propaga(self, inner):
+        inner.reply = AsyncMock(side_effect=RuntimeError("429"))
+        sender = InstrumentedSender(inner)
+
+        with pytest.raises(RuntimeError):
+            await sender.reply("1", "hola")
+
+        assert SENDER_DURATION.count(channel="test", method="reply", outcome="error") == 1
+
+    async def test_ack_no_se_mide(self, inner):
+        """Nunca propaga: un ack fallido se mediría como ok."""
+        sender = InstrumentedSender(inner)
+
+        await sender.ack(None)
+        await sender.ack("abc")
+
+        assert inner.last_ack["ack_ref"] == "abc"
+        assert SENDER_DURATION.count(channel="test", method="ack", outcome="ok") == 0
+
+
+class TestCircuitBreaker:
+
+    def _sender(self, inner, **kwargs):
+        from services.infrastructure.circuit import CircuitBreaker
+
+        return CircuitBreakerSender(inner, CircuitBreaker("sender:test", min_calls=2, **kwargs))
+
+    async def _abrir(self, sender, inner):
+        reply = inner.reply
+        inner.reply = AsyncMock(side_effect=ConnectionError("Telegram caído"))
+        for _ in range(2):
+            with pytest.raises(ConnectionError):
+                await sender.reply("1", "hola")
+        inner.reply = reply
+
+    async def test_abierto_corta_sin_llamar_al_canal(self, inner):
+        sender = self._sender(inner)
+        inner.reply = AsyncMock(side_effect=ConnectionError("Telegram caído"))
+        for _ in range(2):
+            with pytest.raises(ConnectionError):
+                await sender.reply("1", "hola")
+
+        with pytest.raises(CircuitOpen) as info:
+            await sender.reply("1", "hola")
+
+        assert inner.reply.await_count == 2
+        assert sender.retry_hint(info.value).retry_after > 0
+        assert CIRCUIT_STATE.value(circuit="sender:test") == 2
+
+    async def test_errores_del_pedido_no_abren(self, inner):
+        from services.channels.senders import RetryHint
+
+        sender = self._sender(inner)
+        inner.retry_hint = lambda exc: None        # 400: culpa del pedido
+        inner.edit = AsyncMock(side_effect=ValueError("Bad Request"))
+        for _ in range(3):
+            with pytest.raises(ValueError):
+                await sender.edit("1", "2", text="x")
+
+        inner.retry_hint = lambda exc: RetryHint(retry_after=3)   # 429
+        for _ in range(3):
+            with pytest.raises(ValueError):
+                await sender.edit("1", "2", text="x")
+
+        assert sender.breaker.state == "closed"
+
+    async def test_ack_con_el_circuito_abierto_sale_igual(self, inner):
+        sender = self._sender(inner)
+        await self._abrir(sender, inner)
+
+        await sender.ack("abc")
+
+        assert inner.last_ack["ack_ref"] == "abc"
+        assert sender.breaker.state == "open"
+
+    async def test_ack_fallido_en_half_open_no_cierra(self, inner):
+        """El ack se traga el error: no puede servir de prueba."""
+        ahora = [0.0]
+        sender = self._sender(inner, open_for=10, clock=lambda: ahora[0])
+        await self._abrir(sender, inner)
+        ahora[0] = 10.0
+        assert sender.breaker.state == "half_open"
+
+        inner.ack = AsyncMock(return_value=None)     # falló y lo logueó
+        await sender.ack("abc")
+
+        inner.ack.assert_awaited_once()
+        assert sender.breaker.state == "half_open"
+        assert await sender.reply("1", "hola") == "1"     # la prueba sigue libre
+        assert sender.breaker.state == "closed"
@@ -3,10 +3,11 @@ Tests del dispatcher de salida. Sin red: el Bot de PTB se reemplaza por
 un AsyncMock, lo que además verifica que el adapter llame a la API con
 exactamente los argumentos que usa el código actual.
 """
+import httpx
 import pytest
 from unittest.mock import AsyncMock, MagicMock
 
-from telegram.error import BadRequest
+from telegram.error import BadRequest, NetworkError, RetryAfter, TimedOut
 
 from services.channels.senders import (
     SENDERS,
@@ -158,6 +159,12 @@ class TestAck:
         assert kwargs["text"] == "⚠️ Error"
         assert kwargs["show_alert"] is True
 
+    async def test_ack_ref_none_no_llama_a_la_api(self, sender):
+        """El worker pasa None cuando el ack ya venció en la cola."""
+        await sender.ack(None)
+
+        sender._bot.answer_callback_query.assert_not_awaited()
+
     async def test_ack_vencido_no_tumba_el_job(self, sender):
         """
         answerCallbackQuery caduca a los ~60s. El trabajo real ya se hizo;
@@ -167,6 +174,40 @@ class TestAck:
         await sender.ack("4382abc")  # no debe levantar
 
 
+class TestRetryHint:
+
+    def test_429_trae_el_retry_after(self, sender):
+        assert sender.retry_hint(RetryAfter(7)).retry_after == 7
+
+    def test_bad_request_es_permanente(self, sender):
+        assert sender.retry_hint(BadRequest("Chat not found")) is None
+
+    def test_timeout_de_lectura_pudo_haber_llegado(self, sender):
+        assert sender.retry_hint(_de_httpx(TimedOut(), httpx.ReadTimeout("read"))).may_have_landed
+
+    def test_pool_timeout_no_salio(self, sender):
+        hint = sender.retry_hint(_de_httpx(TimedOut("Timed out"), httpx.PoolTimeout("pool")))
+        assert not hint.may_have_landed
+
+    def test_sin_conexion_no_salio(self, sender):
+        hint = sender.retry_hint(_de_httpx(NetworkError("error"), httpx.ConnectError("refused")))
+        assert not hint.may_have_landed
+
+    def test_no_depende_del_texto_del_mensaje(self, sender):
+        """Un PTB que cambie la redacción no cambia la clasificación."""
+        hint = sender.retry_hint(NetworkError("httpx.ConnectError: refused"))
+        assert hint.may_have_landed
+
+    def test_bad_gateway_no_se_sabe(self, sender):
+        assert sender.retry_hint(NetworkError("Bad Gateway")).may_have_landed
+
+
+def _de_httpx(error, causa):
+    """Como lo levanta PTB: raise TimedOut/NetworkError(...) from el error de httpx."""
+    error.__cause__ = causa
+    return error
+
+
 class TestCicloDeVida:
 
     async def test_startup_y_shutdown_delegan_en_el_bot(self, sender):
@@ -12,6 +12,7 @@ from services.channels.events import (
 )
 from services.channels.registry import UnknownChannel, normalize
 from services.channels.telegram.inbound import normalize as normalize_telegram
+from services.channels.telegram.inbound import slim
 
 RECEIVED_AT = 1753440000
 
@@ -164,8 +165,25 @@ class TestEventoCanonico:
         assert set(data) == {
             "channel", "external_user_id", "text", "message_id", "timestamp",
             "raw", "type", "conversation_id", "edit_ref", "ack_ref", "profile",
+            "received_at", "state_hint",
         }
 
+    def test_received_at_viaja_en_el_evento(self):
+        """Para mensajes timestamp es la hora de envío; received_at mide el pipeline."""
+        event = normalize_telegram(TEXT_UPDATE, received_at=RECEIVED_AT + 0.25)
+
+        assert event.timestamp == 1753439000
+        assert event.received_at == RECEIVED_AT + 0.25
+
+    def test_job_viejo_sin_received_at_cae_a_timestamp(self):
+        """Jobs encolados antes del campo: from_dict no debe romper."""
+        data = normalize_telegram(TEXT_UPDATE, received_at=RECEIVED_AT).to_dict()
+        del data["received_at"]
+
+        event = ChannelEvent.from_dict(data)
+
+        assert event.received_at == 1753439000.0
+
     def test_ids_numericos_se_coercionan_a_str(self):
         event = ChannelEvent(
             channel="telegram", external_user_id=123, text="x",
@@ -198,6 +216,49 @@ class TestEventoCanonico:
         assert job_id_for(event) == "telegram:423934621"
 
 
+class TestSlim:
+
+    def test_normaliza_igual_que_el_update_completo(self):
+        for update in (TEXT_UPDATE, CALLBACK_UPDATE):
+            completo = normalize_telegram(update, received_at=RECEIVED_AT)
+            recortado = normalize_telegram(slim(update), received_at=RECEIVED_AT)
+
+            assert recortado.to_dict() | {"raw": None} == completo.to_dict() | {"raw": None}
+
+    def test_suelta_lo_que_normalize_no_lee(self):
+        update = {
+            **CALLBACK_UPDATE,
+            "callback_query": {
+                **CALLBACK_UPDATE["callback_query"],
+                "chat_instance": "-8812",
+                "message": {
+                    **CALLBACK_UPDATE["callback_query"]["message"],
+                    "text": "x" * 4000,
+                    "reply_markup": {"inline_keyboard": [[{"text": "Comida"}]] * 50},
+                },
+            },
+        }
+
+        recortado = slim(update)
+
+        assert recortado["callback_query"]["message"] == {
+            "message_id": 294,
+            "chat": {"id": 123456789},
+        }
+        assert "chat_instance" not in recortado["callback_query"]
+
+    def test_updates_ignorados_siguen_ignorados(self):
+        update = {"update_id": 1, "edited_message": TEXT_UPDATE["message"]}
+
+        assert slim(update) == {"update_id": 1}
+        assert normalize_telegram(slim(update)) is None
+
+    def test_mensaje_sin_texto_sigue_descartado(self):
+        message = {k: v for k, v in TEXT_UPDATE["message"].items() if k != "text"}
+
+        assert normalize_telegram(slim({"update_id": 1, "message": message})) is None
+
+
 class TestRegistry:
 
     def test_despacha_al_normalizador_del_canal(self):
@@ -0,0 +1,128 @@
+"""
+Tests del stand-in de la Bot API, con un TelegramSender real apuntado a
+él: python-telegram-bot y httpx hacen los pedidos de verdad.
+"""
+import pytest
+from telegram.error import NetworkError, RetryAfter
+
+from services.channels.senders import Option
+from services.channels.telegram.outbound import TelegramSender
+from services.channels.telegram.standin import StandInConfig, TelegramStandIn
+from services.channels.throttle import OUTBOUND_RETRIES, ThrottledSender
+from services.infrastructure import metrics
+
+
+@pytest.fixture
+async def standin():
+    server = TelegramStandIn(StandInConfig(seed=1))
+    await server.start()
+    yield server
+    await server.close()
+
+
+@pytest.fixture
+async def sender(standin):
+    s = TelegramSender("123:abc", base_url=f"http://127.0.0.1:{standin.port}/bot")
+    await s.startup()
+    yield s
+    await s.shutdown()
+
+
+class TestMetodos:
+
+    async def test_reply_edit_y_ack(self, standin, sender):
+        message_id = await sender.reply("42", "hola", options=[[Option("del:1", "Eliminar")]])
+
+        await sender.edit("42", message_id, text="chau")
+        await sender.edit("42", message_id, options=[[Option("undo:1", "Deshacer")]])
+        await sender.ack("abc", "listo")
+
+        assert message_id == "1"
+        assert standin.stats[("sendMessage", 200)] == 1
+        assert standin.stats[("editMessageText", 200)] == 1
+        assert standin.stats[("editMessageReplyMarkup", 200)] == 1
+        assert standin.stats[("answerCallbackQuery", 200)] == 1
+
+    async def test_edit_sin_cambios_se_ignora_como_con_la_api_real(self, standin, sender):
+        message_id = await sender.reply("42", "hola")
+
+        await sender.edit("42", message_id, text="hola")     # no levanta
+
+        assert standin.stats[("editMessageText", 400)] == 1
+
+
+class TestFallas:
+
+    async def test_throttle_devuelve_retry_after(self, standin, sender):
+        standin.config.throttle_rate = 1.0
+        standin.config.retry_after = 7
+
+        with pytest.raises(RetryAfter) as info:
+            await sender.reply("42", "hola")
+
+        assert info.value.retry_after == 7
+
+    async def test_limite_por_chat(self, standin, sender):
+        standin.config.chat_rate = 0.5
+        standin.config.chat_burst = 1
+
+        await sender.reply("42", "uno")
+        await sender.reply("43", "otro chat")
+        with pytest.raises(RetryAfter) as info:
+            await sender.reply("42", "dos")
+
+        assert info.value.retry_after == 2
+
+    async def test_error_del_servidor(self, standin, sender):
+        standin.config.error_rate = 1.0
+
+        with pytest.raises(NetworkError):
+            await sender.reply("42", "hola")
+
+        assert standin.stats[("sendMessage", 500)] == 1
+
+
+class TestReintentos:
+
+    async def test_el_throttle_reintenta_el_429_con_su_retry_after(self, standin, sender):
+        metrics.reset()
+        # El stand-in es más estricto que el scheduler (ráfaga de 3):
+        # el segundo envío recibe 429 con retry_after=1.
+        standin.config.chat_rate = 1.0
+        standin.config.chat_burst = 1
+        throttled = ThrottledSender(sender)
+        await throttled.scheduler.start()
+
+        await throttled.reply("42", "uno")
+        await throttled.reply("42", "dos")
+        await throttled.scheduler.close()
+
+        assert standin.stats[("sendMessage", 429)] == 1
+        assert standin.stats[("sendMessage", 200)] == 2
+        assert OUTBOUND_RETRIES.value(channel="telegram", method="reply", reason="rate_limited") == 1
+
+
+class TestPool:
+
+    async def test_reusa_conexiones_y_no_pasa_del_tamaño(self, standin):
+        import asyncio
+
+        from services.channels.telegram.transport import (
+            HTTP_CONNECTIONS, HTTP_IN_FLIGHT, HTTP_POOL_WAIT, PoolConfig,
+        )
+
+        metrics.reset()
+        standin.config.latency = 0.02
+        s = TelegramSender(
+            "123:abc", base_url=f"http://127.0.0.1:{standin.port}/bot", pool=PoolConfig(size=3)
+        )
+        await s.startup()
+
+        await asyncio.gather(*(s.reply(str(chat), "hola") for chat in range(12)))
+        await s.reply("99", "otra")
+        await s.shutdown()
+
+        # getMe + 13 envíos sobre, como mucho, 3 conexiones.
+        assert 1 <= HTTP_CONNECTIONS.value(pool="send") <= 3
+        assert HTTP_POOL_WAIT.count(pool="send") == 14
+        assert HTTP_IN_FLIGHT.value(pool="send") == 0
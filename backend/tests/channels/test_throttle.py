@@ -0,0 +1,275 @@
+"""
+Tests del scheduler de salida. Con tiempo real y tasas altas: lo que se
+valida es el orden y la espera relativa, no valores absolutos.
+"""
+import asyncio
+import time
+
+import pytest
+
+from services.channels.senders import RetryHint
+from services.channels.throttle import (
+    OUTBOUND_DEFERRED,
+    OUTBOUND_FAILURES,
+    OUTBOUND_RETRIES,
+    OutboundScheduler,
+    ThrottledSender,
+    TokenBucket,
+)
+from services.infrastructure import metrics
+from tests.bot.conftest import FakeSender
+
+
+@pytest.fixture(autouse=True)
+def metricas_limpias():
+    metrics.reset()
+    yield
+    metrics.reset()
+
+
+@pytest.fixture
+async def scheduler():
+    s = OutboundScheduler("test", rate=1000, chat_rate=20, chat_burst=1, drain_timeout=2)
+    await s.start()
+    yield s
+    await s.close()
+
+
+def _registro(log, chat, n):
+    async def _send():
+        log.append((chat, n, time.monotonic()))
+    return _send
+
+
+class TestTokenBucket:
+
+    def test_arranca_lleno_y_se_repone_a_la_tasa(self):
+        bucket = TokenBucket(rate=2, capacity=2, now=0)
+
+        bucket.take(0)
+        bucket.take(0)
+
+        assert bucket.delay(0) == pytest.approx(0.5)
+        assert bucket.delay(0.5) == 0
+
+    def test_block_vacia_el_bucket_por_el_tiempo_pedido(self):
+        bucket = TokenBucket(rate=2, capacity=2, now=0)
+
+        bucket.block(0, 3)
+
+        assert bucket.delay(0) == pytest.approx(3)
+        assert bucket.delay(3) == 0
+
+
+class TestScheduler:
+
+    async def test_conserva_el_orden_dentro_de_un_chat(self, scheduler):
+        log = []
+        for n in range(3):
+            await scheduler.submit("1", "reply", _registro(log, "1", n))
+
+        await scheduler.close()
+
+        assert [n for _, n, _ in log] == [0, 1, 2]
+
+    async def test_respeta_la_tasa_por_chat(self, scheduler):
+        log = []
+        for n in range(3):
+            await scheduler.submit("1", "reply", _registro(log, "1", n))
+
+        await scheduler.close()
+
+        tiempos = [t for _, _, t in log]
+        assert tiempos[2] - tiempos[0] >= 2 / 20 * 0.9
+
+    async def test_un_chat_con_cola_no_frena_a_otro(self, scheduler):
+        log = []
+        for n in range(3):
+            await scheduler.submit("lento", "reply", _registro(log, "lento", n))
+        await scheduler.submit("otro", "reply", _registro(log, "otro", 0))
+
+        await scheduler.close()
+
+        orden = [chat for chat, _, _ in log]
+        assert orden.index("otro") < orden.index("lento", 1)
+
+    async def test_backpressure_con_la_cola_llena(self):
+        scheduler = OutboundScheduler("test", rate=1000, chat_rate=1000, max_pending=1)
+        await scheduler.start()
+        soltar = asyncio.Event()
+
+        async def _bloqueado():
+            await soltar.wait()
+
+        await scheduler.submit("1", "reply", _bloqueado)
+        segundo = asyncio.create_task(scheduler.submit("2", "reply", _bloqueado))
+        await asyncio.sleep(0.01)
+
+        assert not segundo.done()
+        soltar.set()
+        await asyncio.wait_for(segundo, timeout=1)
+        await scheduler.close()
+
+    async def test_un_fallo_se_cuenta_y_no_corta_la_cola(self, scheduler):
+        log = []
+
+        async def _falla():
+            raise RuntimeError("429")
+
+        await scheduler.submit("1", "edit", _falla)
+        await scheduler.submit("1", "reply", _registro(log, "1", 0))
+        await scheduler.close()
+
+        assert OUTBOUND_FAILURES.value(channel="test", method="edit") == 1
+        assert len(log) == 1
+
+    async def test_sin_arrancar_envia_directo(self):
+        log = []
+        scheduler = OutboundScheduler("test", rate=1, chat_rate=1)
+
+        await scheduler.submit("1", "reply", _registro(log, "1", 0))
+
+        assert len(log) == 1
+
+
+class _Falla(Exception):
+    def __init__(self, hint):
+        self.hint = hint
+
+
+def _hint(exc):
+    return getattr(exc, "hint", None)
+
+
+def _falla_n_veces(log, n, hint):
+    intentos = []
+
+    async def _send():
+        intentos.append(time.monotonic())
+        if len(intentos) <= n:
+            raise _Falla(hint)
+        log.append(len(intentos))
+    return _send, intentos
+
+
+@pytest.fixture
+async def con_reintentos():
+    s = OutboundScheduler(
+        "test", rate=1000, chat_rate=1000, chat_burst=10, drain_timeout=2,
+        retry_hint=_hint, max_retries=2, backoff_base=0.02,
+    )
+    await s.start()
+    yield s
+    await s.close()
+
+
+class TestReintentos:
+
+    async def test_429_espera_el_retry_after(self, con_reintentos):
+        log = []
+        send, intentos = _falla_n_veces(log, 1, RetryHint(retry_after=0.1))
+
+        await con_reintentos.submit("1", "reply", send)
+        await con_reintentos.close()
+
+        assert log == [2]
+        assert intentos[1] - intentos[0] >= 0.1 * 0.9
+        assert OUTBOUND_RETRIES.value(channel="test", method="reply", reason="rate_limited") == 1
+        assert OUTBOUND_DEFERRED.value(channel="test", method="reply") == pytest.approx(0.1)
+        assert OUTBOUND_FAILURES.value(channel="test", method="reply") == 0
+
+    async def test_el_reintento_no_se_adelanta_a_lo_que_venia_detras(self, con_reintentos):
+        log = []
+        send, _ = _falla_n_veces(log, 1, RetryHint())
+
+        await con_reintentos.submit("1", "reply", send)
+        await con_reintentos.submit("1", "edit", _registro(log, "1", "edit"))
+        await con_reintentos.close()
+
+        assert log[0] == 2
+        assert log[1][1] == "edit"
+
+    async def test_un_reply_que_pudo_llegar_no_se_reintenta(self, con_reintentos):
+        """Reintentarlo duplicaría el mensaje."""
+        log = []
+        send, intentos = _falla_n_veces(log, 1, RetryHint(may_have_landed=True))
+
+        await con_reintentos.submit("1", "reply", send)
+        await con_reintentos.close()
+
+        assert len(intentos) == 1
+        assert OUTBOUND_FAILURES.value(channel="test", method="reply") == 1
+
+    async def test_un_edit_que_pudo_llegar_si(self, con_reintentos):
+        log = []
+        send, _ = _falla_n_veces(log, 1, RetryHint(may_have_landed=True))
+
+        await con_reintentos.submit("1", "edit", send, idempotent=True)
+        await con_reintentos.close()
+
+        assert log == [2]
+        assert OUTBOUND_RETRIES.value(channel="test", method="edit", reason="transient") == 1
+
+    async def test_error_permanente_no_se_reintenta(self, con_reintentos):
+        log = []
+        send, intentos = _falla_n_veces(log, 1, None)
+
+        await con_reintentos.submit("1", "reply", send)
+        await con_reintentos.close()
+
+        assert len(intentos) == 1
+
+    async def test_se_rinde_tras_max_retries(self, con_reintentos):
+        log = []
+        send, intentos = _falla_n_veces(log, 10, RetryHint())
+
+        await con_reintentos.submit("1", "reply", send)
+        await con_reintentos.close()
+
+        assert len(intentos) == 3
+        assert OUTBOUND_FAILURES.value(channel="test", method="reply") == 1
+
+    async def test_quien_espera_recibe_el_error_sin_reintento(self, con_reintentos):
+        """El outbox difiere por su cuenta; reintentar acá retendría el job."""
+        log = []
+        send, intentos = _falla_n_veces(log, 1, RetryHint(retry_after=5))
+
+        with pytest.raises(_Falla):
+            await con_reintentos.submit("1", "reply", send, wait=True)
+
+        assert len(intentos) == 1
+
+
+class TestThrottledSender:
+
+    async def test_reply_y_edit_salen_por_la_cola_y_el_ack_directo(self):
+        inner = FakeSender()
+        inner.rate_limit, inner.chat_rate_limit = 1000, 1000
+        sender = ThrottledSender(inner)
+        await sender.startup()
+
+        assert await sender.reply("1", "hola") is None
+        await sender.edit("1", "294", text="chau")
+        await sender.ack("abc")
+        assert inner.last_ack["ack_ref"] == "abc"
+
+        await sender.shutdown()
+
+        assert inner.last_reply["text"] == "hola"
+        assert inner.last_edit["text"] == "chau"
+
+    async def test_deliver_espera_la_confirmacion_y_propaga_el_error(self):
+        inner = FakeSender()
+        inner.rate_limit, inner.chat_rate_limit = 1000, 1000
+        sender = ThrottledSender(inner)
+        await sender.startup()
+
+        assert await sender.deliver("1", "hola") == "1"
+
+        async def _falla(*args, **kwargs):
+            raise ConnectionError("Telegram caído")
+        inner.reply = _falla
+        with pytest.raises(ConnectionError):
+            await sender.deliver("1", "otra")
+
+        await sender.shutdown()
@@ -0,0 +1,59 @@
+"""Fixtures compartidas por todos los tests."""
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def redis_sano():
+    """
+    Los breakers de Redis y el estado local son del proceso: un test que
+    simula a Redis caído no puede dejar el circuito abierto al siguiente.
+    """
+    from apps.bot import state
+    from services.infrastructure.redis_client import reset_breakers
+
+    reset_breakers()
+    state._local.clear()
+    yield
+    reset_breakers()
+    state._local.clear()
+
+
+# Databases propias para los tests contra Redis de verdad: se vacían
+# antes y después, y no pisan las de desarrollo (0, 1, 2).
+_TEST_DATABASES = {"jobs": 13, "state": 14, "cache": 15}
+
+
+@pytest.fixture
+async def redis_real(settings, monkeypatch):
+    """
+    Redis de REDIS_URL (en CI, el servicio del workflow), para correr los
+    scripts Lua tal cual. Sin servidor, el test se saltea. Devuelve un
+    cliente por purpose, aparte de los pools del código, para mirar qué
+    quedó en cada db.
+    """
+    from redis.asyncio import Redis
+    from redis.exceptions import RedisError
+
+    from services.infrastructure import redis_client
+
+    settings.REDIS_SHARED_DB = False
+    monkeypatch.setattr(redis_client, "_DATABASES", _TEST_DATABASES)
+    base_url = settings.REDIS_URL.rsplit("/", 1)[0]
+    dbs = {
+        purpose: Redis.from_url(f"{base_url}/{db}", socket_connect_timeout=0.5)
+        for purpose, db in _TEST_DATABASES.items()
+    }
+    try:
+        for redis in dbs.values():
+            await redis.flushdb()
+    except (RedisError, OSError) as exc:
+        for redis in dbs.values():
+            await redis.aclose()
+        pytest.skip(f"Redis no disponible en {settings.REDIS_URL}: {exc}")
+
+    yield dbs
+
+    await redis_client.close_all()
+    for redis in dbs.values():
+        await redis.flushdb()
+        await redis.aclose()
@@ -0,0 +1,132 @@
+"""
+Tests del circuit breaker, con un reloj falso: abrir por fallas o por
+lentitud, cortar mientras está abierto y la prueba del medio abierto.
+"""
+import asyncio
+
+import pytest
+
+from services.infrastructure import metrics
+from services.infrastructure.circuit import (
+    CIRCUIT_STATE,
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    CircuitBreaker,
+    CircuitOpen,
+)
+
+
+class Reloj:
+    def __init__(self):
+        self.t = 1000.0
+
+    def __call__(self):
+        return self.t
+
+
+@pytest.fixture(autouse=True)
+def metricas_limpias():
+    metrics.reset()
+    yield
+    metrics.reset()
+
+
+@pytest.fixture
+def reloj():
+    return Reloj()
+
+
+@pytest.fixture
+def breaker(reloj):
+    return CircuitBreaker("test", min_calls=4, failure_rate=0.5, open_for=10, clock=reloj)
+
+
+class TestApertura:
+
+    def test_abre_con_la_tasa_de_fallas(self, breaker):
+        for ok in (True, False, True, False):
+            breaker.record(ok)
+
+        assert breaker.state == OPEN
+        assert CIRCUIT_STATE.value(circuit="test") == 2
+        with pytest.raises(CircuitOpen) as info:
+            breaker.check()
+        assert info.value.retry_after == 10
+
+    def test_no_abre_sin_el_mínimo_de_llamadas(self, breaker):
+        for _ in range(3):
+            breaker.record(False)
+
+        assert breaker.state == CLOSED
+
+    def test_abre_por_lentitud(self, reloj):
+        breaker = CircuitBreaker("test", min_calls=2, slow_call=1.0, slow_rate=1.0, clock=reloj)
+
+        breaker.record(True, 3.0)
+        breaker.record(True, 2.0)
+
+        assert breaker.state == OPEN
+
+    def test_las_fallas_viejas_salen_de_la_ventana(self, breaker, reloj):
+        breaker.record(False)
+        breaker.record(False)
+        reloj.t += 60
+        breaker.record(True)
+        breaker.record(True)
+        breaker.record(False)
+
+        assert breaker.state == CLOSED
+
+
+class TestMedioAbierto:
+
+    def _abrir(self, breaker):
+        for _ in range(4):
+            breaker.record(False)
+
+    def test_una_prueba_buena_cierra(self, breaker, reloj):
+        self._abrir(breaker)
+        reloj.t += 10
+
+        assert breaker.state == HALF_OPEN
+        breaker.check()
+        with pytest.raises(CircuitOpen):
+            breaker.check()             # una sola prueba a la vez
+        breaker.record(True)
+
+        assert breaker.state == CLOSED
+
+    def test_una_prueba_mala_reabre(self, breaker, reloj):
+        self._abrir(breaker)
+        reloj.t += 10
+
+        breaker.check()
+        breaker.record(False)
+
+        assert breaker.state == OPEN
+        assert breaker.retry_after() == 10
+
+    async def test_guard_ignora_lo_que_no_es_de_salud(self, breaker):
+        for _ in range(4):
+            with pytest.raises(ValueError):
+                async with breaker.guard(is_failure=lambda exc: not isinstance(exc, ValueError)):
+                    raise ValueError("400")
+
+        assert breaker.state == CLOSED
+
+    async def test_guard_cancelado_libera_la_prueba(self, breaker, reloj):
+        self._abrir(breaker)
+        reloj.t += 10
+
+        async def _colgada():
+            async with breaker.guard():
+                await asyncio.sleep(10)
+
+        task = asyncio.create_task(_colgada())
+        await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+        breaker.check()                 # la prueba quedó libre
@@ -0,0 +1,152 @@
+"""
+Tests del limitador AIMD. El tiempo se controla parcheando time.monotonic
+del módulo: la latencia de cada job es la que el test dice que fue.
+"""
+import asyncio
+from unittest.mock import patch
+
+import pytest
+
+from services.infrastructure import metrics
+from services.infrastructure.concurrency import (
+    CONCURRENCY_DECREASES,
+    CONCURRENCY_LIMIT,
+    AIMDLimiter,
+)
+
+
+class Reloj:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def reloj():
+    r = Reloj()
+    with patch("services.infrastructure.concurrency.time.monotonic", new=r):
+        yield r
+
+
+@pytest.fixture(autouse=True)
+def metricas_limpias():
+    metrics.reset()
+    yield
+    metrics.reset()
+
+
+def _limiter(**kwargs):
+    opts = dict(min_limit=2, max_limit=10, latency_target=1.0)
+    opts.update(kwargs)
+    return AIMDLimiter("test", **opts)
+
+
+async def _job(limiter, reloj, *, latency=0.1, fail=False):
+    async with limiter.slot() as outcome:
+        reloj.now += latency
+        if fail:
+            outcome.fail()
+
+
+class TestCrecimiento:
+
+    async def test_jobs_sanos_suben_el_limite_de_a_una_ventana(self, reloj):
+        limiter = _limiter()
+
+        await _job(limiter, reloj)
+        await _job(limiter, reloj)            # 2 + 1/2 + 1/2.5 ~ 2.9
+
+        assert limiter.limit == 2
+        await _job(limiter, reloj)
+        assert limiter.limit == 3
+
+    async def test_no_pasa_del_techo(self, reloj):
+        limiter = _limiter(max_limit=3)
+
+        for _ in range(50):
+            await _job(limiter, reloj)
+
+        assert limiter.limit == 3
+        assert CONCURRENCY_LIMIT.value(limiter="test") == 3
+
+
+class TestReduccion:
+
+    async def test_job_lento_reduce_multiplicativo(self, reloj):
+        limiter = _limiter(initial=10)
+
+        await _job(limiter, reloj, latency=5.0)
+
+        assert limiter.limit == 7
+        assert CONCURRENCY_DECREASES.value(limiter="test", reason="latency") == 1
+
+    async def test_error_absorbido_reduce(self, reloj):
+        limiter = _limiter(initial=10)
+
+        await _job(limiter, reloj, fail=True)
+
+        assert limiter.limit == 7
+        assert CONCURRENCY_DECREASES.value(limiter="test", reason="error") == 1
+
+    async def test_excepcion_cuenta_como_error_y_se_propaga(self, reloj):
+        limiter = _limiter(initial=10)
+
+        with pytest.raises(RuntimeError):
+            async with limiter.slot():
+                raise RuntimeError("Postgres caído")
+
+        assert limiter.limit == 7
+        assert limiter.in_flight == 0
+
+    async def test_una_reduccion_por_ventana(self, reloj):
+        """Los jobs que ya estaban en vuelo no hunden el límite."""
+        limiter = _limiter(initial=10)
+
+        await _job(limiter, reloj, fail=True)
+        await _job(limiter, reloj, fail=True, latency=0.0)
+
+        assert limiter.limit == 7
+
+        reloj.now += 1.0
+        await _job(limiter, reloj, fail=True, latency=0.0)
+        assert limiter.limit == 4
+
+    async def test_no_baja_del_minimo(self, reloj):
+        limiter = _limiter(initial=3)
+
+        for _ in range(5):
+            reloj.now += 10
+            await _job(limiter, reloj, fail=True)
+
+        assert limiter.limit == 2
+
+
+class TestAdmision:
+
+    async def test_espera_cuando_el_limite_esta_lleno(self):
+        limiter = _limiter(min_limit=1, max_limit=1, latency_target=10)
+        adentro = asyncio.Event()
+        soltar = asyncio.Event()
+
+        async def largo():
+            async with limiter.slot():
+                adentro.set()
+                await soltar.wait()
+
+        primero = asyncio.create_task(largo())
+        await adentro.wait()
+        segundo = asyncio.create_task(_job(limiter, Reloj(), latency=0))
+        await asyncio.sleep(0)
+
+        assert not segundo.done()
+        assert limiter.in_flight == 1
+
+        soltar.set()
+        await asyncio.gather(primero, segundo)
+        assert limiter.in_flight == 0
+
+    def test_limites_invalidos(self):
+        with pytest.raises(ValueError):
+            AIMDLimiter("x", min_limit=5, max_limit=2, latency_target=1)
@@ -0,0 +1,57 @@
+"""Tests del wrapper de lifespan de la app ASGI."""
+from unittest.mock import AsyncMock
+
+from services.infrastructure.lifespan import Lifespan
+
+
+def _canal(*mensajes):
+    entrada = [{"type": m} for m in mensajes]
+    salida = []
+
+    async def receive():
+        return entrada.pop(0)
+
+    async def send(message):
+        salida.append(message)
+
+    return receive, send, salida
+
+
+async def test_corre_los_hooks_en_orden():
+    orden = []
+
+    async def arrancar():
+        orden.append("startup")
+
+    async def apagar():
+        orden.append("shutdown")
+
+    app = Lifespan(AsyncMock(), on_startup=[arrancar], on_shutdown=[apagar])
+    receive, send, salida = _canal("lifespan.startup", "lifespan.shutdown")
+
+    await app({"type": "lifespan"}, receive, send)
+
+    assert orden == ["startup", "shutdown"]
+    assert [m["type"] for m in salida] == [
+        "lifespan.startup.complete", "lifespan.shutdown.complete",
+    ]
+    app.app.assert_not_called()
+
+
+async def test_un_hook_que_falla_corta_el_arranque():
+    app = Lifespan(AsyncMock(), on_startup=[AsyncMock(side_effect=RuntimeError("sin settings"))])
+    receive, send, salida = _canal("lifespan.startup")
+
+    await app({"type": "lifespan"}, receive, send)
+
+    assert salida == [{"type": "lifespan.startup.failed", "message": "sin settings"}]
+
+
+async def test_http_pasa_a_django():
+    django = AsyncMock()
+    app = Lifespan(django, on_startup=[AsyncMock()])
+    scope = {"type": "http"}
+
+    await app(scope, "receive", "send")
+
+    django.assert_awaited_once_with(scope, "receive", "send")
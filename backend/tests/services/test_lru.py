@@ -0,0 +1,44 @@
+"""
+Tests del cache LRU con vencimiento: desalojo por tamaño y por tiempo.
+"""
+from services.infrastructure.lru import TTLCache
+
+
+class Reloj:
+    def __init__(self):
+        self.t = 0.0
+
+    def __call__(self):
+        return self.t
+
+
+class TestTTLCache:
+
+    def test_desaloja_el_menos_usado(self):
+        cache = TTLCache(2, 60)
+        cache.set("a")
+        cache.set("b")
+        assert "a" in cache             # "a" pasa a ser el más reciente
+
+        cache.set("c")
+
+        assert "a" in cache
+        assert "b" not in cache
+        assert len(cache) == 2
+
+    def test_vence(self):
+        reloj = Reloj()
+        cache = TTLCache(10, 60, clock=reloj)
+        cache.set("a", 1)
+        cache.set("b", 2, ttl=120)
+
+        reloj.t = 61
+
+        assert cache.get("a") is None
+        assert cache.get("b") == 2
+
+    def test_tamaño_cero_no_guarda(self):
+        cache = TTLCache(0, 60)
+        cache.set("a")
+
+        assert "a" not in cache
@@ -0,0 +1,141 @@
+"""
+Tests del registro de métricas en proceso: el formato de texto de
+Prometheus que consume el scraper y los dos lugares que lo sirven.
+"""
+import asyncio
+
+import pytest
+
+from services.infrastructure import metrics
+
+
+@pytest.fixture(autouse=True)
+def metricas_limpias():
+    metrics.reset()
+    yield
+    metrics.reset()
+
+
+class TestRegistro:
+
+    def test_declarar_dos_veces_devuelve_la_misma_instancia(self):
+        a = metrics.counter("test_dup_total", "x", labelnames=("channel",))
+        b = metrics.counter("test_dup_total", "x", labelnames=("channel",))
+        assert a is b
+
+    def test_mismo_nombre_con_otra_forma_explota(self):
+        metrics.counter("test_forma_total", "x")
+        with pytest.raises(ValueError):
+            metrics.gauge("test_forma_total", "x")
+
+    def test_labels_distintos_a_los_declarados_explotan(self):
+        c = metrics.counter("test_labels_total", "x", labelnames=("channel",))
+        with pytest.raises(ValueError):
+            c.inc(canal="telegram")
+
+
+class TestValores:
+
+    def test_counter_acumula_por_label(self):
+        c = metrics.counter("test_acumula_total", "x", labelnames=("channel",))
+        c.inc(channel="telegram")
+        c.inc(2, channel="telegram")
+        c.inc(channel="whatsapp")
+
+        assert c.value(channel="telegram") == 3
+        assert c.value(channel="whatsapp") == 1
+
+    def test_counter_no_decrementa(self):
+        c = metrics.counter("test_negativo_total", "x")
+        with pytest.raises(ValueError):
+            c.inc(-1)
+
+    def test_histograma_cuenta_y_suma(self):
+        h = metrics.histogram("test_hist_seconds", "x", buckets=(0.1, 1))
+        h.observe(0.05)
+        h.observe(0.5)
+
+        assert h.count() == 2
+        assert h.sum() == pytest.approx(0.55)
+
+    def test_time_observa_aunque_el_bloque_falle(self):
+        h = metrics.histogram("test_time_seconds", "x", labelnames=("stage",))
+
+        with pytest.raises(RuntimeError):
+            with h.time(stage="dispatch"):
+                raise RuntimeError
+
+        assert h.count(stage="dispatch") == 1
+
+
+class TestRender:
+
+    def test_formato_de_texto_de_prometheus(self):
+        c = metrics.counter("test_render_total", "Cosas contadas", labelnames=("channel",))
+        c.inc(channel="telegram")
+
+        texto = metrics.render()
+
+        assert "# HELP test_render_total Cosas contadas" in texto
+        assert "# TYPE test_render_total counter" in texto
+        assert 'test_render_total{channel="telegram"} 1' in texto
+
+    def test_buckets_acumulativos(self):
+        h = metrics.histogram("test_buckets_seconds", "x", buckets=(0.1, 1))
+        h.observe(0.05)
+        h.observe(0.5)
+        h.observe(5)
+
+        texto = metrics.render()
+
+        assert 'test_buckets_seconds_bucket{le="0.1"} 1' in texto
+        assert 'test_buckets_seconds_bucket{le="1"} 2' in texto
+        assert 'test_buckets_seconds_bucket{le="+Inf"} 3' in texto
+        assert "test_buckets_seconds_count 3" in texto
+
+    def test_escapa_comillas_en_labels(self):
+        c = metrics.counter("test_escape_total", "x", labelnames=("handler",))
+        c.inc(handler='a"b')
+
+        assert 'test_escape_total{handler="a\\"b"} 1' in metrics.render()
+
+
+class TestExporter:
+
+    async def test_el_worker_sirve_el_texto_por_http(self):
+        metrics.counter("test_scrape_total", "x").inc()
+        server = await metrics.serve("127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(b"GET /metrics HTTP/1.1\r\nHost: localhost\r\n\r\n")
+            respuesta = (await reader.read()).decode()
+            writer.close()
+        finally:
+            server.close()
+            await server.wait_closed()
+
+        assert respuesta.startswith("HTTP/1.1 200 OK")
+        assert "text/plain; version=0.0.4" in respuesta
+        assert "test_scrape_total 1" in respuesta
+
+
+class TestEndpointWeb:
+
+    def test_sin_token_configurado_no_existe(self, client, settings):
+        settings.METRICS_TOKEN = ""
+        assert client.get("/metrics/").status_code == 404
+
+    def test_token_incorrecto_no_existe(self, client, settings):
+        settings.METRICS_TOKEN = "secreto"
+        respuesta = client.get("/metrics/", HTTP_AUTHORIZATION="Bearer otro")
+        assert respuesta.status_code == 404
+
+    def test_con_token_renderiza(self, client, settings):
+        settings.METRICS_TOKEN = "secreto"
+        metrics.counter("test_web_total", "x").inc()
+
+        respuesta = client.get("/metrics/", HTTP_AUTHORIZATION="Bearer secreto")
+
+        assert respuesta.status_code == 200
+        assert b"test_web_total 1" in respuesta.content
@@ -0,0 +1,170 @@
+"""
+Tests del outbox de respuestas: reclamo, entrega, relay y la detección
+de un evento ya procesado.
+"""
+from datetime import timedelta
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from asgiref.sync import sync_to_async
+from django.utils import timezone
+
+from apps.core.models import OutboxMessage
+from services import outbox
+from services.channels.senders import Option
+from services.infrastructure import metrics
+from tests.bot.conftest import FakeSender
+from tests.factories import UserFactory
+
+pytestmark = pytest.mark.django_db(transaction=True)
+
+
+@pytest.fixture(autouse=True)
+def metricas_limpias():
+    metrics.reset()
+    yield
+    metrics.reset()
+
+
+@pytest.fixture
+def sender():
+    return FakeSender()
+
+
+async def _fila(**kwargs):
+    datos = dict(
+        event_key="test:1",
+        channel="test",
+        conversation_id="42",
+        text="Gasto guardado",
+        options=[[Option("del:1", "Eliminar")]],
+    )
+    datos.update(kwargs)
+    return await sync_to_async(outbox._add_reply_sync)(**datos)
+
+
+class TestDeliver:
+
+    async def test_envia_y_marca(self, sender):
+        fila = await _fila()
+
+        assert await outbox.deliver(fila, sender) is True
+
+        assert sender.last_reply["text"] == "Gasto guardado"
+        assert sender.callback_ids(sender.last_reply) == ["del:1"]
+        fila = await OutboxMessage.objects.aget(id=fila.id)
+        assert fila.sent_at is not None
+        assert fila.attempts == 1
+        assert outbox.OUTBOX_SENT.value(channel="test", path="inline") == 1
+
+    async def test_una_fila_enviada_no_se_reenvia(self, sender):
+        fila = await _fila()
+        await outbox.deliver(fila, sender)
+
+        assert await outbox.deliver(fila, sender) is False
+        assert len(sender.replies) == 1
+
+    async def test_fallo_libera_la_fila_con_backoff(self, sender):
+        fila = await _fila()
+        sender.reply = AsyncMock(side_effect=ConnectionError("Telegram caído"))
+
+        assert await outbox.deliver(fila, sender) is False
+
+        fila = await OutboxMessage.objects.aget(id=fila.id)
+        assert fila.sent_at is None
+        assert fila.claim is None
+        assert fila.locked_until > timezone.now()
+        assert "Telegram caído" in fila.last_error
+        assert outbox.OUTBOX_FAILURES.value(channel="test") == 1
+
+    async def test_respeta_el_retry_after_del_canal(self, sender):
+        from services.channels.senders import RetryHint
+
+        fila = await _fila()
+        sender.reply = AsyncMock(side_effect=ConnectionError("429"))
+        sender.retry_hint = lambda exc: RetryHint(retry_after=120)
+
+        await outbox.deliver(fila, sender)
+
+        fila = await OutboxMessage.objects.aget(id=fila.id)
+        assert fila.locked_until > timezone.now() + timedelta(seconds=100)
+
+    async def test_circuito_abierto_no_gasta_intentos(self, sender):
+        from services.infrastructure.circuit import CircuitOpen
+
+        fila = await _fila()
+        sender.reply = AsyncMock(side_effect=CircuitOpen("sender:test", 20))
+        sender.retry_hint = lambda exc: None
+
+        await outbox.deliver(fila, sender)
+
+        fila = await OutboxMessage.objects.aget(id=fila.id)
+        assert fila.attempts == 0
+        assert fila.locked_until > timezone.now()
+
+    async def test_usa_deliver_del_sender_si_lo_tiene(self, sender):
+        """ThrottledSender.deliver espera la confirmación; reply solo encola."""
+        sender.deliver = AsyncMock(return_value="7")
+        fila = await _fila()
+
+        await outbox.deliver(fila, sender)
+
+        sender.deliver.assert_awaited_once()
+        assert sender.replies == []
+
+
+class TestRelay:
+
+    async def test_entrega_lo_pendiente_en_orden(self, sender):
+        await _fila(event_key="test:1", text="uno")
+        await _fila(event_key="test:2", text="dos")
+
+        with patch("services.outbox.get_sender", return_value=sender):
+            assert await outbox.relay() == 2
+
+        assert [r["text"] for r in sender.replies] == ["uno", "dos"]
+        assert outbox.OUTBOX_SENT.value(channel="test", path="relay") == 2
+
+    async def test_saltea_las_reclamadas_o_en_backoff(self, sender):
+        futuro = timezone.now() + timedelta(minutes=1)
+        reclamada = await _fila(event_key="test:1")
+        await OutboxMessage.objects.filter(id=reclamada.id).aupdate(locked_until=futuro)
+
+        with patch("services.outbox.get_sender", return_value=sender):
+            assert await outbox.relay() == 0
+
+    async def test_retoma_un_reclamo_vencido(self, sender):
+        fila = await _fila()
+        pasado = timezone.now() - timedelta(seconds=1)
+        await OutboxMessage.objects.filter(id=fila.id).aupdate(locked_until=pasado)
+
+        with patch("services.outbox.get_sender", return_value=sender):
+            assert await outbox.relay() == 1
+
+    async def test_abandona_tras_agotar_los_intentos(self, sender):
+        fila = await _fila()
+        await OutboxMessage.objects.filter(id=fila.id).aupdate(attempts=outbox.MAX_ATTEMPTS)
+
+        with patch("services.outbox.get_sender", return_value=sender):
+            assert await outbox.relay() == 0
+
+
+class TestTransaccion:
+
+    async def test_gasto_y_respuesta_se_commitean_juntos(self):
+        from services.expenses import create_expense_with_reply
+        from apps.core.models import Expense
+
+        user = await sync_to_async(UserFactory)()
+
+        def _render(expense):
+            raise RuntimeError("Falló el render")
+
+        with pytest.raises(RuntimeError):
+            await create_expense_with_reply(
+                user, amount=100, description="café", render=_render,
+                event_key="test:9", channel="test", conversation_id="42",
+            )
+
+        assert await Expense.objects.acount() == 0
+        assert await OutboxMessage.objects.acount() == 0
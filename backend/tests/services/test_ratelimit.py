@@ -0,0 +1,100 @@
+"""
+TokenBucket del lado Python: claves, lectura del resultado del script y
+carga del script. Al final, TAKE_SCRIPT contra un Redis de verdad (se
+saltea sin servidor).
+"""
+import asyncio
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from redis.exceptions import NoScriptError
+
+from services.infrastructure import ratelimit
+from services.infrastructure.ratelimit import ALLOWED, TAKE_SCRIPT, Decision, TokenBucket
+
+
+@pytest.fixture
+def redis():
+    fake = AsyncMock()
+    fake.evalsha.return_value = [1, 0, 0]
+
+    async def _get_redis(purpose="jobs"):
+        fake.purpose = purpose
+        return fake
+
+    with patch.object(ratelimit, "get_redis", new=_get_redis):
+        yield fake
+
+
+async def test_una_llamada_al_script_con_balde_y_aviso(redis):
+    decision = await TokenBucket("ratelimit").take("telegram:111", rate=0.5, burst=20)
+
+    assert decision is ALLOWED
+    assert redis.purpose == "cache"
+    redis.evalsha.assert_awaited_once_with(
+        ratelimit._SHA, 2, "ratelimit:telegram:111", "ratelimit:notice:telegram:111", 0.5, 20
+    )
+
+
+async def test_limitado_con_espera_y_aviso(redis):
+    redis.evalsha.return_value = [0, 1500, 1]
+
+    decision = await TokenBucket("ratelimit").take("telegram:111", rate=0.5, burst=20)
+
+    assert decision == Decision(allowed=False, retry_after=1.5, notify=True)
+
+
+async def test_limitado_ya_avisado(redis):
+    redis.evalsha.return_value = [b"0", b"200", b"0"]
+
+    decision = await TokenBucket("ratelimit").take("telegram:111", rate=0.5, burst=20)
+
+    assert decision == Decision(allowed=False, retry_after=0.2, notify=False)
+
+
+async def test_carga_el_script_si_el_servidor_no_lo_tiene(redis):
+    redis.evalsha.side_effect = NoScriptError("NOSCRIPT")
+    redis.eval.return_value = [1, 0, 0]
+
+    assert (await TokenBucket("ratelimit").take("k", rate=1, burst=1)).allowed
+    assert redis.eval.await_args.args[0] == TAKE_SCRIPT
+
+
+async def test_los_errores_de_redis_suben(redis):
+    redis.evalsha.side_effect = ConnectionError("Redis caído")
+
+    with pytest.raises(ConnectionError):
+        await TokenBucket("ratelimit").take("k", rate=1, burst=1)
+
+
+class TestScript:
+
+    async def test_gasta_la_rafaga_y_avisa_una_vez(self, redis_real):
+        bucket = TokenBucket("ratelimit")
+
+        for _ in range(3):
+            assert (await bucket.take("telegram:111", rate=0.5, burst=3)).allowed
+        primera = await bucket.take("telegram:111", rate=0.5, burst=3)
+        segunda = await bucket.take("telegram:111", rate=0.5, burst=3)
+
+        assert not primera.allowed and primera.notify
+        assert 0 < primera.retry_after <= 2.0          # 1 ficha a 0.5/s
+        assert not segunda.allowed and not segunda.notify
+        cache = redis_real["cache"]
+        assert 0 < await cache.ttl("ratelimit:telegram:111") <= 7       # ceil(3 / 0.5) + 1
+        assert 0 < await cache.pttl("ratelimit:notice:telegram:111") <= 6000
+
+    async def test_se_rellena_con_el_tiempo(self, redis_real):
+        bucket = TokenBucket("ratelimit")
+        await bucket.take("k", rate=100, burst=1)
+        assert not (await bucket.take("k", rate=100, burst=1)).allowed
+
+        await asyncio.sleep(0.05)                       # 5 fichas a 100/s, tope 1
+
+        assert (await bucket.take("k", rate=100, burst=1)).allowed
+
+    async def test_claves_separadas(self, redis_real):
+        bucket = TokenBucket("ratelimit")
+        await bucket.take("telegram:111", rate=0.5, burst=1)
+
+        assert (await bucket.take("telegram:222", rate=0.5, burst=1)).allowed
@@ -0,0 +1,67 @@
+"""
+Tests de redis_client.guarded: timeout por llamada y un breaker por
+purpose. Sin Redis: el bloque protegido simula la llamada.
+"""
+import asyncio
+
+import pytest
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+from services.infrastructure import metrics
+from services.infrastructure.circuit import CIRCUIT_TRANSITIONS, CLOSED, OPEN, CircuitOpen
+from services.infrastructure.redis_client import breaker_for, guarded
+
+
+@pytest.fixture(autouse=True)
+def limpio():
+    metrics.reset()
+
+
+async def _falla(purpose, exc):
+    with pytest.raises(type(exc)):
+        async with guarded(purpose):
+            raise exc
+
+
+class TestGuarded:
+
+    async def test_pasa_el_resultado(self):
+        async with guarded("cache"):
+            valor = 42
+
+        assert valor == 42
+        assert breaker_for("cache").state == CLOSED
+
+    async def test_corta_la_llamada_lenta(self, settings):
+        settings.REDIS_CALL_TIMEOUT = 0.01
+
+        with pytest.raises(TimeoutError):
+            async with guarded("cache"):
+                await asyncio.sleep(10)
+
+    async def test_abre_con_errores_de_redis(self):
+        for _ in range(breaker_for("cache").min_calls):
+            await _falla("cache", RedisConnectionError("refused"))
+
+        with pytest.raises(CircuitOpen):
+            async with guarded("cache"):
+                pytest.fail("con el circuito abierto no se llama")
+
+        assert breaker_for("cache").state == OPEN
+        assert CIRCUIT_TRANSITIONS.value(circuit="redis:cache", state=OPEN) == 1
+
+    async def test_un_purpose_no_corta_a_otro(self):
+        for _ in range(breaker_for("cache").min_calls):
+            await _falla("cache", RedisConnectionError("refused"))
+
+        assert breaker_for("state").state == CLOSED
+
+    async def test_un_bug_del_que_llama_no_cuenta(self):
+        for _ in range(breaker_for("cache").min_calls):
+            await _falla("cache", KeyError("bug"))
+
+        assert breaker_for("cache").state == CLOSED
+
+    def test_purpose_desconocido(self):
+        with pytest.raises(ValueError):
+            breaker_for("nope")
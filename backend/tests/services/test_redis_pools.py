@@ -0,0 +1,105 @@
+"""
+Tests del registro de pools de redis_client: uno por loop y por database,
+con reaper de conexiones ociosas. Sin Redis: crear un pool no abre
+conexiones.
+"""
+import asyncio
+import time
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from services.infrastructure import metrics, redis_client
+from services.infrastructure.redis_client import close_all, database_for, get_redis, reap_idle
+
+
+@pytest.fixture(autouse=True)
+def limpio():
+    metrics.reset()
+
+
+def _conexion(ociosa_desde: float):
+    conexion = MagicMock()
+    conexion.released_at = ociosa_desde
+    conexion.disconnect = AsyncMock()
+    return conexion
+
+
+class TestRegistro:
+
+    async def test_mismo_loop_mismo_pool(self):
+        assert await get_redis("state") is await get_redis("state")
+
+    async def test_una_database_por_purpose(self):
+        assert await get_redis("state") is not await get_redis("cache")
+        assert (await get_redis("cache")).connection_pool.connection_kwargs["db"] == 2
+
+    async def test_db_compartida_un_solo_pool(self, settings):
+        settings.REDIS_SHARED_DB = True
+        settings.REDIS_URL = "redis://localhost:6379/5"
+
+        assert {database_for(p) for p in ("jobs", "state", "cache")} == {5}
+        assert await get_redis("jobs") is await get_redis("cache")
+
+    def test_cada_loop_tiene_sus_pools(self):
+        """Una conexión abierta en un loop no sirve en otro."""
+        primero = asyncio.run(get_redis("state"))
+        segundo = asyncio.run(get_redis("state"))
+
+        assert primero is not segundo
+
+    async def test_tamano_y_health_check(self, settings):
+        settings.REDIS_MAX_CONNECTIONS = 7
+        settings.REDIS_POOL_TIMEOUT = 0.25
+        settings.REDIS_HEALTH_CHECK_INTERVAL = 15
+
+        pool = (await get_redis("jobs")).connection_pool
+
+        assert (pool.max_connections, pool.timeout) == (7, 0.25)
+        assert pool.connection_kwargs["health_check_interval"] == 15
+
+    async def test_close_all_suelta_los_pools_del_loop(self):
+        redis = await get_redis("jobs")
+        redis.connection_pool.disconnect = AsyncMock()
+
+        await close_all()
+
+        redis.connection_pool.disconnect.assert_awaited_once()
+        assert await get_redis("jobs") is not redis
+
+
+class TestReaper:
+
+    async def test_cierra_solo_las_ociosas(self, settings):
+        settings.REDIS_IDLE_TIMEOUT = 60
+        pool = (await get_redis("state")).connection_pool
+        vieja, nueva = _conexion(time.monotonic() - 120), _conexion(time.monotonic())
+        pool._available_connections = [vieja, nueva]
+
+        assert await reap_idle() == 1
+
+        vieja.disconnect.assert_awaited_once()
+        nueva.disconnect.assert_not_awaited()
+        assert pool._available_connections == [nueva]
+        assert redis_client.POOL_REAPED.value(db="1") == 1
+        assert redis_client.POOL_CONNECTIONS.value(db="1", state="idle") == 1
+
+    async def test_no_toca_las_que_estan_en_uso(self, settings):
+        settings.REDIS_IDLE_TIMEOUT = 60
+        pool = (await get_redis("state")).connection_pool
+        en_uso = _conexion(time.monotonic() - 120)
+        pool._in_use_connections = {en_uso}
+
+        assert await reap_idle() == 0
+        en_uso.disconnect.assert_not_awaited()
+        assert redis_client.POOL_CONNECTIONS.value(db="1", state="in_use") == 1
+
+    async def test_release_marca_la_hora(self):
+        pool = (await get_redis("state")).connection_pool
+        conexion = MagicMock()
+        pool._in_use_connections = {conexion}
+
+        await pool.release(conexion)
+
+        assert conexion.released_at == pytest.approx(time.monotonic(), abs=1)
+        assert pool._available_connections == [conexion]